@@ -1,9 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 from services.llm_analysis import LLMAnalysisService
-from services.anomaly_detection import AnomalyDetectionService
+from services.anomaly_detection import anomaly_detectors
 from services.metrics_service import MetricsService
+from services.persistence import DEFAULT_INFRA
 from models.analysis import AnalysisResult
-from db import get_async_session
+from db import get_async_read_session
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import logging
@@ -11,18 +12,27 @@ import os
 
 router = APIRouter()
 llm_service = LLMAnalysisService()
-anomaly_service = AnomalyDetectionService()
 metrics_service = MetricsService()
 logger = logging.getLogger(__name__)
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
 
 @router.get("/analysis", response_model=AnalysisResult)
-async def get_analysis(session: AsyncSession = Depends(get_async_session)):
+async def get_analysis(
+    infra: str = Query(DEFAULT_INFRA, description="Infrastructure name", min_length=1, max_length=255),
+    session: AsyncSession = Depends(get_async_read_session)
+):
     if DEBUG:
-        logger.debug("Analysis endpoint called")
+        logger.debug(f"Analysis endpoint called for infrastructure '{infra}'")
+    
+    infra_id = await metrics_service.get_infra_id(session, infra)
+    if infra_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown infrastructure '{infra}'"
+        )
     
-    latest_metrics = await metrics_service.get_latest_metrics(session)
+    latest_metrics = await metrics_service.get_latest_metrics(session, infra_id)
     if latest_metrics is None:
         if DEBUG:
             logger.debug("No metrics available for analysis")
@@ -34,9 +44,10 @@ async def get_analysis(session: AsyncSession = Depends(get_async_session)):
     try:
         logger.info("Starting comprehensive analysis")
         
-        anomaly_result = anomaly_service.detect_anomalies(latest_metrics)
+        infra_anomaly_service = anomaly_detectors.get(infra_id)
+        anomaly_result = infra_anomaly_service.detect_anomalies(latest_metrics)
         
-        history_summary = anomaly_service.get_history_summary()
+        history_summary = infra_anomaly_service.get_history_summary()
         
         if DEBUG:
             logger.debug(f"Anomaly detection found {anomaly_result.total_count} anomalies")
@@ -70,13 +81,21 @@ async def get_analysis(session: AsyncSession = Depends(get_async_session)):
 @router.get("/analysis/historical", response_model=AnalysisResult)
 async def get_historical_analysis(
     points: Optional[int] = Query(50, description="Number of historical points to analyze", ge=10, le=200),
-    session: AsyncSession = Depends(get_async_session)
+    infra: str = Query(DEFAULT_INFRA, description="Infrastructure name", min_length=1, max_length=255),
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     if DEBUG:
         logger.debug(f"Historical analysis endpoint called with {points} points")
     
     try:
-        historical_metrics = await metrics_service.get_historical_metrics(session, points)
+        infra_id = await metrics_service.get_infra_id(session, infra)
+        if infra_id is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Unknown infrastructure '{infra}'"
+            )
+        
+        historical_metrics = await metrics_service.get_historical_metrics(session, infra_id, points)
         
         if len(historical_metrics) < 10:
             raise HTTPException(
@@ -86,7 +105,7 @@ async def get_historical_analysis(
         
         logger.info(f"Starting historical analysis with {len(historical_metrics)} points")
         
-        analysis_result = llm_service.analyze_historical_data(historical_metrics, anomaly_service)
+        analysis_result = llm_service.analyze_historical_data(historical_metrics, anomaly_detectors.get(infra_id))
         
         logger.info(f"Historical analysis completed with {len(analysis_result.recommendations)} recommendations")
         
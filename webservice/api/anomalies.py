@@ -1,51 +1,85 @@
-from fastapi import APIRouter, HTTPException, Depends
-from services.anomaly_detection import AnomalyDetectionService
+from fastapi import APIRouter, HTTPException, Depends, Query
+from services.anomaly_detection import anomaly_detectors
 from services.metrics_service import MetricsService
+from services.persistence import DEFAULT_INFRA
+from services.response_cache import response_cache
 from models.anomaly import AnomalyResult
-from db import get_async_session
+from db import get_async_read_session
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 import os
 
 router = APIRouter()
-anomaly_service = AnomalyDetectionService()
 metrics_service = MetricsService()
 logger = logging.getLogger(__name__)
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
 
 @router.get("/anomalies", response_model=AnomalyResult)
-async def get_anomalies(session: AsyncSession = Depends(get_async_session)):
+async def get_anomalies(
+    infra: str = Query(DEFAULT_INFRA, description="Infrastructure name", min_length=1, max_length=255),
+    session: AsyncSession = Depends(get_async_read_session)
+):
     if DEBUG:
-        logger.debug("Anomalies endpoint called")
+        logger.debug(f"Anomalies endpoint called for infrastructure '{infra}'")
     
-    latest_metrics = await metrics_service.get_latest_metrics(session)
-    if latest_metrics is None:
-        if DEBUG:
-            logger.debug("No metrics available for anomaly detection")
+    infra_id = await metrics_service.get_infra_id(session, infra)
+    if infra_id is None:
         raise HTTPException(
             status_code=404,
-            detail="No metrics available. Please ingest metrics first using POST /api/ingest"
+            detail=f"Unknown infrastructure '{infra}'"
         )
     
-    logger.info("Analyzing metrics for anomalies")
-    result = anomaly_service.detect_anomalies(latest_metrics)
-    
-    if DEBUG:
-        logger.debug(f"Anomaly detection result: {result.summary}")
-        for anomaly in result.anomalies:
-            logger.debug(f"Anomaly: {anomaly.metric} = {anomaly.value} (severity {anomaly.severity})")
+    async def detect():
+        latest_metrics = await metrics_service.get_latest_metrics(session, infra_id)
+        if latest_metrics is None:
+            if DEBUG:
+                logger.debug("No metrics available for anomaly detection")
+            raise HTTPException(
+                status_code=404,
+                detail="No metrics available. Please ingest metrics first using POST /api/ingest"
+            )
+        
+        logger.info(f"Analyzing metrics for anomalies on infrastructure '{infra}'")
+        result = anomaly_detectors.get(infra_id).detect_anomalies(latest_metrics)
+        
+        if DEBUG:
+            logger.debug(f"Anomaly detection result: {result.summary}")
+            for anomaly in result.anomalies:
+                logger.debug(f"Anomaly: {anomaly.metric} = {anomaly.value} (severity {anomaly.severity})")
+        
+        logger.info(f"Anomaly detection completed: {result.summary}")
+        return result
     
-    logger.info(f"Anomaly detection completed: {result.summary}")
-    return result
+    # polling without new points neither recomputes nor appends the same point to the
+    # relative threshold history again
+    return await response_cache.get_or_compute("anomalies", infra_id, {"infra": infra}, detect)
 
 
 @router.get("/anomalies/history")
-async def get_anomaly_history():
+async def get_anomaly_history(
+    infra: str = Query(DEFAULT_INFRA, description="Infrastructure name", min_length=1, max_length=255),
+    session: AsyncSession = Depends(get_async_read_session)
+):
     if DEBUG:
         logger.debug("Anomaly history endpoint called")
     
-    history = anomaly_service.get_history_summary()
+    infra_id = await metrics_service.get_infra_id(session, infra)
+    if infra_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown infrastructure '{infra}'"
+        )
+    
+    service = anomaly_detectors.get(infra_id)
+    
+    async def summarize():
+        return service.get_history_summary()
+    
+    # the summary only changes when /anomalies updates the history, not on ingestion
+    history = await response_cache.get_or_compute(
+        "anomalies_history", None, {"infra": infra, "revision": service.revision}, summarize
+    )
     
     if DEBUG:
         logger.debug(f"History summary: {history}")
@@ -1,10 +1,13 @@
 from fastapi import APIRouter
 from models.metrics import ApiResponse
+from db import engine, SQLITE_PROFILE, WAL_ENABLED, DB_READ_POOL_SIZE
+from services.wal_checkpoint import WalCheckpointer
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
+wal_checkpointer = WalCheckpointer(engine)
 
 
 @router.get("/health", response_model=ApiResponse)
@@ -18,4 +21,16 @@ async def health_check():
             "timestamp": datetime.now().isoformat(),
             "version": "0.1.0"
         }
-    ) 
\ No newline at end of file
+    ) 
+
+@router.get("/health/storage")
+async def storage_health():
+    return {
+        "status": "success",
+        "data": {
+            "profile": SQLITE_PROFILE,
+            "wal": WAL_ENABLED,
+            "read_pool_size": DB_READ_POOL_SIZE if WAL_ENABLED else None,
+            "checkpoints": wal_checkpointer.get_stats()
+        }
+    }
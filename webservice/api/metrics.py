@@ -1,60 +1,83 @@
-from fastapi import APIRouter, status, Request, Depends, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, status, Request, Depends, Query, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from services.validation import ValidationService
-from services.persistence import PersistenceService
+from services.persistence import PersistenceService, DEFAULT_INFRA, INFRA_NAME_PATTERN, INFRA_NAME_MAX_LENGTH
+from services.metrics_service import MetricsService
+from services.aggregation import AggregationService, AGGREGATE_MAX_BUCKETS, parse_functions, parse_percentiles
+from services.correlation import CorrelationService, MODE_PATTERN
+from services.moments import CORRELATION_METRICS
+from services.rollups import ROLLUPS_ENABLED, ROLLUP_METRICS
+from services.cold_storage import cold_storage
+from services.hot_window import hot_window
+from services.time_utils import parse_timestamp_ms, parse_duration_ms, format_timestamp_ms
+from services.row_merge import next_cursor, encode_cursor, decode_cursor
+from services.metrics_projection import parse_fields
+from services.metrics_counters import metrics_counters
+from services.response_cache import response_cache
+from services import history_formats
+from services.ingestion_queue import IngestionQueue, IngestionQueueFull
+from services.ingestion_spool import IngestionSpool
+from services.stream_ingestion import StreamIngestionService
+from services.decompression import (
+    iter_decoded_body, read_decoded_body, check_encoding,
+    BodyDecodingError, UnsupportedContentEncoding, DecompressedSizeExceeded
+)
 from models.metrics import InfrastructureMetrics
 from models.validation import ValidationResult
-from db import get_async_session
+from db import get_async_session, get_async_read_session, AsyncReadSessionLocal
 from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 import time
 import os
+import json
+import anyio
+from pydantic_core import from_json
 from typing import List, Dict, Any, Optional
-from sqlalchemy.future import select
-from sqlalchemy import func, desc
-from models.sql import Metrics
 
 router = APIRouter()
 validation_service = ValidationService()
 persistence_service = PersistenceService()
+ingestion_queue = IngestionQueue(persistence_service)
+ingestion_spool = IngestionSpool(persistence_service)
+stream_ingestion_service = StreamIngestionService(persistence_service)
+metrics_service = MetricsService()
+aggregation_service = AggregationService(metrics_service)
+correlation_service = CorrelationService(metrics_service)
+rollup_service = persistence_service.rollup_service
 logger = logging.getLogger(__name__)
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+INGEST_MODE = os.getenv("INGEST_MODE", "sync").lower()
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+INFRA_QUERY = Query(DEFAULT_INFRA, description="Infrastructure name", min_length=1, max_length=255)
+INGEST_INFRA_QUERY = Query(
+    DEFAULT_INFRA,
+    description="Infrastructure name, registered on first ingest unless INFRA_AUTO_REGISTER=false",
+    min_length=1,
+    max_length=INFRA_NAME_MAX_LENGTH,
+    pattern=INFRA_NAME_PATTERN
+)
+HISTORY_STREAM_BATCH_SIZE = int(os.getenv("HISTORY_STREAM_BATCH_SIZE", "1000"))
+HISTORY_STREAM_LINES_PER_WRITE = 256
 
 latest_metrics = None
 
-async def get_latest_metrics_from_db(session: AsyncSession):
-    try:
-        result = await session.execute(
-            select(Metrics).order_by(desc(Metrics.timestamp)).limit(1)
-        )
-        metric = result.scalar_one_or_none()
-        
-        if metric:
-            return {
-                "timestamp": metric.timestamp,
-                "cpu_usage": metric.cpu_usage,
-                "memory_usage": metric.memory_usage,
-                "latency_ms": metric.latency_ms,
-                "disk_usage": metric.disk_usage,
-                "network_in_kbps": metric.network_in_kbps,
-                "network_out_kbps": metric.network_out_kbps,
-                "io_wait": metric.io_wait,
-                "thread_count": metric.thread_count,
-                "active_connections": metric.active_connections,
-                "error_rate": metric.error_rate,
-                "uptime_seconds": metric.uptime_seconds,
-                "temperature_celsius": metric.temperature_celsius,
-                "power_consumption_watts": metric.power_consumption_watts,
-                "service_status": {
-                    "database": metric.service_status_database,
-                    "api_gateway": metric.service_status_api_gateway,
-                    "cache": metric.service_status_cache
-                }
-            }
-        return None
-    except Exception as e:
-        logger.error(f"Error getting latest metrics from DB: {str(e)}")
+
+class NDJSONIngestResponse(StreamingResponse):
+    """Streams per-chunk results while the request body is still being read.
+
+    The default disconnect listener consumes ``receive`` messages and would
+    swallow the request body, disconnects surface in ``request.stream()`` instead.
+    """
+
+    async def listen_for_disconnect(self, receive):
+        await anyio.sleep_forever()
+
+
+async def get_latest_metrics_from_db(session: AsyncSession, infra: str = DEFAULT_INFRA):
+    infra_id = await metrics_service.get_infra_id(session, infra)
+    if infra_id is None:
         return None
+    return await metrics_service.get_latest_metrics(session, infra_id)
 
 def get_latest_metrics():
     return latest_metrics
@@ -68,104 +91,610 @@ async def get_history(
     limit: Optional[int] = Query(100, description="Number of points to retrieve", ge=1, le=1000),
     start_time: Optional[str] = Query(None, description="Start time filter (ISO format)"),
     end_time: Optional[str] = Query(None, description="End time filter (ISO format)"),
-    session: AsyncSession = Depends(get_async_session)
+    resolution: str = Query("auto", description="raw, 1m, 1h, 1d or auto (coarser resolutions once the range exceeds limit)", pattern="^(auto|raw|1m|1h|1d)$"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page (raw points only)"),
+    stream: bool = Query(False, description="Stream every raw point of the range as NDJSON, limit is ignored"),
+    fields: Optional[str] = Query(None, description="Comma separated fields to return (e.g. cpu_usage,memory_usage), all by default"),
+    output_format: Optional[str] = Query(None, alias="format", description="json, columnar, msgpack or arrow (overrides the Accept header)", pattern=history_formats.FORMAT_PATTERN),
+    accept: Optional[str] = Header(None),
+    infra: str = INFRA_QUERY,
+    session: AsyncSession = Depends(get_async_read_session)
 ):
     try:
-        query = select(Metrics).order_by(desc(Metrics.timestamp))
+        infra_id = await metrics_service.get_infra_id(session, infra)
+        if infra_id is None:
+            return _unknown_infra_response(infra)
         
-        if start_time:
-            query = query.where(Metrics.timestamp >= start_time)
-        if end_time:
-            query = query.where(Metrics.timestamp <= end_time)
+        try:
+            start_ms = parse_timestamp_ms(start_time) if start_time else None
+            end_ms = parse_timestamp_ms(end_time) if end_time else None
+        except ValueError:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": "start_time and end_time must be ISO 8601 datetimes"
+                }
+            )
         
-        query = query.limit(limit)
+        try:
+            projection = parse_fields(fields)
+        except ValueError as e:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": str(e)
+                }
+            )
         
-        result = await session.execute(query)
-        metrics = result.scalars().all()
+        try:
+            before = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": "Invalid cursor"
+                }
+            )
         
-        history_data = []
-        for metric in metrics:
-            history_data.append({
-                "id": metric.id,
-                "timestamp": metric.timestamp,
-                "cpu_usage": metric.cpu_usage,
-                "memory_usage": metric.memory_usage,
-                "latency_ms": metric.latency_ms,
-                "disk_usage": metric.disk_usage,
-                "network_in_kbps": metric.network_in_kbps,
-                "network_out_kbps": metric.network_out_kbps,
-                "io_wait": metric.io_wait,
-                "thread_count": metric.thread_count,
-                "active_connections": metric.active_connections,
-                "error_rate": metric.error_rate,
-                "uptime_seconds": metric.uptime_seconds,
-                "temperature_celsius": metric.temperature_celsius,
-                "power_consumption_watts": metric.power_consumption_watts,
-                "service_status": {
-                    "database": metric.service_status_database,
-                    "api_gateway": metric.service_status_api_gateway,
-                    "cache": metric.service_status_cache
+        response_format = history_formats.negotiate(output_format, None if stream else accept)
+        if stream and response_format != "json":
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": "stream only supports NDJSON"
+                }
+            )
+        missing = history_formats.missing_dependency(response_format)
+        if missing:
+            return JSONResponse(
+                status_code=406,
+                content={
+                    "status": "error",
+                    "message": f"{missing} is not installed, {response_format} responses are unavailable"
                 },
-                "created_at": metric.created_at.isoformat() if metric.created_at else None
-            })
+                headers=history_formats.NEGOTIATED_HEADERS
+            )
+        
+        if before is not None or stream:
+            # keyset pagination and streaming walk the raw points
+            if resolution not in ("auto", "raw"):
+                return JSONResponse(
+                    status_code=400,
+                    content={
+                        "status": "error",
+                        "message": "cursor and stream are only supported for raw points"
+                    }
+                )
+            resolution = "raw"
+        
+        if stream:
+            logger.info(f"Streaming history of infrastructure '{infra}'")
+            return StreamingResponse(
+                _stream_history(infra_id, start_ms, end_ms, before, projection),
+                media_type="application/x-ndjson"
+            )
         
-        logger.info(f"Retrieved {len(history_data)} metrics from history")
+        # the document is cached before rendering, every format of a query shares the entry
+        document = await response_cache.get_or_compute(
+            "history",
+            infra_id,
+            {
+                "infra": infra,
+                "limit": limit,
+                "start_time": start_time,
+                "end_time": end_time,
+                "resolution": resolution,
+                "cursor": cursor,
+                "fields": projection
+            },
+            lambda: _history_document(session, infra, infra_id, limit, start_time, end_time, start_ms, end_ms, resolution, before, projection)
+        )
+        return history_formats.render(response_format, document)
         
+    except Exception as e:
+        logger.error(f"Error retrieving history: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "message": "Failed to retrieve history"
+            }
+        )
+
+async def _history_document(
+    session: AsyncSession,
+    infra: str,
+    infra_id: int,
+    limit: int,
+    start_time: Optional[str],
+    end_time: Optional[str],
+    start_ms: Optional[int],
+    end_ms: Optional[int],
+    resolution: str,
+    before,
+    projection
+) -> Dict[str, Any]:
+    if resolution == "auto":
+        resolution = "raw"
+        if start_ms is not None and ROLLUPS_ENABLED:
+            range_end = end_ms if end_ms is not None else int(time.time() * 1000)
+            resolution = await rollup_service.choose_resolution(session, infra_id, start_ms, range_end, limit)
+    
+    if resolution != "raw":
+        history_data = await rollup_service.get_series(session, infra_id, resolution, start_ms, end_ms, limit, projection)
+        logger.info(f"Retrieved {len(history_data)} {resolution} rollup points from history of infrastructure '{infra}'")
         return {
+            "infra": infra,
+            "resolution": resolution,
             "total_retrieved": len(history_data),
             "limit": limit,
             "start_time": start_time,
             "end_time": end_time,
             "data": history_data
         }
+    
+    history_data = await metrics_service.get_metrics_range(session, infra_id, start_ms, end_ms, limit, projection, before)
+    
+    logger.info(f"Retrieved {len(history_data)} metrics from history of infrastructure '{infra}'")
+    
+    return {
+        "infra": infra,
+        "resolution": "raw",
+        "total_retrieved": len(history_data),
+        "limit": limit,
+        "start_time": start_time,
+        "end_time": end_time,
+        "next_cursor": encode_cursor(next_cursor(history_data, before)) if len(history_data) == limit else None,
+        "data": history_data
+    }
+
+async def _stream_history(infra_id: int, start_ms: Optional[int], end_ms: Optional[int], before, fields):
+    # the request's session is closed once the response is returned, the stream reads in its own
+    rows = 0
+    try:
+        async with AsyncReadSessionLocal() as session:
+            lines = []
+            async for metrics in metrics_service.iter_metrics_range(
+                session, infra_id, start_ms, end_ms, before, HISTORY_STREAM_BATCH_SIZE, fields
+            ):
+                lines.append(json.dumps(metrics))
+                if len(lines) >= HISTORY_STREAM_LINES_PER_WRITE:
+                    yield "\n".join(lines) + "\n"
+                    rows += len(lines)
+                    lines = []
+            if lines:
+                yield "\n".join(lines) + "\n"
+                rows += len(lines)
+    except Exception as e:
+        # the status line is already sent, the client sees a truncated stream
+        logger.error(f"Error streaming history after {rows} rows: {str(e)}")
+        raise
+    if DEBUG:
+        logger.debug(f"Streamed {rows} history rows of infra {infra_id}")
+
+@router.get("/metrics/info")
+async def get_metrics_info(infra: str = INFRA_QUERY, session: AsyncSession = Depends(get_async_read_session)):
+    try:
+        infra_id = await metrics_service.get_infra_id(session, infra)
+        if infra_id is None:
+            return _unknown_infra_response(infra)
         
+        async def count():
+            counter = await metrics_counters.get(session, infra_id)
+            return {
+                "total_count": counter["row_count"],
+                "latest_timestamp": counter["last_timestamp"]
+            }
+        
+        return await response_cache.get_or_compute("metrics_info", infra_id, {}, count)
     except Exception as e:
-        logger.error(f"Error retrieving history: {str(e)}")
+        logger.error(f"Error getting metrics info: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={
                 "status": "error",
-                "message": "Failed to retrieve history"
+                "message": "Failed to get metrics info"
             }
         )
 
-@router.get("/metrics/info")
-async def get_metrics_info(session: AsyncSession = Depends(get_async_session)):
+@router.post("/metrics/rollups/rebuild")
+async def rebuild_rollups(infra: str = INFRA_QUERY, session: AsyncSession = Depends(get_async_session)):
+    start_time = time.time()
+    try:
+        infra_id = await metrics_service.get_infra_id(session, infra)
+        if infra_id is None:
+            return _unknown_infra_response(infra)
+        
+        rows = await rollup_service.rebuild(session, infra_id)
+        await session.commit()
+        
+        return {
+            "status": "success",
+            "data": {
+                "infra": infra,
+                "rows": rows,
+                "processing_time": time.time() - start_time
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error rebuilding rollups: {str(e)}")
+        await session.rollback()
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "message": "Failed to rebuild rollups"
+            }
+        )
+
+@router.get("/metrics/aggregate")
+async def aggregate_metrics(
+    start_time: str = Query(..., description="Start of the range (ISO format)"),
+    end_time: Optional[str] = Query(None, description="End of the range (ISO format), now by default"),
+    bucket: str = Query("1h", description="Bucket width: 30s, 5m, 1h, 1d..."),
+    metrics: Optional[str] = Query(None, description="Comma separated metrics, all numeric metrics by default"),
+    functions: str = Query("avg", description="Comma separated avg, min, max, count, stddev, rolling_mean, pNN (e.g. p95, p99.9)"),
+    window: int = Query(5, description="rolling_mean window in buckets", ge=1, le=1000),
+    infra: str = INFRA_QUERY,
+    session: AsyncSession = Depends(get_async_read_session)
+):
+    start = time.time()
     try:
-        result = await session.execute(
-            select(
-                func.count(Metrics.id).label("total_count"),
-                func.max(Metrics.timestamp).label("latest_timestamp")
+        infra_id = await metrics_service.get_infra_id(session, infra)
+        if infra_id is None:
+            return _unknown_infra_response(infra)
+        
+        try:
+            start_ms = parse_timestamp_ms(start_time)
+            end_ms = parse_timestamp_ms(end_time) if end_time else None
+            bucket_ms = parse_duration_ms(bucket)
+            function_list = parse_functions(functions)
+            metric_list = _parse_metrics(metrics)
+            buckets = ((end_ms if end_ms is not None else int(start * 1000)) - start_ms) // bucket_ms + 1
+            if buckets > AGGREGATE_MAX_BUCKETS:
+                raise ValueError(f"The range holds {buckets} buckets, at most {AGGREGATE_MAX_BUCKETS} are allowed")
+        except ValueError as e:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": str(e)
+                }
             )
+        
+        result = await aggregation_service.aggregate(
+            session, infra_id, start_ms, end_ms, bucket_ms, metric_list, function_list, window
         )
-        row = result.first()
+        logger.info(f"Aggregated {len(result['series'])} {bucket} buckets of infrastructure '{infra}' from {result['source']} points")
         
         return {
-            "total_count": row.total_count or 0,
-            "latest_timestamp": row.latest_timestamp
+            "status": "success",
+            "data": {
+                "infra": infra,
+                "bucket": bucket,
+                "start_time": start_time,
+                "end_time": end_time,
+                "functions": function_list,
+                **result,
+                "processing_time": time.time() - start
+            }
         }
     except Exception as e:
-        logger.error(f"Error getting metrics info: {str(e)}")
+        logger.error(f"Error aggregating metrics: {str(e)}")
         return JSONResponse(
             status_code=500,
             content={
                 "status": "error",
-                "message": "Failed to get metrics info"
+                "message": "Failed to aggregate metrics"
+            }
+        )
+
+@router.get("/metrics/series")
+async def get_chart_series(
+    start_time: str = Query(..., description="Start of the range (ISO format)"),
+    end_time: Optional[str] = Query(None, description="End of the range (ISO format), now by default"),
+    metrics: Optional[str] = Query(None, description="Comma separated metrics, all numeric metrics by default"),
+    points: int = Query(500, description="Points per metric (chart width in pixels)", ge=3, le=10000),
+    infra: str = INFRA_QUERY,
+    session: AsyncSession = Depends(get_async_read_session)
+):
+    start = time.time()
+    try:
+        infra_id = await metrics_service.get_infra_id(session, infra)
+        if infra_id is None:
+            return _unknown_infra_response(infra)
+        
+        try:
+            start_ms = parse_timestamp_ms(start_time)
+            end_ms = parse_timestamp_ms(end_time) if end_time else None
+            metric_list = _parse_metrics(metrics)
+        except ValueError as e:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": str(e)
+                }
+            )
+        
+        result = await aggregation_service.downsample(session, infra_id, start_ms, end_ms, metric_list, points)
+        logger.info(f"Downsampled {result['source_points']} points of infrastructure '{infra}' to {points} per metric")
+        
+        return {
+            "status": "success",
+            "data": {
+                "infra": infra,
+                "start_time": start_time,
+                "end_time": end_time,
+                "points": points,
+                **result,
+                "processing_time": time.time() - start
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error downsampling metrics: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "message": "Failed to downsample metrics"
+            }
+        )
+
+@router.get("/metrics/quantiles")
+async def get_metrics_quantiles(
+    start_time: str = Query(..., description="Start of the range (ISO format)"),
+    end_time: Optional[str] = Query(None, description="End of the range (ISO format), now by default"),
+    metrics: Optional[str] = Query(None, description="Comma separated metrics, all numeric metrics by default"),
+    percentiles: str = Query("p50,p95,p99", description="Comma separated percentiles (e.g. p50, p99.9)"),
+    infra: str = Query(DEFAULT_INFRA, description="Comma separated infrastructure names, pooled together", min_length=1),
+    session: AsyncSession = Depends(get_async_read_session)
+):
+    start = time.time()
+    try:
+        infra_names = list(dict.fromkeys(name.strip() for name in infra.split(",") if name.strip()))
+        infra_ids = []
+        for name in infra_names:
+            infra_id = await metrics_service.get_infra_id(session, name)
+            if infra_id is None:
+                return _unknown_infra_response(name)
+            infra_ids.append(infra_id)
+        
+        try:
+            start_ms = parse_timestamp_ms(start_time)
+            end_ms = parse_timestamp_ms(end_time) if end_time else int(start * 1000)
+            percentile_list = parse_percentiles(percentiles)
+            metric_list = _parse_metrics(metrics)
+            if not infra_ids:
+                raise ValueError("At least one infrastructure is required")
+            if end_ms < start_ms:
+                raise ValueError("end_time is before start_time")
+        except ValueError as e:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": str(e)
+                }
+            )
+        
+        result = await aggregation_service.quantiles(session, infra_ids, start_ms, end_ms, metric_list, percentile_list)
+        logger.info(f"Computed {len(percentile_list)} percentiles of {len(metric_list)} metrics over {len(infra_ids)} infrastructures from {result['source']}")
+        
+        return {
+            "status": "success",
+            "data": {
+                "infra": infra_names,
+                "start_time": format_timestamp_ms(result.pop("start_ms")),
+                "end_time": format_timestamp_ms(result.pop("end_ms")),
+                "percentiles": percentile_list,
+                **result,
+                "processing_time": time.time() - start
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error computing metrics quantiles: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "message": "Failed to compute metrics quantiles"
+            }
+        )
+
+@router.get("/metrics/correlation")
+async def get_metrics_correlation(
+    window: str = Query("1h", description="Window width (e.g. 15m, 1h, 1d)"),
+    mode: str = Query("sliding", description="sliding (ends at end_time) or tumbling (epoch-aligned window holding end_time)", pattern=MODE_PATTERN),
+    end_time: Optional[str] = Query(None, description="End of the window (ISO format), now by default"),
+    metrics: Optional[str] = Query(None, description="Comma separated metrics, every dashboard metric by default"),
+    infra: str = INFRA_QUERY,
+    session: AsyncSession = Depends(get_async_read_session)
+):
+    start = time.time()
+    try:
+        infra_id = await metrics_service.get_infra_id(session, infra)
+        if infra_id is None:
+            return _unknown_infra_response(infra)
+        
+        try:
+            window_ms = parse_duration_ms(window)
+            end_ms = parse_timestamp_ms(end_time) if end_time else None
+            metric_list = _parse_metrics(metrics, CORRELATION_METRICS)
+            result = await correlation_service.correlation(session, infra_id, window_ms, end_ms, mode, metric_list)
+        except ValueError as e:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": str(e)
+                }
+            )
+        
+        return {
+            "status": "success",
+            "data": {
+                "infra": infra,
+                "window": window,
+                "mode": mode,
+                **result,
+                "processing_time": time.time() - start
+            }
+        }
+    except Exception as e:
+        logger.error(f"Error computing metrics correlation: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "message": "Failed to compute metrics correlation"
             }
         )
 
+@router.get("/metrics/window")
+async def get_hot_window(infra: str = INFRA_QUERY, session: AsyncSession = Depends(get_async_read_session)):
+    infra_id = await metrics_service.get_infra_id(session, infra)
+    if infra_id is None:
+        return _unknown_infra_response(infra)
+    if not hot_window.enabled:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "error",
+                "message": "Hot window is disabled"
+            }
+        )
+    
+    window = await metrics_service.get_hot_window(infra_id)
+    return {
+        "status": "success",
+        "data": {
+            "infra": infra,
+            "window": window.get_stats() if window is not None else None,
+            "cache": hot_window.get_stats()
+        }
+    }
+
+@router.get("/metrics/cache")
+async def get_response_cache():
+    return {
+        "status": "success",
+        "data": response_cache.get_stats()
+    }
+
+@router.get("/metrics/cold")
+async def get_cold_tier(infra: str = INFRA_QUERY, session: AsyncSession = Depends(get_async_read_session)):
+    infra_id = await metrics_service.get_infra_id(session, infra)
+    if infra_id is None:
+        return _unknown_infra_response(infra)
+    
+    return {
+        "status": "success",
+        "data": {
+            **cold_storage.get_stats(),
+            "infra": infra,
+            "partitions": await cold_storage.get_partitions(session, infra_id)
+        }
+    }
+
+@router.post("/metrics/cold/export")
+async def export_cold_tier():
+    if not cold_storage.available:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "error",
+                "message": "Cold tier requires pyarrow"
+            }
+        )
+    
+    try:
+        return {
+            "status": "success",
+            "data": await cold_storage.run_once()
+        }
+    except Exception as e:
+        logger.error(f"Error exporting cold tier: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "status": "error",
+                "message": "Failed to export cold tier"
+            }
+        )
+
+@router.get("/ingest/metrics")
+async def get_ingest_metrics():
+    return {
+        "status": "success",
+        "data": {
+            "mode": INGEST_MODE,
+            "queue": ingestion_queue.get_stats(),
+            "spool": ingestion_spool.get_stats()
+        }
+    }
+
 @router.post("/ingest", status_code=200)
-async def ingest_metrics(request: Request, session: AsyncSession = Depends(get_async_session)):
+async def ingest_metrics(request: Request, infra: str = INGEST_INFRA_QUERY, session: AsyncSession = Depends(get_async_session)):
     start_time = time.time()
     
     try:
-        data = await request.json()
+        if not persistence_service.auto_register and await metrics_service.get_infra_id(session, infra) is None:
+            return _unknown_infra_response(infra)
+        
+        content_encoding = request.headers.get("content-encoding")
+        try:
+            check_encoding(content_encoding)
+        except UnsupportedContentEncoding as e:
+            return JSONResponse(
+                status_code=415,
+                content={
+                    "status": "error",
+                    "message": str(e)
+                }
+            )
+        
+        content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type in NDJSON_MEDIA_TYPES:
+            logger.info("NDJSON metrics ingestion request received")
+            return NDJSONIngestResponse(
+                _stream_ndjson_results(request, content_encoding, infra),
+                media_type="application/x-ndjson"
+            )
+        
+        try:
+            body = await read_decoded_body(request.stream(), content_encoding)
+        except DecompressedSizeExceeded as e:
+            return JSONResponse(
+                status_code=413,
+                content={
+                    "status": "error",
+                    "message": str(e)
+                }
+            )
+        except BodyDecodingError as e:
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "status": "error",
+                    "message": str(e)
+                }
+            )
+        
+        data = from_json(body)
         logger.info("Metrics ingestion request received")
         
+        if INGEST_MODE in ("queue", "spool") and isinstance(data, (dict, list)):
+            return await _accept_metrics(data, infra, start_time)
+        
         if isinstance(data, dict):
-            return await _process_single_metrics(data, session, start_time)
+            return await _process_single_metrics(data, infra, session, start_time)
         elif isinstance(data, list):
-            return await _process_batch_metrics(data, session, start_time)
+            return await _process_batch_metrics(data, infra, session, start_time)
         else:
             return JSONResponse(
                 status_code=422,
@@ -187,7 +716,29 @@ async def ingest_metrics(request: Request, session: AsyncSession = Depends(get_a
             }
         )
 
-async def _process_single_metrics(data: Dict[str, Any], session: AsyncSession, start_time: float):
+def _parse_metrics(metrics: Optional[str], allowed: List[str] = ROLLUP_METRICS) -> List[str]:
+    """Comma separated metrics among `allowed`, all of them by default. Raises ValueError."""
+    metric_list = list(dict.fromkeys(metric.strip() for metric in metrics.split(",") if metric.strip())) if metrics else list(allowed)
+    unknown = [metric for metric in metric_list if metric not in allowed]
+    if unknown or not metric_list:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)}")
+    return metric_list
+
+def _unknown_infra_response(infra: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=404,
+        content={
+            "status": "error",
+            "message": f"Unknown infrastructure '{infra}'"
+        }
+    )
+
+async def _stream_ndjson_results(request: Request, content_encoding: Optional[str], infra: str):
+    chunks = iter_decoded_body(request.stream(), content_encoding)
+    async for result in stream_ingestion_service.ingest(chunks, infra):
+        yield json.dumps(result) + "\n"
+
+async def _process_single_metrics(data: Dict[str, Any], infra: str, session: AsyncSession, start_time: float):
     if DEBUG:
         logger.debug(f"Processing single metrics validation...")
     
@@ -212,7 +763,7 @@ async def _process_single_metrics(data: Dict[str, Any], session: AsyncSession, s
         )
     
     storage_start = time.time()
-    storage_success = await persistence_service.store_metrics(session, result.data)
+    storage_success = await persistence_service.store_metrics(session, result.data, infra)
     storage_time = time.time() - storage_start
     
     if not storage_success:
@@ -239,14 +790,14 @@ async def _process_single_metrics(data: Dict[str, Any], session: AsyncSession, s
         "processing_time": total_time
     }
 
-async def _process_batch_metrics(data: List[Dict[str, Any]], session: AsyncSession, start_time: float):
+async def _process_batch_metrics(data: List[Dict[str, Any]], infra: str, session: AsyncSession, start_time: float):
     logger.info(f"Processing batch of {len(data)} metrics")
     
     if DEBUG:
         logger.debug(f"Processing batch validation and storage...")
     
     batch_start = time.time()
-    result = await persistence_service.store_metrics_batch(session, data)
+    result = await persistence_service.store_metrics_batch(session, data, infra)
     batch_time = time.time() - batch_start
     
     total_time = time.time() - start_time
@@ -266,4 +817,62 @@ async def _process_batch_metrics(data: List[Dict[str, Any]], session: AsyncSessi
         "status": "success",
         "batch_result": result,
         "processing_time": total_time
-    } 
\ No newline at end of file
+    }
+
+async def _accept_metrics(data, infra: str, start_time: float):
+    """Write-behind ingestion: acknowledge once metrics are queued in memory or durable in the spool"""
+    if isinstance(data, dict):
+        result: ValidationResult = validation_service.validate_metrics(data)
+        if not result.is_valid:
+            logger.warning(f"Validation failed with {len(result.errors)} errors")
+            return JSONResponse(
+                status_code=422,
+                content={
+                    "status": "error",
+                    "errors": [e.model_dump() for e in result.errors]
+                }
+            )
+        valid_metrics, failed_count = [result.data], 0
+    else:
+        valid_metrics, failed_count = validation_service.validate_metrics_batch(data)
+        if not valid_metrics:
+            return JSONResponse(
+                status_code=422,
+                content={
+                    "status": "error",
+                    "message": "No valid metrics found in batch",
+                    "batch_result": {"accepted": 0, "failed": failed_count}
+                }
+            )
+    
+    if INGEST_MODE == "spool":
+        await ingestion_spool.append(valid_metrics, infra)
+        pending = None
+    else:
+        try:
+            pending = ingestion_queue.enqueue(valid_metrics, infra)
+        except IngestionQueueFull as e:
+            logger.warning(str(e))
+            return JSONResponse(
+                status_code=503,
+                content={
+                    "status": "error",
+                    "message": "Ingestion queue is full, retry later"
+                }
+            )
+    
+    if isinstance(data, dict):
+        set_latest_metrics(valid_metrics[0])
+    
+    total_time = time.time() - start_time
+    logger.info(f"Accepted {len(valid_metrics)} metrics in {total_time:.3f}s ({INGEST_MODE} mode)")
+    
+    content = {
+        "status": "accepted",
+        "batch_result": {"accepted": len(valid_metrics), "failed": failed_count},
+        "processing_time": total_time
+    }
+    if pending is not None:
+        content["queue_depth"] = pending
+    
+    return JSONResponse(status_code=202, content=content)
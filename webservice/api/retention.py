@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+from services.retention import RetentionService
+from services.metrics_service import MetricsService
+from services.persistence import DEFAULT_INFRA
+from models.retention import RetentionPolicyUpdate
+from db import get_async_session, get_async_read_session
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+import os
+
+router = APIRouter()
+retention_service = RetentionService()
+metrics_service = MetricsService()
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+
+@router.get("/retention/metrics")
+async def get_retention_metrics():
+    return {
+        "status": "success",
+        "data": retention_service.get_stats()
+    }
+
+
+@router.get("/retention/policies")
+async def get_retention_policies(session: AsyncSession = Depends(get_async_read_session)):
+    return {
+        "status": "success",
+        "data": await retention_service.get_policies(session)
+    }
+
+
+@router.put("/retention/policies")
+async def set_retention_policy(
+    policy: RetentionPolicyUpdate,
+    infra: str = Query(DEFAULT_INFRA, description="Infrastructure name", min_length=1, max_length=255),
+    session: AsyncSession = Depends(get_async_session)
+):
+    infra_id = await metrics_service.get_infra_id(session, infra)
+    if infra_id is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "status": "error",
+                "message": f"Unknown infrastructure '{infra}'"
+            }
+        )
+    
+    await retention_service.set_policy(session, infra_id, policy.raw_days, policy.rollup_days)
+    logger.info(f"Retention policy of infrastructure '{infra}' set to raw={policy.raw_days}d, rollups={policy.rollup_days}d")
+    
+    return {
+        "status": "success",
+        "data": {"infra": infra, **policy.model_dump()}
+    }
+
+
+@router.post("/retention/run")
+async def run_retention():
+    if DEBUG:
+        logger.debug("Manual retention run requested")
+    
+    return {
+        "status": "success",
+        "data": await retention_service.run_once()
+    }
@@ -0,0 +1,149 @@
+"""Bytes per point and full scan speed of the metrics table against the block storage.
+
+Runs on a throwaway database (DATABASE_URL is overridden):
+
+    python -m benchmarks.block_storage [points] [ingest batch size]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# must be set before db is imported
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/benchmark.db"
+
+import numpy as np
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db import engine, Base, AsyncSessionLocal
+from models.sql import User, Infrastructure, Metrics
+from services.block_storage import BlockStorage, BLOCK_METRICS, STATUS_COLUMNS
+from services.persistence import PersistenceService, BULK_CHUNK_SIZE
+from services.time_utils import format_timestamp_ms
+
+INGEST_BATCH_SIZE = 1000
+SCAN_REPEATS = 5
+
+
+def generate_points(count: int, seed: int = 0):
+    """Regular 10s telemetry: slowly drifting values, mostly healthy services"""
+    rng = np.random.default_rng(seed)
+    start = 1_700_000_000_000
+    walk = lambda base, step, low, high: np.clip(base + np.cumsum(rng.normal(0, step, count)), low, high)
+
+    cpu = np.rint(walk(50, 1, 0, 100)).astype(int)
+    memory = np.rint(walk(60, 0.5, 0, 100)).astype(int)
+    latency = np.round(walk(120, 2, 1, 1000), 1)
+    statuses = rng.choice(["online", "degraded", "offline"], size=(count, 3), p=[0.97, 0.02, 0.01])
+    return [
+        {
+            "timestamp": format_timestamp_ms(start + i * 10_000),
+            "cpu_usage": int(cpu[i]),
+            "memory_usage": int(memory[i]),
+            "latency_ms": float(latency[i]),
+            "disk_usage": 60,
+            "network_in_kbps": 1000 + i % 7,
+            "network_out_kbps": 800,
+            "io_wait": 5,
+            "thread_count": 50,
+            "active_connections": 100 + i % 3,
+            "error_rate": 0.02,
+            "uptime_seconds": 3600 + i * 10,
+            "temperature_celsius": 45,
+            "power_consumption_watts": 300,
+            "service_status": dict(zip(["database", "api_gateway", "cache"], statuses[i]))
+        }
+        for i in range(count)
+    ]
+
+
+async def database_bytes() -> int:
+    async with engine.connect() as conn:
+        await conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        page_count = (await conn.execute(text("PRAGMA page_count"))).scalar()
+        page_size = (await conn.execute(text("PRAGMA page_size"))).scalar()
+        freelist = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+    return (page_count - freelist) * page_size
+
+
+async def scan_table(infra_id: int):
+    columns = [Metrics.event_time] + [getattr(Metrics, name) for name in BLOCK_METRICS + STATUS_COLUMNS]
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(*columns).where(Metrics.infra_id == infra_id).order_by(Metrics.event_time))
+        rows = result.all()
+    return {name: np.array([row[i] for row in rows]) for i, name in enumerate(["event_time"] + BLOCK_METRICS + STATUS_COLUMNS)}
+
+
+async def scan_blocks(storage: BlockStorage, infra_id: int):
+    async with AsyncSessionLocal() as session:
+        return await storage.scan(session, infra_id)
+
+
+async def timed(scan):
+    best = float("inf")
+    for _ in range(SCAN_REPEATS):
+        start = time.perf_counter()
+        arrays = await scan()
+        best = min(best, time.perf_counter() - start)
+    return best, arrays
+
+
+async def main(count: int, batch_size: int = INGEST_BATCH_SIZE):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        user = User(username="benchmark", password="benchmark")
+        session.add(user)
+        await session.flush()
+        table_infra = Infrastructure(name="table", user_id=user.id)
+        blocks_infra = Infrastructure(name="blocks", user_id=user.id)
+        session.add_all([table_infra, blocks_infra])
+        await session.flush()
+        user_id, table_infra_id, blocks_infra_id = user.id, table_infra.id, blocks_infra.id
+        await session.commit()
+
+    persistence = PersistenceService()
+    points = generate_points(count)
+    storage = BlockStorage(enabled=True)
+
+    empty_bytes = await database_bytes()
+    start = time.perf_counter()
+    rows = [persistence._to_row(point, user_id, table_infra_id) for point in points]
+    for batch in range(0, count, batch_size):
+        async with AsyncSessionLocal() as session:
+            for chunk in range(batch, min(batch + batch_size, count), BULK_CHUNK_SIZE):
+                await session.execute(insert(Metrics), rows[chunk:min(chunk + BULK_CHUNK_SIZE, batch + batch_size)])
+            await session.commit()
+    table_write = time.perf_counter() - start
+    table_bytes = await database_bytes() - empty_bytes
+
+    start = time.perf_counter()
+    rows = [persistence._to_row(point, user_id, blocks_infra_id) for point in points]
+    for batch in range(0, count, batch_size):
+        async with AsyncSessionLocal() as session:
+            await storage.insert_rows(session, blocks_infra_id, rows[batch:batch + batch_size])
+            await session.commit()
+    blocks_write = time.perf_counter() - start
+    blocks_bytes = await database_bytes() - empty_bytes - table_bytes
+
+    table_scan, table_arrays = await timed(lambda: scan_table(table_infra_id))
+    blocks_scan, blocks_arrays = await timed(lambda: scan_blocks(storage, blocks_infra_id))
+    # the points past the last full block stay staged in the metrics table
+    sealed = len(blocks_arrays["event_time"])
+    for name, column in table_arrays.items():
+        assert np.array_equal(column[:sealed], blocks_arrays[name]), name
+
+    print(f"{count} points in batches of {batch_size}, block size {storage.block_points}, {count - sealed} staged")
+    print(f"{'backend':<8} {'bytes/point':>12} {'write s':>9} {'scan s':>9} {'points/s scanned':>17}")
+    for name, size, write, scan in (("table", table_bytes, table_write, table_scan), ("blocks", blocks_bytes, blocks_write, blocks_scan)):
+        print(f"{name:<8} {size / count:>12.1f} {write:>9.3f} {scan:>9.3f} {count / scan:>17,.0f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100_000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else INGEST_BATCH_SIZE
+    ))
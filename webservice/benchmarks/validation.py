@@ -0,0 +1,56 @@
+"""Batch validation time of the columnar validator against the per-row compiled adapter.
+
+    python -m benchmarks.validation [records] [rejected percent]
+"""
+import logging
+import sys
+import time
+from services.validation import ValidationService
+
+REPEATS = 7
+
+
+def generate_records(count: int, rejected_percent: int):
+    record = {
+        "timestamp": "2023-10-01T12:00:00Z", "cpu_usage": 50, "memory_usage": 60, "latency_ms": 120,
+        "disk_usage": 40, "network_in_kbps": 1200, "network_out_kbps": 900, "io_wait": 5,
+        "thread_count": 150, "active_connections": 45, "error_rate": 0.02, "uptime_seconds": 3600,
+        "temperature_celsius": 55, "power_consumption_watts": 250,
+        "service_status": {"database": "online", "api_gateway": "online", "cache": "degraded"}
+    }
+    return [
+        dict(
+            record,
+            timestamp=f"2023-10-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}Z",
+            cpu_usage=101 if i % 100 < rejected_percent else i % 100
+        )
+        for i in range(count)
+    ]
+
+
+def best_of(run) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rejected_percent = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    logging.disable(logging.WARNING)
+
+    service = ValidationService()
+    records = generate_records(count, rejected_percent)
+    columnar = best_of(lambda: service.columnar_validator.validate(records))
+    rows = best_of(lambda: service._validate_metrics_batch_rows(records))
+
+    print(f"{count} records, {rejected_percent}% rejected")
+    print(f"columnar: {columnar:.3f}s")
+    print(f"per row:  {rows:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
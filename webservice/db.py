@@ -1,10 +1,67 @@
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./infra_monitoring.db")
+SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
+
+# "wal": WAL journaling, tuned pragmas, one writer connection and a read-only pool
+# "default": a single engine with SQLite defaults
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal").lower()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+DB_WRITER_POOL_TIMEOUT = float(os.getenv("DB_WRITER_POOL_TIMEOUT", "30"))
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+WAL_ENABLED = IS_SQLITE and SQLITE_PROFILE == "wal" and ":memory:" not in DATABASE_URL
+
+
+def _sqlite_pragmas(read_only: bool):
+    pragmas = [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    else:
+        # auto_vacuum only takes effect on a new database (or after a VACUUM), see db_init
+        pragmas[:0] = ["PRAGMA auto_vacuum=INCREMENTAL", "PRAGMA journal_mode=WAL"]
+    return pragmas
+
+
+def _apply_pragmas(sync_engine, pragmas):
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+if WAL_ENABLED:
+    # SQLite allows one writer at a time, a single pooled connection serializes writers in
+    # the application instead of on the database lock
+    engine = create_async_engine(
+        DATABASE_URL, echo=SQL_ECHO, future=True,
+        pool_size=1, max_overflow=0, pool_timeout=DB_WRITER_POOL_TIMEOUT
+    )
+    read_engine = create_async_engine(
+        DATABASE_URL, echo=SQL_ECHO, future=True,
+        pool_size=DB_READ_POOL_SIZE, max_overflow=0
+    )
+    _apply_pragmas(engine.sync_engine, _sqlite_pragmas(read_only=False))
+    _apply_pragmas(read_engine.sync_engine, _sqlite_pragmas(read_only=True))
+else:
+    engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO, future=True)
+    read_engine = engine
 
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
 AsyncSessionLocal = sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -12,9 +69,20 @@ AsyncSessionLocal = sessionmaker(
     autoflush=False,
     autocommit=False
 )
+AsyncReadSessionLocal = sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False,
+    autocommit=False
+)
 
 Base = declarative_base()
 
 async def get_async_session():
     async with AsyncSessionLocal() as session:
-        yield session 
\ No newline at end of file
+        yield session
+
+async def get_async_read_session():
+    async with AsyncReadSessionLocal() as session:
+        yield session
@@ -1,12 +1,72 @@
 import asyncio
-from db import engine, Base
+import logging
+import os
+from db import engine, Base, WAL_ENABLED
 from models.sql import User, Infrastructure
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+logger = logging.getLogger(__name__)
+
+SQLITE_VACUUM_ON_INIT = os.getenv("SQLITE_VACUUM_ON_INIT", "false").lower() == "true"
+
+async def _enable_incremental_vacuum():
+    # an existing database keeps its auto_vacuum mode until a full VACUUM rewrites it. VACUUM
+    # cannot run in a transaction and the isolation level is fixed once a statement began one
+    async with engine.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        if (await conn.execute(text("PRAGMA auto_vacuum"))).scalar() == 2:
+            return
+        if not SQLITE_VACUUM_ON_INIT:
+            logger.warning("auto_vacuum is not INCREMENTAL, retention cannot shrink the database file (set SQLITE_VACUUM_ON_INIT=true to convert it)")
+            return
+        logger.info("Converting database to auto_vacuum=INCREMENTAL, running VACUUM")
+        await conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        await conn.execute(text("VACUUM"))
+
+def _migrate_event_time(sync_conn):
+    # metrics created before event_time existed: add the column and backfill it in SQL,
+    # julianday() understands the ISO 8601 strings (Z and +HH:MM offsets included)
+    columns = {column["name"] for column in inspect(sync_conn).get_columns("metrics")}
+    if "event_time" not in columns:
+        sync_conn.execute(text("ALTER TABLE metrics ADD COLUMN event_time BIGINT"))
+        sync_conn.execute(text(
+            "UPDATE metrics SET event_time = CAST(ROUND((julianday(timestamp) - 2440587.5) * 86400000) AS INTEGER)"
+        ))
+        # reads filter and order on event_time, a row left NULL would silently disappear:
+        # rows whose timestamp julianday() cannot parse fall back to their insertion time
+        fallback = sync_conn.execute(text(
+            "UPDATE metrics SET event_time = CAST(ROUND((julianday(created_at) - 2440587.5) * 86400000) AS INTEGER) "
+            "WHERE event_time IS NULL AND julianday(created_at) IS NOT NULL"
+        )).rowcount
+        if fallback:
+            logger.warning(f"Backfilled event_time of {fallback} metrics rows with an unparseable timestamp from created_at")
+        missing = sync_conn.execute(text("SELECT count(*) FROM metrics WHERE event_time IS NULL")).scalar()
+        if missing:
+            logger.error(f"{missing} metrics rows have neither a parseable timestamp nor created_at, they stay without event_time and are not read")
+    sync_conn.execute(text("DROP INDEX IF EXISTS ix_metrics_infra_id_timestamp"))
+
+def _migrate_rollup_sketches(sync_conn):
+    # rollups created before quantile sketches existed, their buckets get sketches from new
+    # points only until POST /api/metrics/rollups/rebuild recomputes them
+    columns = {column["name"] for column in inspect(sync_conn).get_columns("metrics_rollups")}
+    if "sketch" not in columns:
+        sync_conn.execute(text("ALTER TABLE metrics_rollups ADD COLUMN sketch BLOB"))
+
+def _create_missing_indexes(sync_conn):
+    # create_all only adds indexes together with a new table
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_migrate_event_time)
+        await conn.run_sync(_migrate_rollup_sketches)
+        await conn.run_sync(_create_missing_indexes)
+    if WAL_ENABLED:
+        await _enable_incremental_vacuum()
     async with AsyncSession(engine) as session:
         result = await session.execute(select(User).where(User.username == "jean"))
         user = result.scalar_one_or_none()
@@ -5,10 +5,18 @@ import logging
 import os
 from contextlib import asynccontextmanager
 
-from api.health import router as health_router
-from api.metrics import router as metrics_router
+from api.health import router as health_router, wal_checkpointer
+from api.metrics import router as metrics_router, ingestion_queue, ingestion_spool, metrics_service, INGEST_MODE
 from api.anomalies import router as anomalies_router
 from api.analysis import router as analysis_router
+from api.retention import router as retention_router, retention_service
+from services.retention import RETENTION_ENABLED
+from services.cold_storage import cold_storage, COLD_TIER_ENABLED
+from services.hot_window import hot_window
+from services.metrics_counters import metrics_counters
+from db import AsyncReadSessionLocal, AsyncSessionLocal
+from db import WAL_ENABLED
+from db_init import init_db
 
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
 
@@ -23,8 +31,30 @@ async def lifespan(app: FastAPI):
     logger.info("Infrastructure Monitoring API starting up...")
     if DEBUG:
         logger.debug("Debug mode enabled")
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        await metrics_counters.reconcile(session)
+        await session.commit()
+    if hot_window.enabled:
+        async with AsyncReadSessionLocal() as session:
+            await metrics_service.hydrate_hot_window(session)
+    if WAL_ENABLED:
+        await wal_checkpointer.start()
+    if RETENTION_ENABLED:
+        await retention_service.start()
+    if COLD_TIER_ENABLED:
+        await cold_storage.start()
+    if INGEST_MODE == "queue":
+        await ingestion_queue.start()
+    elif INGEST_MODE == "spool":
+        await ingestion_spool.start()
     yield
     logger.info("Infrastructure Monitoring API shutting down...")
+    await ingestion_queue.stop()
+    await ingestion_spool.stop()
+    await cold_storage.stop()
+    await retention_service.stop()
+    await wal_checkpointer.stop()
 
 app = FastAPI(
     title="Infrastructure Monitoring API",
@@ -45,6 +75,7 @@ app.include_router(health_router, prefix="/api", tags=["health"])
 app.include_router(metrics_router, prefix="/api", tags=["metrics"])
 app.include_router(anomalies_router, prefix="/api", tags=["anomalies"])
 app.include_router(analysis_router, prefix="/api", tags=["analysis"])
+app.include_router(retention_router, prefix="/api", tags=["retention"])
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
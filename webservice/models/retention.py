@@ -0,0 +1,7 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+
+class RetentionPolicyUpdate(BaseModel):
+    raw_days: Optional[int] = Field(None, ge=0, description="Days of raw metrics to keep, 0 keeps them forever, null uses the default")
+    rollup_days: Optional[int] = Field(None, ge=0, description="Days of rollups to keep, 0 keeps them forever, null uses the default")
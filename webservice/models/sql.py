@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from db import Base
@@ -17,6 +17,9 @@ class Infrastructure(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     metrics = relationship("Metrics", back_populates="infrastructure")
     user = relationship("User", back_populates="infrastructures")
+    __table_args__ = (
+        Index("ix_infrastructures_user_id_name", "user_id", "name", unique=True),
+    )
 
 class Metrics(Base):
     __tablename__ = "metrics"
@@ -24,6 +27,7 @@ class Metrics(Base):
     infra_id = Column(Integer, ForeignKey("infrastructures.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     timestamp = Column(String, index=True, nullable=False)
+    event_time = Column(BigInteger)
     cpu_usage = Column(Float)
     memory_usage = Column(Float)
     latency_ms = Column(Float)
@@ -41,4 +45,91 @@ class Metrics(Base):
     service_status_api_gateway = Column(String)
     service_status_cache = Column(String)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    infrastructure = relationship("Infrastructure", back_populates="metrics") 
\ No newline at end of file
+    infrastructure = relationship("Infrastructure", back_populates="metrics")
+    __table_args__ = (
+        Index("ix_metrics_infra_id_event_time", "infra_id", "event_time"),
+    )
+
+class SpoolSegment(Base):
+    __tablename__ = "spool_segments"
+    name = Column(String, primary_key=True)
+    record_count = Column(Integer, nullable=False)
+    applied_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class MetricsRollup(Base):
+    __tablename__ = "metrics_rollups"
+    infra_id = Column(Integer, ForeignKey("infrastructures.id"), primary_key=True)
+    resolution = Column(String, primary_key=True)
+    bucket_start = Column(BigInteger, primary_key=True)
+    metric = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+    sum_value = Column(Float, nullable=False)
+    min_value = Column(Float, nullable=False)
+    max_value = Column(Float, nullable=False)
+    last_time = Column(BigInteger, nullable=False)
+    last_value = Column(Float, nullable=False)
+    sketch = Column(LargeBinary)
+    __table_args__ = {"sqlite_with_rowid": False}
+
+class ServiceStatusRollup(Base):
+    __tablename__ = "service_status_rollups"
+    infra_id = Column(Integer, ForeignKey("infrastructures.id"), primary_key=True)
+    resolution = Column(String, primary_key=True)
+    bucket_start = Column(BigInteger, primary_key=True)
+    service = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False)
+    __table_args__ = {"sqlite_with_rowid": False}
+
+class MetricsMoments(Base):
+    __tablename__ = "metrics_moments"
+    infra_id = Column(Integer, ForeignKey("infrastructures.id"), primary_key=True)
+    resolution = Column(String, primary_key=True)
+    bucket_start = Column(BigInteger, primary_key=True)
+    count = Column(Integer, nullable=False)
+    means = Column(LargeBinary, nullable=False)
+    comoments = Column(LargeBinary, nullable=False)
+    __table_args__ = {"sqlite_with_rowid": False}
+
+class RetentionPolicy(Base):
+    __tablename__ = "retention_policies"
+    infra_id = Column(Integer, ForeignKey("infrastructures.id"), primary_key=True)
+    raw_days = Column(Integer)
+    rollup_days = Column(Integer)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ColdPartition(Base):
+    __tablename__ = "cold_partitions"
+    id = Column(Integer, primary_key=True)
+    infra_id = Column(Integer, ForeignKey("infrastructures.id"), nullable=False)
+    day_start = Column(BigInteger, nullable=False)
+    path = Column(String, unique=True, nullable=False)
+    row_count = Column(Integer, nullable=False)
+    min_event_time = Column(BigInteger, nullable=False)
+    max_event_time = Column(BigInteger, nullable=False)
+    size_bytes = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        Index("ix_cold_partitions_infra_id_max_event_time", "infra_id", "max_event_time"),
+    )
+
+class MetricsBlock(Base):
+    __tablename__ = "metrics_blocks"
+    id = Column(Integer, primary_key=True)
+    infra_id = Column(Integer, ForeignKey("infrastructures.id"), nullable=False)
+    start_time = Column(BigInteger, nullable=False)
+    end_time = Column(BigInteger, nullable=False)
+    point_count = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    __table_args__ = (
+        Index("ix_metrics_blocks_infra_id_end_time", "infra_id", "end_time"),
+    )
+
+class MetricsCounter(Base):
+    __tablename__ = "metrics_counters"
+    infra_id = Column(Integer, ForeignKey("infrastructures.id"), primary_key=True)
+    row_count = Column(BigInteger, nullable=False)
+    first_event_time = Column(BigInteger)
+    last_event_time = Column(BigInteger)
+    last_timestamp = Column(String)
+    last_id = Column(Integer)
@@ -0,0 +1,374 @@
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+import os
+import re
+import numpy as np
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.sql import MetricsRollup
+from services.downsampling import lttb
+from services import quantile_sketch
+from services.metrics_service import MetricsService
+from services.rollups import ROLLUPS_ENABLED, RESOLUTIONS, ROLLUP_METRICS
+from services.time_utils import format_timestamp_ms
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+AGGREGATE_MAX_BUCKETS = int(os.getenv("AGGREGATE_MAX_BUCKETS", "10000"))
+
+FUNCTIONS = ["avg", "min", "max", "count", "stddev", "rolling_mean"]
+# answered from the rollups' count/sum/min/max when the buckets line up
+ROLLUP_FUNCTIONS = {"avg", "min", "max", "count", "rolling_mean"}
+PERCENTILE_PATTERN = re.compile(r"p(\d{1,2}(?:\.\d+)?|100)")
+
+BucketStats = Dict[str, np.ndarray]
+
+
+def parse_percentiles(value: str) -> List[str]:
+    """Comma separated percentiles (p50, p99.9...), ValueError on anything else"""
+    percentiles = list(dict.fromkeys(percentile.strip() for percentile in value.split(",") if percentile.strip()))
+    if not percentiles:
+        raise ValueError("At least one percentile is required")
+    invalid = [percentile for percentile in percentiles if not PERCENTILE_PATTERN.fullmatch(percentile)]
+    if invalid:
+        raise ValueError(f"Invalid percentiles: {', '.join(invalid)}")
+    return percentiles
+
+
+def parse_functions(value: str) -> List[str]:
+    """Comma separated functions (avg, min, max, count, stddev, rolling_mean, p50, p99.9...),
+    ValueError on unknown ones"""
+    functions = list(dict.fromkeys(function.strip() for function in value.split(",") if function.strip()))
+    if not functions:
+        raise ValueError("At least one function is required")
+    unknown = [
+        function for function in functions
+        if function not in FUNCTIONS and not PERCENTILE_PATTERN.fullmatch(function)
+    ]
+    if unknown:
+        raise ValueError(f"Unknown functions: {', '.join(unknown)}")
+    return functions
+
+
+class AggregationService:
+    """Time bucketed aggregates of raw metrics, computed with NumPy over one scan of every
+    storage tier, or from the rollup tables when the requested functions and buckets allow it.
+    Buckets are aligned on multiples of their width since the epoch, like the rollups.
+
+    Also downsamples raw series to a fixed number of points for charts, and answers
+    percentiles over a range by merging the rollups' quantile sketches.
+    """
+
+    def __init__(self, metrics_service: Optional[MetricsService] = None, resolutions: Dict[str, int] = RESOLUTIONS):
+        self.metrics_service = metrics_service or MetricsService()
+        self.resolutions = resolutions
+
+    async def aggregate(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: int,
+        end_ms: Optional[int],
+        bucket_ms: int,
+        metrics: List[str],
+        functions: List[str],
+        window: int = 5
+    ) -> Dict[str, Any]:
+        """Oldest first series of {timestamp, event_time, <metric>: {<function>: value}},
+        `end_ms` None for up to now"""
+        resolution = self._rollup_resolution(start_ms, end_ms, bucket_ms, metrics, functions)
+        if resolution is not None:
+            starts, stats = await self._rollup_stats(session, infra_id, resolution, start_ms, end_ms, bucket_ms, metrics)
+        else:
+            arrays = await self.metrics_service.scan_metrics(session, infra_id, start_ms, end_ms, metrics)
+            starts, stats = bucket_stats(arrays, bucket_ms, metrics, functions)
+
+        series = render_series(starts, stats, bucket_ms, metrics, functions, window)
+        if DEBUG:
+            logger.debug(f"Aggregated {len(series)} buckets of infra {infra_id} from {resolution or 'raw'} points")
+        return {"source": resolution or "raw", "series": series}
+
+    async def downsample(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: int,
+        end_ms: Optional[int],
+        metrics: List[str],
+        points: int
+    ) -> Dict[str, Any]:
+        """At most `points` points per metric picked by LTTB, oldest first, as
+        {<metric>: {"event_time": [...], "value": [...]}}"""
+        arrays = await self.metrics_service.scan_metrics(session, infra_id, start_ms, end_ms, metrics)
+        order = np.argsort(arrays["event_time"], kind="stable")
+        event_times = arrays["event_time"][order].astype(np.int64)
+        values = np.vstack([arrays[metric][order] for metric in metrics])
+        kept = lttb(event_times.astype(np.float64), values, points)
+
+        series = {}
+        for i, metric in enumerate(metrics):
+            metric_values = values[i, kept[i]]
+            series[metric] = {
+                "event_time": event_times[kept[i]].tolist(),
+                "value": [
+                    value if finite else None
+                    for value, finite in zip(metric_values.tolist(), np.isfinite(metric_values).tolist())
+                ]
+            }
+        if DEBUG:
+            logger.debug(f"Downsampled {len(event_times)} points of infra {infra_id} to {kept.shape[1]} per metric")
+        return {"source_points": len(event_times), "series": series}
+
+    async def quantiles(
+        self,
+        session: AsyncSession,
+        infra_ids: List[int],
+        start_ms: int,
+        end_ms: int,
+        metrics: List[str],
+        percentiles: List[str]
+    ) -> Dict[str, Any]:
+        """Percentiles of each metric over the range, every infrastructure of `infra_ids` pooled.
+
+        The range is widened to whole minutes and tiled with as few rollup buckets as possible
+        (days inside, hours then minutes at the edges), whose sketches are merged: the cost
+        follows the number of buckets and values are within quantile_sketch.RELATIVE_ACCURACY.
+        Without rollups the raw points are scanned and percentiles are exact."""
+        finest = min(self.resolutions.values())
+        start_ms -= start_ms % finest
+        stop_ms = end_ms + 1 + (-(end_ms + 1) % finest)
+        qs = [float(percentile[1:]) / 100 for percentile in percentiles]
+
+        if not ROLLUPS_ENABLED:
+            arrays = [
+                await self.metrics_service.scan_metrics(session, infra_id, start_ms, stop_ms - 1, metrics)
+                for infra_id in infra_ids
+            ]
+            result = {}
+            for metric in metrics:
+                values = np.concatenate([array[metric] for array in arrays])
+                values = values[~np.isnan(values)]
+                points = np.percentile(values, [q * 100 for q in qs]).tolist() if len(values) else [None] * len(qs)
+                result[metric] = {"count": len(values), **dict(zip(percentiles, points))}
+            return {"source": "raw", "start_ms": start_ms, "end_ms": stop_ms - 1, "sketches": 0, "quantiles": result}
+
+        segments = cover_range(start_ms, stop_ms, self.resolutions)
+        result = await session.execute(
+            select(MetricsRollup.metric, MetricsRollup.min_value, MetricsRollup.max_value, MetricsRollup.sketch)
+            .where(
+                MetricsRollup.infra_id.in_(infra_ids),
+                MetricsRollup.metric.in_(metrics),
+                or_(*(
+                    and_(
+                        MetricsRollup.resolution == resolution,
+                        MetricsRollup.bucket_start >= first,
+                        MetricsRollup.bucket_start < stop
+                    )
+                    for resolution, first, stop in segments
+                ))
+            )
+        )
+        rows = result.all()
+        by_metric: Dict[str, List] = {metric: [] for metric in metrics}
+        for row in rows:
+            by_metric[row.metric].append(row)
+
+        quantiles = {}
+        for metric, metric_rows in by_metric.items():
+            sketch = quantile_sketch.merge([row.sketch for row in metric_rows])
+            low = min((row.min_value for row in metric_rows), default=0.0)
+            high = max((row.max_value for row in metric_rows), default=0.0)
+            values = quantile_sketch.quantiles(sketch, qs, low, high)
+            quantiles[metric] = {"count": int(sketch[1].sum()), **dict(zip(percentiles, values))}
+        if DEBUG:
+            logger.debug(f"Merged {len(rows)} sketches of {len(segments)} segments for infras {infra_ids}")
+        return {
+            "source": "sketches",
+            "start_ms": start_ms,
+            "end_ms": stop_ms - 1,
+            "sketches": len(rows),
+            "quantiles": quantiles
+        }
+
+    def _rollup_resolution(
+        self,
+        start_ms: int,
+        end_ms: Optional[int],
+        bucket_ms: int,
+        metrics: List[str],
+        functions: List[str]
+    ) -> Optional[str]:
+        """Coarsest rollup resolution whose buckets tile both the range and the requested buckets"""
+        if not ROLLUPS_ENABLED or not set(functions) <= ROLLUP_FUNCTIONS or not set(metrics) <= set(ROLLUP_METRICS):
+            return None
+        for resolution, size in sorted(self.resolutions.items(), key=lambda item: -item[1]):
+            if bucket_ms % size == 0 and start_ms % size == 0 and (end_ms is None or (end_ms + 1) % size == 0):
+                return resolution
+        return None
+
+    async def _rollup_stats(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        resolution: str,
+        start_ms: int,
+        end_ms: Optional[int],
+        bucket_ms: int,
+        metrics: List[str]
+    ) -> Tuple[np.ndarray, Dict[str, BucketStats]]:
+        conditions = [
+            MetricsRollup.infra_id == infra_id,
+            MetricsRollup.resolution == resolution,
+            MetricsRollup.metric.in_(metrics),
+            MetricsRollup.bucket_start >= start_ms
+        ]
+        if end_ms is not None:
+            conditions.append(MetricsRollup.bucket_start <= end_ms)
+        result = await session.execute(
+            select(
+                MetricsRollup.metric, MetricsRollup.bucket_start, MetricsRollup.count,
+                MetricsRollup.sum_value, MetricsRollup.min_value, MetricsRollup.max_value
+            ).where(*conditions)
+        )
+        rows = result.all()
+        metric_index = np.array([metrics.index(row[0]) for row in rows], dtype=np.int64)
+        values = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), 5)
+
+        keys = values[:, 0].astype(np.int64)
+        starts, inverse = np.unique(keys - keys % bucket_ms, return_inverse=True)
+        k = len(starts)
+        stats = {}
+        for j, metric in enumerate(metrics):
+            selected = metric_index == j
+            inv = inverse[selected]
+            counts, sums, mins, maxs = (values[selected, column] for column in range(1, 5))
+            metric_mins = np.full(k, np.inf)
+            np.minimum.at(metric_mins, inv, mins)
+            metric_maxs = np.full(k, -np.inf)
+            np.maximum.at(metric_maxs, inv, maxs)
+            stats[metric] = {
+                "count": np.bincount(inv, weights=counts, minlength=k),
+                "sum": np.bincount(inv, weights=sums, minlength=k),
+                "min": metric_mins,
+                "max": metric_maxs
+            }
+        return starts, stats
+
+
+def cover_range(start_ms: int, stop_ms: int, resolutions: Dict[str, int]) -> List[Tuple[str, int, int]]:
+    """(resolution, first bucket start, stop) segments tiling [start_ms, stop_ms), both multiples
+    of the finest resolution, coarsest buckets in the middle and finer ones at the edges"""
+    ordered = sorted(resolutions.items(), key=lambda item: -item[1])
+
+    def split(start: int, stop: int, level: int) -> List[Tuple[str, int, int]]:
+        if start >= stop:
+            return []
+        resolution, size = ordered[level]
+        if level == len(ordered) - 1:
+            return [(resolution, start, stop)]
+        first, last = start + (-start % size), stop - stop % size
+        if first >= last:
+            return split(start, stop, level + 1)
+        return split(start, first, level + 1) + [(resolution, first, last)] + split(last, stop, level + 1)
+
+    return split(start_ms, stop_ms, 0)
+
+
+def bucket_stats(
+    arrays: Dict[str, np.ndarray],
+    bucket_ms: int,
+    metrics: List[str],
+    functions: List[str]
+) -> Tuple[np.ndarray, Dict[str, BucketStats]]:
+    """Bucket starts (ascending) and per metric count, sum, then min/max/stddev/percentiles
+    when requested, one value per bucket. NaN values are ignored."""
+    event_times = arrays["event_time"].astype(np.int64)
+    starts, inverse = np.unique(event_times - event_times % bucket_ms, return_inverse=True)
+    k = len(starts)
+    percentiles = [function for function in functions if PERCENTILE_PATTERN.fullmatch(function)]
+
+    # points grouped by bucket, every bucket holds at least one point
+    grouping = np.argsort(inverse, kind="stable")
+    sizes = np.bincount(inverse, minlength=k)
+    firsts = np.cumsum(sizes) - sizes
+
+    stats = {}
+    for metric in metrics:
+        values = arrays[metric]
+        present = ~np.isnan(values)
+        counts = np.bincount(inverse[present], minlength=k).astype(np.float64)
+        sums = np.bincount(inverse[present], weights=values[present], minlength=k)
+        metric_stats = {"count": counts, "sum": sums}
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if "stddev" in functions:
+                deviations = values[present] - (sums / counts)[inverse[present]]
+                metric_stats["stddev"] = np.sqrt(np.bincount(inverse[present], weights=deviations * deviations, minlength=k) / counts)
+            if k and "min" in functions:
+                metric_stats["min"] = np.fmin.reduceat(values[grouping], firsts)
+            if k and "max" in functions:
+                metric_stats["max"] = np.fmax.reduceat(values[grouping], firsts)
+
+            if percentiles:
+                # values sorted by bucket then value with one sort: each bucket is offset past the
+                # span of the values, so buckets end up as contiguous sorted runs
+                inv, present_values = inverse[present], values[present]
+                low = present_values.min() if len(present_values) else 0.0
+                span = 2 * (present_values.max() - low) + 1 if len(present_values) else 1.0
+                sorted_values = present_values[np.argsort(inv * span + (present_values - low))]
+                metric_sizes = counts.astype(np.int64)
+                metric_firsts = np.cumsum(metric_sizes) - metric_sizes
+                filled = metric_sizes > 0
+                for name in percentiles:
+                    # linear interpolation between the closest ranks, as numpy.percentile
+                    result = np.full(k, np.nan)
+                    position = metric_firsts[filled] + float(name[1:]) / 100 * (metric_sizes[filled] - 1)
+                    lower = np.floor(position).astype(np.int64)
+                    upper = np.ceil(position).astype(np.int64)
+                    result[filled] = sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+                    metric_stats[name] = result
+        stats[metric] = metric_stats
+    return starts, stats
+
+
+def render_series(
+    starts: np.ndarray,
+    stats: Dict[str, BucketStats],
+    bucket_ms: int,
+    metrics: List[str],
+    functions: List[str],
+    window: int
+) -> List[Dict[str, Any]]:
+    columns: Dict[Tuple[str, str], List[Optional[float]]] = {}
+    for metric in metrics:
+        metric_stats = stats[metric]
+        counts, sums = metric_stats["count"], metric_stats["sum"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for function in functions:
+                if function == "avg":
+                    values = sums / counts
+                elif function == "rolling_mean":
+                    # points of the last `window` bucket widths, gaps included
+                    cumulative_sums = np.concatenate([[0.0], np.cumsum(sums)])
+                    cumulative_counts = np.concatenate([[0.0], np.cumsum(counts)])
+                    firsts = np.searchsorted(starts, starts - (window - 1) * bucket_ms)
+                    ends = np.arange(1, len(starts) + 1)
+                    values = (cumulative_sums[ends] - cumulative_sums[firsts]) / (cumulative_counts[ends] - cumulative_counts[firsts])
+                else:
+                    values = metric_stats[function]
+                values = np.where(counts > 0, values, np.nan) if function != "count" else values
+                cast = int if function == "count" else float
+                columns[(metric, function)] = [
+                    cast(value) if finite else None
+                    for value, finite in zip(values.tolist(), np.isfinite(values).tolist())
+                ]
+
+    series = []
+    for i, start in enumerate(starts.tolist()):
+        point = {"timestamp": format_timestamp_ms(start), "event_time": start}
+        for metric in metrics:
+            point[metric] = {function: columns[(metric, function)][i] for function in functions}
+        series.append(point)
+    return series
@@ -1,7 +1,11 @@
 from typing import Dict, Any, List
+import itertools
 import logging
-from collections import deque, defaultdict
+from collections import OrderedDict, deque, defaultdict
+from sqlalchemy import event
+from db import Base
 from models.anomaly import Anomaly, AnomalyResult, AnomalyType
+from models.sql import Infrastructure
 import statistics
 import os
 from datetime import datetime
@@ -9,10 +13,16 @@ import re
 
 logger = logging.getLogger(__name__)
 DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+ANOMALY_DETECTORS_MAX_INFRAS = int(os.getenv("ANOMALY_DETECTORS_MAX_INFRAS", "256"))
+
+# shared by every detector, a detector created again after an eviction never reuses a revision
+_revisions = itertools.count(1)
 
 
 class AnomalyDetectionService:
     def __init__(self):
+        # bumped whenever the history changes, identifies a history summary
+        self.revision = 0
         self.history = {
             "network_in_kbps": deque(maxlen=5),
             "network_out_kbps": deque(maxlen=5),
@@ -96,6 +106,7 @@ class AnomalyDetectionService:
             anomaly_result = self.detect_anomalies(metrics)
             analyzed_timeline.append({
                 "timestamp": metrics.get("timestamp"),
+                "event_time": metrics.get("event_time"),
                 "anomalies": [anomaly.model_dump() for anomaly in anomaly_result.anomalies],
                 "has_issues": anomaly_result.has_anomalies,
                 "total_count": anomaly_result.total_count
@@ -158,7 +169,10 @@ class AnomalyDetectionService:
         hourly_anomalies = defaultdict(list)
         
         for point in analyzed_timeline:
-            if point["timestamp"]:
+            if point.get("event_time") is not None:
+                # epoch milliseconds from the metrics table, no parsing needed
+                hourly_anomalies[(point["event_time"] // 3_600_000) % 24].append(point["total_count"])
+            elif point["timestamp"]:
                 try:
                     if isinstance(point["timestamp"], str):
                         dt = datetime.fromisoformat(point["timestamp"].replace('Z', '+00:00'))
@@ -352,6 +366,7 @@ class AnomalyDetectionService:
         return None
 
     def _update_history(self, metrics: Dict[str, Any]):
+        self.revision = next(_revisions)
         for metric in self.history.keys():
             if metric in metrics:
                 self.history[metric].append(metrics[metric])
@@ -366,4 +381,44 @@ class AnomalyDetectionService:
                 "average": statistics.mean(history) if len(history) > 0 else None
             }
             for metric, history in self.history.items()
-        } 
\ No newline at end of file
+        } 
+
+
+class AnomalyDetectorRegistry:
+    """One AnomalyDetectionService per infrastructure id, so relative thresholds compare
+    against the history of the same infrastructure. At most `max_infras` detectors are kept,
+    the least recently used one is dropped (its history starts over on next use)."""
+
+    def __init__(self, max_infras: int = ANOMALY_DETECTORS_MAX_INFRAS):
+        self.max_infras = max_infras
+        self._detectors: "OrderedDict[int, AnomalyDetectionService]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, infra_id: int) -> AnomalyDetectionService:
+        detector = self._detectors.get(infra_id)
+        if detector is None:
+            detector = self._detectors[infra_id] = AnomalyDetectionService()
+            while len(self._detectors) > self.max_infras:
+                self._detectors.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._detectors.move_to_end(infra_id)
+        return detector
+
+    def clear(self):
+        self._detectors.clear()
+
+    def __len__(self) -> int:
+        return len(self._detectors)
+
+
+anomaly_detectors = AnomalyDetectorRegistry()
+
+
+def _clear(*args, **kwargs):
+    # infrastructure ids can be reused once their rows are gone
+    anomaly_detectors.clear()
+
+
+event.listen(Infrastructure, "after_delete", _clear)
+event.listen(Base.metadata, "after_drop", _clear)
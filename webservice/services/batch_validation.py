@@ -0,0 +1,141 @@
+from typing import Dict, Any, List, Sequence, Tuple
+from datetime import datetime
+from itertools import compress
+from operator import itemgetter
+import logging
+import numpy as np
+from models.validation import ValidationError
+from services.time_utils import parse_timestamp_ms
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnarBatchValidator:
+    """Validates a batch as one array per field instead of one dict at a time.
+
+    Each field is gathered once for the whole batch. Types are checked per column (strict:
+    `bool` is not an int), the `min`/`max` rules of `field_validations` are vectorized
+    comparisons on a float64 column and `service_status` values are checked with `np.isin`
+    against `valid_statuses`. The checks are ANDed into one row mask, only the rows it
+    rejects go through the per-row validator to build their errors, so the error format is
+    the same on both paths. Valid rows are rebuilt from the columns.
+    """
+
+    def __init__(self, validation_service):
+        self.validation_service = validation_service
+        self.numeric_fields = [
+            field for field in validation_service.required_fields
+            if field in validation_service.field_validations
+        ]
+        self.float_fields = {
+            field for field in self.numeric_fields
+            if validation_service.field_validations[field]["type"] is float
+        }
+        self.required_services = validation_service.required_services
+        self.valid_statuses = np.array(validation_service.valid_statuses, dtype=object)
+        self.scalar_fields = ["timestamp", *self.numeric_fields]
+
+    def validate(self, metrics_list: List[Any]) -> Tuple[np.ndarray, Dict[int, List[ValidationError]], List[Dict[str, Any]]]:
+        """Returns the row mask, the errors of every rejected row keyed by row index and the
+        valid rows, restricted to the schema fields and ready for bulk persistence"""
+        mask = _has_type(metrics_list, dict)
+        rows = metrics_list if mask.all() else [row if ok else {} for row, ok in zip(metrics_list, mask.tolist())]
+
+        timestamps, *numeric, statuses = _columns(rows, [*self.scalar_fields, "service_status"])
+        mask &= self._check_timestamps(timestamps)
+        columns = [timestamps]
+        for field, values in zip(self.numeric_fields, numeric):
+            valid, values = self._check_numeric(field, values)
+            mask &= valid
+            columns.append(values)
+        valid, service_columns = self._check_service_status(statuses)
+        mask &= valid
+
+        errors = {}
+        for index in np.flatnonzero(~mask).tolist():
+            errors[index] = self.validation_service.row_errors(metrics_list[index])
+
+        valid_rows = [
+            dict(zip(self.scalar_fields, values), service_status=dict(zip(self.required_services, services)))
+            for values, services in compress(zip(zip(*columns), zip(*service_columns)), mask.tolist())
+        ]
+        return mask, errors, valid_rows
+
+    @staticmethod
+    def _check_timestamps(values: Sequence[Any]) -> np.ndarray:
+        valid = _has_type(values, str)
+        # parsing has no vectorized equivalent: one pass over the column, value by value
+        # only to find the invalid ones (parse_timestamp_ms accepts what fromisoformat accepts)
+        try:
+            list(map(datetime.fromisoformat, compress(values, valid.tolist())))
+        except ValueError:
+            for index in np.flatnonzero(valid).tolist():
+                try:
+                    parse_timestamp_ms(values[index])
+                except ValueError:
+                    valid[index] = False
+        return valid
+
+    def _check_numeric(self, field: str, values: Sequence[Any]) -> Tuple[np.ndarray, Sequence[Any]]:
+        """Mask of the valid values, and the column as returned by the per-row validator
+        (ints of float fields become floats)"""
+        validation = self.validation_service.field_validations[field]
+        is_float = field in self.float_fields
+        # strict floats still accept ints
+        valid = _has_type(values, int, float) if is_float else _has_type(values, int)
+        if not valid.any():
+            return valid, values
+
+        typed_values = values if valid.all() else [value if ok else 0 for value, ok in zip(values, valid.tolist())]
+        try:
+            column = np.array(typed_values, dtype=np.float64)
+        except OverflowError:
+            # ints beyond float64, the comparisons below run on the python ints
+            column = _objects(typed_values)
+
+        if "min" in validation:
+            valid &= column >= validation["min"]
+        if "max" in validation:
+            valid &= column <= validation["max"]
+        if not is_float:
+            return valid, values
+        if column.dtype == np.float64:
+            return valid, column.tolist()
+        return valid, [float(value) if ok else value for value, ok in zip(values, valid.tolist())]
+
+    def _check_service_status(self, statuses: Sequence[Any]) -> Tuple[np.ndarray, List[Sequence[Any]]]:
+        """Mask of the valid status objects, and one column per required service"""
+        valid = _has_type(statuses, dict)
+        objects = statuses if valid.all() else [value if ok else {} for value, ok in zip(statuses, valid.tolist())]
+        columns = _columns(objects, self.required_services)
+        for values in columns:
+            is_str = _has_type(values, str)
+            # only strings are compared, isin would treat nested lists as more values
+            strings = values if is_str.all() else [value if ok else None for value, ok in zip(values, is_str.tolist())]
+            valid &= is_str & np.isin(_objects(strings), self.valid_statuses)
+        return valid, columns
+
+
+def _columns(rows: List[Dict[str, Any]], keys: List[str]) -> List[Sequence[Any]]:
+    """One sequence per key (None where a row lacks it), gathered in a single pass"""
+    try:
+        return list(zip(*map(itemgetter(*keys), rows))) if rows else [() for _ in keys]
+    except KeyError:
+        return list(zip(*([row.get(key) for key in keys] for row in rows)))
+
+
+def _objects(values: Sequence[Any]) -> np.ndarray:
+    # np.array would turn equal length strings into a str dtype
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _has_type(values: Sequence[Any], *classes: type) -> np.ndarray:
+    """Mask of the values of exactly one of `classes`, a regular column has a single type"""
+    present = set(map(type, values))
+    if present.issubset(classes):
+        return np.ones(len(values), dtype=bool)
+    if present.isdisjoint(classes):
+        return np.zeros(len(values), dtype=bool)
+    return np.fromiter((type(value) in classes for value in values), dtype=bool, count=len(values))
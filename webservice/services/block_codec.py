@@ -0,0 +1,115 @@
+from typing import List, Optional, Tuple
+import json
+import struct
+import zlib
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 2: adds the timestamp strings, version 1 blocks still decode (empty timestamps)
+BLOCK_FORMAT_VERSION = 2
+CODEC_ZLIB = 0
+CODEC_ZSTD = 1
+
+# version, codec, point count, metric count, status column count, dictionary length
+_HEADER_V1 = struct.Struct("<BBIBBH")
+# version 2 adds the length of the timestamp text
+_HEADER = struct.Struct("<BBIBBHI")
+
+
+def encode_block(event_times: np.ndarray, values: np.ndarray, statuses: np.ndarray, timestamps: Optional[np.ndarray] = None) -> bytes:
+    """Pack one block of points.
+
+    - event_times (n,) int64: delta-of-delta, zigzag encoded
+    - values (n, m) float64: each column XORed with its previous value
+    - statuses (n, s) str: dictionary encoded to one byte per value
+    - timestamps (n,) str: newline separated, left empty by callers for the points whose
+      timestamp is the event time's default rendering (all empty when omitted)
+
+    Integer and XOR columns are byte-shuffled (all first bytes, then all second bytes...)
+    before compression, so the zero high bytes of regular timestamps and slowly changing
+    values collapse into long runs.
+    """
+    n = len(event_times)
+    event_times = np.ascontiguousarray(event_times, dtype=np.int64)
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    statuses = np.asarray(statuses, dtype=object)
+
+    deltas = np.diff(event_times, prepend=0)
+    dod = np.diff(deltas, prepend=0)
+    zigzag = ((dod << 1) ^ (dod >> 63)).view(np.uint64)
+
+    bits = values.T.copy().view(np.uint64)
+    xored = bits.copy()
+    xored[:, 1:] ^= bits[:, :-1]
+
+    dictionary = sorted(set(statuses.ravel().tolist()))
+    codes = np.searchsorted(np.array(dictionary, dtype=object), statuses.T.ravel()).astype(np.uint8)
+
+    text = "\n".join(timestamps.tolist() if timestamps is not None else [""] * n).encode()
+
+    payload = b"".join([_shuffle(zigzag), *(_shuffle(column) for column in xored), codes.tobytes(), text])
+    if zstandard is not None:
+        codec, compressed = CODEC_ZSTD, zstandard.ZstdCompressor(level=3).compress(payload)
+    else:
+        codec, compressed = CODEC_ZLIB, zlib.compress(payload, 6)
+
+    encoded_dictionary = json.dumps(dictionary).encode()
+    header = _HEADER.pack(BLOCK_FORMAT_VERSION, codec, n, values.shape[1], statuses.shape[1], len(encoded_dictionary), len(text))
+    return header + encoded_dictionary + compressed
+
+
+def decode_block(data: bytes) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Inverse of encode_block: (event_times (n,), values (n, m), statuses (n, s), timestamps (n,))"""
+    version = data[0]
+    if version == 1:
+        header = _HEADER_V1
+        _, codec, n, m, s, dictionary_length = header.unpack_from(data)
+        text_length = 0
+    elif version == BLOCK_FORMAT_VERSION:
+        header = _HEADER
+        _, codec, n, m, s, dictionary_length, text_length = header.unpack_from(data)
+    else:
+        raise ValueError(f"Unsupported block format version {version}")
+
+    offset = header.size
+    dictionary: List[str] = json.loads(data[offset:offset + dictionary_length])
+    compressed = data[offset + dictionary_length:]
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Block is zstd compressed but zstandard is not installed")
+        payload = zstandard.ZstdDecompressor().decompress(compressed, max_output_size=n * (8 * (m + 1) + s) + text_length)
+    else:
+        payload = zlib.decompress(compressed)
+
+    column_bytes = 8 * n
+    zigzag = _unshuffle(payload[:column_bytes], n)
+    dod = (zigzag >> np.uint64(1)).view(np.int64) ^ -(zigzag & np.uint64(1)).view(np.int64)
+    event_times = np.cumsum(np.cumsum(dod))
+
+    values = np.empty((m, n), dtype=np.float64)
+    for j in range(m):
+        start = column_bytes * (j + 1)
+        xored = _unshuffle(payload[start:start + column_bytes], n)
+        values[j] = np.bitwise_xor.accumulate(xored).view(np.float64)
+
+    codes = np.frombuffer(payload, dtype=np.uint8, count=n * s, offset=column_bytes * (m + 1))
+    statuses = np.array(dictionary, dtype=object)[codes].reshape(s, n)
+
+    timestamps = np.full(n, "", dtype=object)
+    if version != 1 and n:
+        text = payload[column_bytes * (m + 1) + n * s:]
+        timestamps[:] = text.decode().split("\n")
+
+    return event_times, values.T, statuses.T, timestamps
+
+
+def _shuffle(column: np.ndarray) -> bytes:
+    return column.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(data: bytes, n: int) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8).reshape(8, n).T.copy().view(np.uint64).ravel()
@@ -0,0 +1,265 @@
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
+import functools
+import logging
+import os
+import numpy as np
+from sqlalchemy import Float, Integer, BigInteger, delete, desc, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db import AsyncSessionLocal
+from models.sql import Metrics, MetricsBlock
+from services.block_codec import encode_block, decode_block
+from services.metrics_counters import metrics_counters
+from services.row_merge import iter_chunks_newest_first
+from services.time_utils import format_timestamp_ms
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+# "table": one metrics row per point, "blocks": compressed blocks of METRICS_BLOCK_POINTS points
+METRICS_STORAGE = os.getenv("METRICS_STORAGE", "table").lower()
+METRICS_BLOCK_POINTS = int(os.getenv("METRICS_BLOCK_POINTS", "1024"))
+# ids per DELETE of sealed staged rows, below SQLite's bound parameter limit
+STAGED_DELETE_CHUNK_SIZE = 500
+
+BLOCK_METRICS = [
+    column.name for column in Metrics.__table__.columns
+    if isinstance(column.type, (Float, Integer)) and not isinstance(column.type, BigInteger)
+    and column.name not in ("id", "infra_id", "user_id")
+]
+INTEGER_METRICS = {column.name for column in Metrics.__table__.columns if column.name in BLOCK_METRICS and isinstance(column.type, Integer)}
+STATUS_COLUMNS = ["service_status_database", "service_status_api_gateway", "service_status_cache"]
+
+# event times, values, statuses, timestamps ("" where it is the UTC rendering of the event time)
+Columns = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+class BlockStorage:
+    """Metrics packed per infrastructure into compressed blocks of `block_points` points
+    (see `block_codec`), stored in `metrics_blocks`.
+
+    Points are staged as plain `metrics` rows, which every read already covers, until the
+    infrastructure has `block_points` of them. The oldest staged and new points are then encoded
+    into full blocks, the staged ones deleted and only the remainder staged, so each point is
+    encoded once whatever the ingest batch size and every block holds exactly `block_points` points. Reads decode only the blocks overlapping the requested range.
+
+    Points sharing an event time have no id to order them: reads return the most recently
+    stored first (staged rows, then later blocks, then descending position in the block), like
+    the hot window, so keyset cursors can count them (see `row_merge.next_cursor`).
+    """
+
+    def __init__(self, enabled: bool = METRICS_STORAGE == "blocks", block_points: int = METRICS_BLOCK_POINTS):
+        self.enabled = enabled
+        self.block_points = block_points
+
+    async def insert_rows(self, session: AsyncSession, infra_id: int, rows: List[Dict[str, Any]]):
+        """Add metrics rows (the column dicts written to the metrics table), the caller owns the transaction"""
+        staged_conditions = [Metrics.infra_id == infra_id, Metrics.event_time.is_not(None)]
+        staged_count = await session.scalar(select(func.count()).select_from(Metrics).where(*staged_conditions))
+        points = (staged_count + len(rows)) // self.block_points * self.block_points
+        if not points:
+            await self._stage(session, rows)
+            return
+
+        result = await session.execute(
+            select(*[getattr(Metrics, column) for column in ["id", "event_time", "timestamp", *BLOCK_METRICS, *STATUS_COLUMNS]])
+            .where(*staged_conditions)
+            .order_by(Metrics.event_time, Metrics.id)
+        )
+        staged = [dict(row) for row in result.mappings()]
+        # staged rows come first, the stable sort keeps equal event times in the order they were stored
+        combined = staged + rows
+        event_times, values, statuses, timestamps = self._rows_to_columns(combined)
+        order = np.argsort(event_times, kind="stable")
+        for start in range(0, points, self.block_points):
+            chunk = order[start:start + self.block_points]
+            session.add(MetricsBlock(
+                infra_id=infra_id,
+                start_time=int(event_times[chunk[0]]),
+                end_time=int(event_times[chunk[-1]]),
+                point_count=len(chunk),
+                data=encode_block(event_times[chunk], values[chunk], statuses[chunk], timestamps[chunk])
+            ))
+
+        sealed = order[:points]
+        sealed_ids = [combined[i]["id"] for i in sealed.tolist() if i < len(staged)]
+        for start in range(0, len(sealed_ids), STAGED_DELETE_CHUNK_SIZE):
+            await session.execute(delete(Metrics).where(Metrics.id.in_(sealed_ids[start:start + STAGED_DELETE_CHUNK_SIZE])))
+        remaining = np.sort(order[points:])
+        await self._stage(session, [combined[i] for i in remaining.tolist() if i >= len(staged)])
+        await session.flush()
+
+        if DEBUG:
+            logger.debug(f"Sealed {points} points of infra {infra_id} in {points // self.block_points} blocks")
+
+    @staticmethod
+    async def _stage(session: AsyncSession, rows: List[Dict[str, Any]]):
+        if rows:
+            await session.execute(insert(Metrics), rows)
+
+    async def get_metrics_range(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        limit: int,
+        columns: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Most recent `limit` points in the range, newest first, as flat metrics column dicts"""
+        selected: Optional[Columns] = None
+        for end_time, data in await self._blocks(session, infra_id, start_ms, end_ms, newest_first=True):
+            # blocks come newest first, stop once none of the remaining ones can make the cut
+            if selected is not None and len(selected[0]) >= limit and end_time < selected[0][-1]:
+                break
+            block = self._newest_first(self._slice(decode_block(await data()), start_ms, end_ms))
+            if selected is not None:
+                block = tuple(np.concatenate(pair) for pair in zip(selected, block))
+            order = np.argsort(-block[0], kind="stable")[:limit]
+            selected = tuple(column[order] for column in block)
+
+        if selected is None:
+            return []
+        return self._columns_to_rows(selected, columns)
+
+    async def iter_range(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        columns: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Every point in the range, newest first, one block decoded at a time"""
+        async def load(data):
+            return self._columns_to_rows(self._newest_first(self._slice(decode_block(await data()), start_ms, end_ms)), columns)
+
+        chunks = [
+            (end_time, functools.partial(load, data))
+            for end_time, data in await self._blocks(session, infra_id, start_ms, end_ms, newest_first=True)
+        ]
+        async for row in iter_chunks_newest_first(chunks):
+            yield row
+
+    async def scan(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int] = None,
+        end_ms: Optional[int] = None
+    ) -> Dict[str, np.ndarray]:
+        """Every point in the range as one NumPy array per column, oldest first"""
+        blocks = [
+            self._slice(decode_block(await data()), start_ms, end_ms)
+            for _, data in await self._blocks(session, infra_id, start_ms, end_ms, newest_first=False)
+        ]
+        if blocks:
+            event_times, values, statuses, _ = (np.concatenate(columns) for columns in zip(*blocks))
+        else:
+            event_times, values, statuses, _ = self._rows_to_columns([])
+        order = np.argsort(event_times, kind="stable")
+
+        arrays = {"event_time": event_times[order]}
+        for j, metric in enumerate(BLOCK_METRICS):
+            arrays[metric] = values[order, j]
+        for j, column in enumerate(STATUS_COLUMNS):
+            arrays[column] = statuses[order, j]
+        return arrays
+
+    async def iter_rows(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        columns: Optional[List[str]] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every point of an infrastructure, one list per block"""
+        for _, data in await self._blocks(session, infra_id, None, None, newest_first=False):
+            yield self._columns_to_rows(decode_block(await data()), columns)
+
+    async def count_points(self, session: AsyncSession, infra_id: int) -> int:
+        result = await session.execute(
+            select(func.coalesce(func.sum(MetricsBlock.point_count), 0)).where(MetricsBlock.infra_id == infra_id)
+        )
+        return result.scalar()
+
+    async def purge(self, infra_id: int, cutoff_ms: int) -> int:
+        """Delete the blocks whose points are all older than cutoff_ms, returns the number of points"""
+        conditions = [MetricsBlock.infra_id == infra_id, MetricsBlock.end_time < cutoff_ms]
+        async with AsyncSessionLocal() as session:
+            points = await session.scalar(select(func.coalesce(func.sum(MetricsBlock.point_count), 0)).where(*conditions))
+            if points:
+                await session.execute(delete(MetricsBlock).where(*conditions))
+                await metrics_counters.remove(session, infra_id, points)
+                await session.commit()
+        return points
+
+    async def _blocks(self, session: AsyncSession, infra_id: int, start_ms: Optional[int], end_ms: Optional[int], newest_first: bool):
+        """(end_time, loader) of the blocks overlapping the range, each block payload is only
+        fetched when its loader is awaited"""
+        conditions = [MetricsBlock.infra_id == infra_id]
+        if start_ms is not None:
+            conditions.append(MetricsBlock.end_time >= start_ms)
+        if end_ms is not None:
+            conditions.append(MetricsBlock.start_time <= end_ms)
+        order = (desc(MetricsBlock.end_time), desc(MetricsBlock.id)) if newest_first else (MetricsBlock.start_time, MetricsBlock.id)
+        result = await session.execute(
+            select(MetricsBlock.id, MetricsBlock.end_time)
+            .where(*conditions)
+            .order_by(*order)
+        )
+
+        def loader(block_id):
+            async def load():
+                return await session.scalar(select(MetricsBlock.data).where(MetricsBlock.id == block_id))
+            return load
+
+        return [(end_time, loader(block_id)) for block_id, end_time in result.all()]
+
+    @staticmethod
+    def _slice(block: Columns, start_ms: Optional[int], end_ms: Optional[int]) -> Columns:
+        event_times = block[0]
+        mask = np.ones(len(event_times), dtype=bool)
+        if start_ms is not None:
+            mask &= event_times >= start_ms
+        if end_ms is not None:
+            mask &= event_times <= end_ms
+        return tuple(column[mask] for column in block)
+
+    @staticmethod
+    def _newest_first(block: Columns) -> Columns:
+        # blocks are stably sorted by event time, reversed the latest stored point of an event time comes first
+        return tuple(column[::-1] for column in block)
+
+    @staticmethod
+    def _rows_to_columns(rows: List[Dict[str, Any]]) -> Columns:
+        n = len(rows)
+        event_times = np.fromiter((row["event_time"] for row in rows), dtype=np.int64, count=n)
+        values = np.array([[row[metric] for metric in BLOCK_METRICS] for row in rows], dtype=np.float64).reshape(n, len(BLOCK_METRICS))
+        statuses = np.array([[row[column] for column in STATUS_COLUMNS] for row in rows], dtype=object).reshape(n, len(STATUS_COLUMNS))
+        timestamps = np.array([
+            "" if row["timestamp"] == format_timestamp_ms(row["event_time"]) else row["timestamp"] for row in rows
+        ], dtype=object).reshape(n)
+        return event_times, values, statuses, timestamps
+
+    @staticmethod
+    def _columns_to_rows(block: Columns, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        event_times, values, statuses, timestamps = block
+        wanted = set(columns) if columns else None
+        series = {"event_time": event_times.tolist()}
+        for j, metric in enumerate(BLOCK_METRICS):
+            column = values[:, j]
+            series[metric] = column.astype(np.int64).tolist() if metric in INTEGER_METRICS else column.tolist()
+        for j, column in enumerate(STATUS_COLUMNS):
+            series[column] = statuses[:, j].tolist()
+        if wanted is not None:
+            series = {name: column for name, column in series.items() if name in wanted or name == "event_time"}
+
+        names = list(series)
+        rows = [dict(zip(names, point)) for point in zip(*series.values())]
+        if wanted is None or "timestamp" in wanted:
+            for row, timestamp in zip(rows, timestamps.tolist()):
+                row["timestamp"] = timestamp or format_timestamp_ms(row["event_time"])
+        return rows
+
+
+block_storage = BlockStorage()
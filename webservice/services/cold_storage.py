@@ -0,0 +1,448 @@
+from typing import Dict, Any, List, Optional, AsyncIterator
+import asyncio
+import functools
+import logging
+import os
+import time
+import numpy as np
+from sqlalchemy import delete, desc, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db import AsyncSessionLocal, AsyncReadSessionLocal
+from models.sql import Infrastructure, Metrics, ColdPartition
+from services.metrics_counters import metrics_counters
+from services.row_merge import row_key, iter_chunks_newest_first
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+COLD_TIER_ENABLED = os.getenv("COLD_TIER_ENABLED", "false").lower() == "true"
+COLD_TIER_DIR = os.getenv("COLD_TIER_DIR", "./data/cold")
+COLD_TIER_AFTER_DAYS = int(os.getenv("COLD_TIER_AFTER_DAYS", "7"))
+COLD_TIER_INTERVAL = float(os.getenv("COLD_TIER_INTERVAL_S", "3600"))
+COLD_TIER_MAX_ROWS_PER_FILE = int(os.getenv("COLD_TIER_MAX_ROWS_PER_FILE", "100000"))
+COLD_TIER_COMPRESSION = os.getenv("COLD_TIER_COMPRESSION", "zstd")
+COLD_TIER_ROW_GROUP_SIZE = 16384
+
+DAY_MS = 86_400_000
+
+# metrics columns kept in the Parquet files, infra_id and user_id are implied by the partition
+COLD_COLUMNS = [
+    column.name for column in Metrics.__table__.columns if column.name not in ("infra_id", "user_id")
+]
+
+
+class ExportConflict(Exception):
+    """The rows of an exported file changed before it was registered"""
+
+
+def _arrow_schema():
+    types = {
+        "id": pyarrow.int64(),
+        "timestamp": pyarrow.string(),
+        "event_time": pyarrow.int64(),
+        "thread_count": pyarrow.int64(),
+        "active_connections": pyarrow.int64(),
+        "service_status_database": pyarrow.string(),
+        "service_status_api_gateway": pyarrow.string(),
+        "service_status_cache": pyarrow.string(),
+        "created_at": pyarrow.string()
+    }
+    return pyarrow.schema([(name, types.get(name, pyarrow.float64())) for name in COLD_COLUMNS])
+
+
+class ColdStorage:
+    """Parquet cold tier of the metrics table.
+
+    Whole UTC days older than `after_days` are exported per infrastructure to compressed
+    Parquet files (sorted by event time, at most `max_rows_per_file` rows each) and deleted
+    from SQLite. Each file is written, registered in `cold_partitions` and its rows deleted
+    in one writer transaction, so readers see every row exactly once, hot or cold.
+    """
+
+    def __init__(
+        self,
+        directory: str = COLD_TIER_DIR,
+        after_days: int = COLD_TIER_AFTER_DAYS,
+        interval: float = COLD_TIER_INTERVAL,
+        max_rows_per_file: int = COLD_TIER_MAX_ROWS_PER_FILE,
+        compression: str = COLD_TIER_COMPRESSION
+    ):
+        self.directory = directory
+        self.after_days = after_days
+        self.interval = interval
+        self.max_rows_per_file = max_rows_per_file
+        self.compression = compression
+
+        self._task: Optional[asyncio.Task] = None
+        self._run_lock = asyncio.Lock()
+
+        self.run_count = 0
+        self.exported_rows = 0
+        self.exported_files = 0
+        self.dropped_files = 0
+        self.files_read = 0
+        self.last_run_seconds = 0.0
+        self.last_run_at: Optional[float] = None
+
+    @property
+    def available(self) -> bool:
+        return pyarrow is not None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        if not self.available:
+            logger.warning("Cold tier enabled but pyarrow is not installed, tiering disabled")
+            return
+        self._task = asyncio.create_task(self._tiering_loop())
+        logger.info(f"Cold tier started (after={self.after_days}d, interval={self.interval:.0f}s, dir={self.directory})")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("Cold tier stopped")
+
+    async def run_once(self, now_ms: Optional[int] = None) -> Dict[str, Any]:
+        """Export every sealed day of every infrastructure"""
+        if not self.available:
+            raise RuntimeError("pyarrow is not installed")
+
+        async with self._run_lock:
+            start_time = time.time()
+            now_ms = now_ms if now_ms is not None else int(start_time * 1000)
+            cutoff_ms = now_ms - self.after_days * DAY_MS
+            cutoff_ms -= cutoff_ms % DAY_MS
+
+            async with AsyncSessionLocal() as session:
+                infra_ids = (await session.execute(select(Infrastructure.id).order_by(Infrastructure.id))).scalars().all()
+
+            rows = 0
+            files = 0
+            for infra_id in infra_ids:
+                while True:
+                    exported = await self._export_next_file(infra_id, cutoff_ms)
+                    if not exported:
+                        break
+                    rows += exported
+                    files += 1
+                    await asyncio.sleep(0)
+
+            elapsed = time.time() - start_time
+            self.run_count += 1
+            self.exported_rows += rows
+            self.exported_files += files
+            self.last_run_seconds = elapsed
+            self.last_run_at = time.monotonic()
+
+            if files:
+                logger.info(f"Cold tier exported {rows} rows to {files} Parquet files in {elapsed:.3f}s")
+            return {"exported_rows": rows, "files": files, "seconds": elapsed}
+
+    async def read(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        limit: int,
+        columns: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Most recent `limit` cold rows in the range, newest first, as flat column dicts.
+
+        Only files whose event time span overlaps the range are opened, the range is
+        pushed down to the Parquet row groups and only `columns` are decoded.
+        """
+        partitions = await self._partitions(session, infra_id, start_ms, end_ms)
+        columns, filters = self._projection(columns, start_ms, end_ms)
+
+        rows: List[Dict[str, Any]] = []
+        for max_event_time, path in partitions:
+            # partitions come newest first, stop once none of the remaining ones can make the cut
+            if len(rows) >= limit and max_event_time < rows[-1]["event_time"]:
+                break
+            rows.extend(await self._read_partition(path, columns, filters))
+            rows.sort(key=row_key, reverse=True)
+            del rows[limit:]
+
+        if DEBUG:
+            logger.debug(f"Read {len(rows)} cold rows of infra {infra_id} from {len(partitions)} candidate files")
+        return rows
+
+    async def iter_range(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        columns: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Every cold row in the range, newest first, one file in memory at a time"""
+        columns, filters = self._projection(columns, start_ms, end_ms)
+        chunks = [
+            (max_event_time, functools.partial(self._read_partition, path, columns, filters))
+            for max_event_time, path in await self._partitions(session, infra_id, start_ms, end_ms)
+        ]
+        async for row in iter_chunks_newest_first(chunks):
+            yield row
+
+    async def scan(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        columns: List[str]
+    ) -> Dict[str, np.ndarray]:
+        """Cold rows in the range as one float64 NumPy array per column (event_time included),
+        unordered, missing values as NaN"""
+        columns, filters = self._projection(columns, start_ms, end_ms)
+        chunks = {column: [] for column in columns}
+        for _, path in await self._partitions(session, infra_id, start_ms, end_ms):
+            try:
+                table = await asyncio.to_thread(self._read_table, path, columns, filters)
+            except FileNotFoundError:
+                logger.warning(f"Cold partition {path} is missing, skipped")
+                continue
+            self.files_read += 1
+            for column in columns:
+                chunks[column].append(table.column(column).to_numpy().astype(np.float64))
+        return {
+            column: np.concatenate(arrays) if arrays else np.empty(0, dtype=np.float64)
+            for column, arrays in chunks.items()
+        }
+
+    async def iter_partitions(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        columns: Optional[List[str]] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Every cold row of an infrastructure, one list per file, oldest file first"""
+        result = await session.execute(
+            select(ColdPartition.path)
+            .where(ColdPartition.infra_id == infra_id)
+            .order_by(ColdPartition.min_event_time)
+        )
+        for path in result.scalars().all():
+            yield await asyncio.to_thread(self._read_file, path, list(columns or COLD_COLUMNS), [])
+
+    async def count_rows(self, session: AsyncSession, infra_id: int) -> int:
+        result = await session.execute(
+            select(func.coalesce(func.sum(ColdPartition.row_count), 0)).where(ColdPartition.infra_id == infra_id)
+        )
+        return result.scalar()
+
+    async def get_partitions(self, session: AsyncSession, infra_id: int) -> List[Dict[str, Any]]:
+        result = await session.execute(
+            select(ColdPartition)
+            .where(ColdPartition.infra_id == infra_id)
+            .order_by(ColdPartition.min_event_time)
+        )
+        return [
+            {
+                "path": partition.path,
+                "row_count": partition.row_count,
+                "min_event_time": partition.min_event_time,
+                "max_event_time": partition.max_event_time,
+                "size_bytes": partition.size_bytes
+            }
+            for partition in result.scalars()
+        ]
+
+    async def drop_partitions(self, infra_id: int, cutoff_ms: int) -> int:
+        """Delete the files whose rows are all older than cutoff_ms, returns the number of files"""
+        async with AsyncSessionLocal() as session:
+            conditions = [ColdPartition.infra_id == infra_id, ColdPartition.max_event_time < cutoff_ms]
+            dropped = (await session.execute(select(ColdPartition.path, ColdPartition.row_count).where(*conditions))).all()
+            if not dropped:
+                return 0
+            paths = [path for path, _ in dropped]
+            await session.execute(delete(ColdPartition).where(*conditions))
+            await metrics_counters.remove(session, infra_id, sum(row_count for _, row_count in dropped))
+            await session.commit()
+
+        for path in paths:
+            self._remove_file(path)
+        self.dropped_files += len(paths)
+        return len(paths)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": COLD_TIER_ENABLED,
+            "available": self.available,
+            "running": self.running,
+            "directory": self.directory,
+            "after_days": self.after_days,
+            "interval_seconds": self.interval,
+            "compression": self.compression,
+            "runs": self.run_count,
+            "exported_rows": self.exported_rows,
+            "exported_files": self.exported_files,
+            "dropped_files": self.dropped_files,
+            "files_read": self.files_read,
+            "last_run_seconds": self.last_run_seconds,
+            "seconds_since_last_run": time.monotonic() - self.last_run_at if self.last_run_at else None
+        }
+
+    async def _partitions(self, session: AsyncSession, infra_id: int, start_ms: Optional[int], end_ms: Optional[int]):
+        """(max_event_time, path) of the files overlapping the range, newest first"""
+        conditions = [ColdPartition.infra_id == infra_id]
+        if start_ms is not None:
+            conditions.append(ColdPartition.max_event_time >= start_ms)
+        if end_ms is not None:
+            conditions.append(ColdPartition.min_event_time <= end_ms)
+        result = await session.execute(
+            select(ColdPartition.max_event_time, ColdPartition.path)
+            .where(*conditions)
+            .order_by(desc(ColdPartition.max_event_time))
+        )
+        partitions = result.all()
+        if partitions and not self.available:
+            raise RuntimeError("pyarrow is not installed, cold partitions cannot be read")
+        return partitions
+
+    @staticmethod
+    def _projection(columns: Optional[List[str]], start_ms: Optional[int], end_ms: Optional[int]):
+        columns = list(columns or COLD_COLUMNS)
+        if "event_time" not in columns:
+            columns.append("event_time")
+        filters = []
+        if start_ms is not None:
+            filters.append(("event_time", ">=", start_ms))
+        if end_ms is not None:
+            filters.append(("event_time", "<=", end_ms))
+        return columns, filters
+
+    async def _read_partition(self, path: str, columns: List[str], filters: List[tuple]) -> List[Dict[str, Any]]:
+        try:
+            rows = await asyncio.to_thread(self._read_file, path, columns, filters)
+        except FileNotFoundError:
+            # dropped by retention after the catalog was read
+            logger.warning(f"Cold partition {path} is missing, skipped")
+            return []
+        self.files_read += 1
+        return rows
+
+    async def _export_next_file(self, infra_id: int, cutoff_ms: int) -> int:
+        # the rows are read and the file written outside the single writer connection, which
+        # is only held to register the file and delete its rows
+        async with AsyncReadSessionLocal() as session:
+            first_event_time = await session.scalar(
+                select(func.min(Metrics.event_time)).where(Metrics.infra_id == infra_id, Metrics.event_time < cutoff_ms)
+            )
+            if first_event_time is None:
+                return 0
+
+            day_start = first_event_time - first_event_time % DAY_MS
+            day_conditions = [
+                Metrics.infra_id == infra_id,
+                Metrics.event_time >= day_start,
+                Metrics.event_time < day_start + DAY_MS
+            ]
+            result = await session.execute(
+                select(*[getattr(Metrics, name) for name in COLD_COLUMNS])
+                .where(*day_conditions)
+                .order_by(Metrics.id)
+                .limit(self.max_rows_per_file)
+            )
+            rows = result.all()
+        first_id, last_id = rows[0].id, rows[-1].id
+
+        day = time.strftime("%Y-%m-%d", time.gmtime(day_start / 1000))
+        path = f"{infra_id}/{day}-{first_id}.parquet"
+        event_times = [row.event_time for row in rows]
+        size = await asyncio.to_thread(self._write_file, path, rows)
+
+        file_conditions = [*day_conditions, Metrics.id >= first_id, Metrics.id <= last_id]
+        try:
+            async with AsyncSessionLocal() as session:
+                # new points get higher ids, but retention may have purged some of the file's
+                # rows meanwhile: the file is then dropped and the day exported again next run
+                remaining = await session.scalar(select(func.count()).select_from(Metrics).where(*file_conditions))
+                if remaining != len(rows):
+                    raise ExportConflict(f"{len(rows) - remaining} rows of {path} were deleted during the export")
+                session.add(ColdPartition(
+                    infra_id=infra_id,
+                    day_start=day_start,
+                    path=path,
+                    row_count=len(rows),
+                    min_event_time=min(event_times),
+                    max_event_time=max(event_times),
+                    size_bytes=size
+                ))
+                await session.execute(delete(Metrics).where(*file_conditions))
+                await session.commit()
+        except BaseException as e:
+            # the file is not registered, nothing may read it
+            self._remove_file(path)
+            if isinstance(e, ExportConflict):
+                logger.warning(f"Cold export of infra {infra_id} abandoned: {e}")
+                return 0
+            raise
+
+        if DEBUG:
+            logger.debug(f"Exported {len(rows)} rows of infra {infra_id} to {path} ({size} bytes)")
+        return len(rows)
+
+    def _remove_file(self, path: str):
+        try:
+            os.remove(os.path.join(self.directory, path))
+        except FileNotFoundError:
+            pass
+
+    def _write_file(self, path: str, rows) -> int:
+        columns = {name: [row[i] for row in rows] for i, name in enumerate(COLD_COLUMNS)}
+        columns["created_at"] = [value.isoformat() if value is not None else None for value in columns["created_at"]]
+        table = pyarrow.table(columns, schema=_arrow_schema()).sort_by("event_time")
+
+        full_path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # a crash before the commit leaves an unregistered file, the retry overwrites it
+        tmp_path = full_path + ".tmp"
+        pyarrow.parquet.write_table(
+            table, tmp_path,
+            compression=self.compression,
+            row_group_size=COLD_TIER_ROW_GROUP_SIZE
+        )
+        os.replace(tmp_path, full_path)
+        return os.path.getsize(full_path)
+
+    def _read_file(self, path: str, columns: List[str], filters: List[tuple]) -> List[Dict[str, Any]]:
+        return self._read_table(path, columns, filters).to_pylist()
+
+    def _read_table(self, path: str, columns: List[str], filters: List[tuple]):
+        return pyarrow.parquet.read_table(
+            os.path.join(self.directory, path),
+            columns=columns,
+            filters=filters or None
+        )
+
+    async def _tiering_loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error during cold tier export: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+
+cold_storage = ColdStorage()
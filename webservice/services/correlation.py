@@ -0,0 +1,155 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+import logging
+import os
+import time
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.sql import MetricsMoments
+from services.metrics_service import MetricsService
+from services.moments import CORRELATION_METRICS, group_moments, merge_moments, correlation_matrix, generation
+from services.rollups import ROLLUPS_ENABLED, RESOLUTIONS
+from services.time_utils import format_timestamp_ms
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+CORRELATION_MAX_BUCKETS = int(os.getenv("CORRELATION_MAX_BUCKETS", "1440"))
+CORRELATION_CACHE_SIZE = int(os.getenv("CORRELATION_CACHE_SIZE", "256"))
+
+MODES = ["sliding", "tumbling"]
+MODE_PATTERN = f"^({'|'.join(MODES)})$"
+
+
+class CorrelationService:
+    """Pearson correlation matrix of CORRELATION_METRICS over a time window, merged from the
+    per-bucket means and co-moments the rollups maintain at ingest, so a request costs
+    O(buckets × metrics²) whatever the number of points.
+
+    A `sliding` window ends with the bucket holding `end_ms`, a `tumbling` window is the
+    epoch-aligned multiple of its width that contains it. Merged window moments are cached
+    per (infra, resolution, buckets) until a commit changes that infrastructure's moments.
+    """
+
+    def __init__(
+        self,
+        metrics_service: Optional[MetricsService] = None,
+        resolutions: Dict[str, int] = RESOLUTIONS,
+        cache_size: int = CORRELATION_CACHE_SIZE
+    ):
+        self.metrics_service = metrics_service or MetricsService()
+        self.resolutions = resolutions
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, Tuple[int, Tuple[np.ndarray, np.ndarray, np.ndarray]]]" = OrderedDict()
+
+    def window_buckets(self, window_ms: int, end_ms: int, mode: str) -> Tuple[str, int, int]:
+        """Finest resolution tiling the window in at most CORRELATION_MAX_BUCKETS buckets, with the
+        window's first and last bucket starts. Raises ValueError."""
+        for resolution, size in sorted(self.resolutions.items(), key=lambda item: item[1]):
+            if window_ms % size == 0 and window_ms // size <= CORRELATION_MAX_BUCKETS:
+                break
+        else:
+            finest = min(self.resolutions.values())
+            raise ValueError(
+                f"Window must be a multiple of {finest // 1000}s spanning at most "
+                f"{CORRELATION_MAX_BUCKETS} buckets of one resolution"
+            )
+        if mode == "tumbling":
+            first = end_ms - end_ms % window_ms
+            return resolution, first, first + window_ms - size
+        last = end_ms - end_ms % size
+        return resolution, last - window_ms + size, last
+
+    async def correlation(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        window_ms: int,
+        end_ms: Optional[int],
+        mode: str,
+        metrics: List[str]
+    ) -> Dict[str, Any]:
+        """Correlation matrix of `metrics` (rows and columns in that order, None where a metric is
+        constant), `end_ms` None for now"""
+        if end_ms is None:
+            end_ms = int(time.time() * 1000)
+        resolution, first, last = self.window_buckets(window_ms, end_ms, mode)
+        size = self.resolutions[resolution]
+
+        cached = False
+        if ROLLUPS_ENABLED:
+            key = (infra_id, resolution, first, last)
+            current = generation(infra_id)
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == current:
+                self._cache.move_to_end(key)
+                moments = entry[1]
+                cached = True
+            else:
+                moments = await self._window_moments(session, infra_id, resolution, first, last)
+                self._cache[key] = (current, moments)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        else:
+            moments = await self._scan_moments(session, infra_id, first, last + size - 1)
+
+        count, _, comoment = moments
+        indices = [CORRELATION_METRICS.index(metric) for metric in metrics]
+        matrix = correlation_matrix(comoment)[np.ix_(indices, indices)]
+        if DEBUG:
+            logger.debug(
+                f"Correlation of infra {infra_id} over {(last - first) // size + 1} {resolution} buckets"
+                f" ({'cached' if cached else 'merged'})"
+            )
+        return {
+            "resolution": resolution if ROLLUPS_ENABLED else "raw",
+            "start_time": format_timestamp_ms(first),
+            "end_time": format_timestamp_ms(last + size - 1),
+            "count": int(count),
+            "metrics": metrics,
+            "matrix": [
+                [value if finite else None for value, finite in zip(row, finite_row)]
+                for row, finite_row in zip(matrix.tolist(), np.isfinite(matrix).tolist())
+            ],
+            "cached": cached
+        }
+
+    async def _window_moments(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        resolution: str,
+        first: int,
+        last: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        result = await session.execute(
+            select(MetricsMoments.count, MetricsMoments.means, MetricsMoments.comoments)
+            .where(
+                MetricsMoments.infra_id == infra_id,
+                MetricsMoments.resolution == resolution,
+                MetricsMoments.bucket_start >= first,
+                MetricsMoments.bucket_start <= last
+            )
+        )
+        rows = result.all()
+        m = len(CORRELATION_METRICS)
+        counts = np.array([row.count for row in rows], dtype=np.float64)
+        means = np.frombuffer(b"".join(row.means for row in rows)).reshape(len(rows), m)
+        comoments = np.frombuffer(b"".join(row.comoments for row in rows)).reshape(len(rows), m * (m + 1) // 2)
+        return merge_moments(counts, means, comoments)
+
+    async def _scan_moments(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: int,
+        end_ms: int
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Window moments straight from the raw points, when rollups are disabled"""
+        arrays = await self.metrics_service.scan_metrics(session, infra_id, start_ms, end_ms, CORRELATION_METRICS)
+        values = np.column_stack([arrays[metric] for metric in CORRELATION_METRICS])
+        values = values[~np.isnan(values).any(axis=1)]
+        counts, means, comoments = group_moments(values, np.zeros(len(values), dtype=np.int64), 1)
+        return counts[0], means[0], comoments[0]
@@ -0,0 +1,161 @@
+from typing import AsyncIterator, Optional
+import logging
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAX_DECOMPRESSED_BYTES = int(os.getenv("INGEST_MAX_DECOMPRESSED_BYTES", str(256 * 1024 * 1024)))
+OUTPUT_CHUNK_BYTES = 256 * 1024
+ZSTD_INPUT_SLICE_BYTES = 16 * 1024
+
+
+class BodyDecodingError(Exception):
+    pass
+
+
+class UnsupportedContentEncoding(BodyDecodingError):
+    pass
+
+
+class DecompressedSizeExceeded(BodyDecodingError):
+    pass
+
+
+class _GzipDecoder:
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data: bytes):
+        while data:
+            yield self._decompressor.decompress(data, OUTPUT_CHUNK_BYTES)
+            data = self._decompressor.unconsumed_tail
+            if self._decompressor.eof and self._decompressor.unused_data:
+                # concatenated gzip members
+                data = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def finish(self):
+        output = self._decompressor.flush()
+        if not self._decompressor.eof:
+            raise BodyDecodingError("Truncated gzip body")
+        yield output
+
+
+class _NeedInput(Exception):
+    pass
+
+
+class _ZstdInput:
+    """Source of the zstd stream reader fed with the body chunks as they arrive. Running dry
+    before the end of the body interrupts the read instead of ending the stream."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.buffer:
+            if self.eof:
+                return b""
+            raise _NeedInput()
+        size = len(self.buffer) if size < 0 else size
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+class _ZstdDecoder:
+    def __init__(self):
+        self._input = _ZstdInput()
+        self._reader = zstandard.ZstdDecompressor().stream_reader(
+            self._input, read_size=ZSTD_INPUT_SLICE_BYTES, read_across_frames=True
+        )
+
+    def decompress(self, data: bytes):
+        self._input.buffer += data
+        yield from self._read()
+
+    def finish(self):
+        self._input.eof = True
+        yield from self._read()
+
+    def _read(self):
+        # read1 produces at most OUTPUT_CHUNK_BYTES per step whatever the compression ratio
+        while True:
+            try:
+                output = self._reader.read1(OUTPUT_CHUNK_BYTES)
+            except _NeedInput:
+                return
+            if not output:
+                return
+            yield output
+
+
+def _get_decoder(encoding: str):
+    if encoding in ("gzip", "x-gzip"):
+        return _GzipDecoder()
+    if encoding == "zstd":
+        if zstandard is None:
+            raise UnsupportedContentEncoding("zstd support requires the 'zstandard' package")
+        return _ZstdDecoder()
+    raise UnsupportedContentEncoding(f"Unsupported Content-Encoding '{encoding}'")
+
+
+def normalize_encoding(content_encoding: Optional[str]) -> Optional[str]:
+    encoding = (content_encoding or "").strip().lower()
+    return None if encoding in ("", "identity") else encoding
+
+
+def check_encoding(content_encoding: Optional[str]):
+    """Raises UnsupportedContentEncoding before any byte of the body is read"""
+    encoding = normalize_encoding(content_encoding)
+    if encoding is not None:
+        _get_decoder(encoding)
+
+
+async def iter_decoded_body(
+    chunks: AsyncIterator[bytes],
+    content_encoding: Optional[str],
+    max_bytes: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    """Streaming decompression of a request body with a hard limit on the decompressed size"""
+    max_bytes = max_bytes or MAX_DECOMPRESSED_BYTES
+    encoding = normalize_encoding(content_encoding)
+    if encoding is None:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    decoder = _get_decoder(encoding)
+    total = 0
+
+    def check(output: bytes) -> bytes:
+        nonlocal total
+        total += len(output)
+        if total > max_bytes:
+            logger.warning(f"Decompressed body exceeds {max_bytes} bytes, rejecting")
+            raise DecompressedSizeExceeded(f"Decompressed body exceeds {max_bytes} bytes")
+        return output
+
+    try:
+        async for chunk in chunks:
+            for output in decoder.decompress(chunk):
+                if output:
+                    yield check(output)
+        for output in decoder.finish():
+            if output:
+                yield check(output)
+    except BodyDecodingError:
+        raise
+    except Exception as e:
+        raise BodyDecodingError(f"Invalid {encoding} body: {str(e)}")
+
+
+async def read_decoded_body(chunks: AsyncIterator[bytes], content_encoding: Optional[str], max_bytes: Optional[int] = None) -> bytes:
+    return b"".join([chunk async for chunk in iter_decoded_body(chunks, content_encoding, max_bytes)])
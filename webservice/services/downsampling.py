@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets indices of `threshold` points for every series at once.
+
+    `x` holds the n sorted abscissas shared by the series, `y` is (series, n). Returns a
+    (series, min(threshold, n)) array of indices into `x`, first and last points always kept.
+    Each bucket keeps the point forming the largest triangle with the point kept in the
+    previous bucket and the average of the next one, so peaks and troughs survive.
+    NaN values are never kept when a bucket has another point.
+    """
+    series, n = y.shape
+    if threshold >= n or n <= 2:
+        return np.tile(np.arange(n), (series, 1))
+    threshold = max(threshold, 3)
+
+    # n - 2 inner points split into threshold - 2 buckets of consecutive indices
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    rows = np.arange(series)
+    kept = np.empty((series, threshold), dtype=np.int64)
+    kept[:, 0] = 0
+    kept[:, -1] = n - 1
+
+    previous = np.zeros(series, dtype=np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for bucket in range(threshold - 2):
+            start, end = edges[bucket], edges[bucket + 1]
+            if bucket + 2 < len(edges):
+                next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+                next_x = x[next_start:next_end].mean()
+                next_bucket = y[:, next_start:next_end]
+                next_y = np.nansum(next_bucket, axis=1) / np.count_nonzero(~np.isnan(next_bucket), axis=1)
+            else:
+                next_x, next_y = x[n - 1], y[:, n - 1]
+
+            previous_x, previous_y = x[previous], y[rows, previous]
+            bucket_x, bucket_y = x[start:end], y[:, start:end]
+            # twice the triangle areas, one row per series
+            areas = np.abs(
+                (previous_x - next_x)[:, None] * (bucket_y - previous_y[:, None])
+                - (previous_x[:, None] - bucket_x[None, :]) * (next_y - previous_y)[:, None]
+            )
+            previous = start + np.argmax(np.nan_to_num(areas, nan=-1.0), axis=1)
+            kept[:, bucket + 1] = previous
+    return kept
+
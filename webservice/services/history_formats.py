@@ -0,0 +1,121 @@
+from typing import Dict, Any, List, Optional
+import json
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.infra.columnar+json"
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": COLUMNAR_JSON_MEDIA_TYPE,
+    "msgpack": "application/msgpack",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+ACCEPTED_MEDIA_TYPES = {
+    **{media_type: name for name, media_type in MEDIA_TYPES.items()},
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack"
+}
+FORMAT_PATTERN = f"^({'|'.join(MEDIA_TYPES)})$"
+
+# metadata key of the Arrow schema holding the response envelope
+ARROW_METADATA_KEY = b"history"
+# the representation depends on the Accept header, shared caches must key on it
+NEGOTIATED_HEADERS = {"Vary": "Accept"}
+
+
+def negotiate(requested: Optional[str], accept: Optional[str]) -> str:
+    """Response format from the `format` query parameter, else the Accept header (JSON by default)"""
+    if requested:
+        return requested
+    if not accept:
+        return "json"
+
+    candidates = []
+    for position, entry in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in entry.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type.lower() in ACCEPTED_MEDIA_TYPES and quality > 0:
+            candidates.append((-quality, position, ACCEPTED_MEDIA_TYPES[media_type.lower()]))
+    return min(candidates)[2] if candidates else "json"
+
+
+def missing_dependency(name: str) -> Optional[str]:
+    """Package needed by the format that is not installed, if any"""
+    if name == "msgpack" and msgpack is None:
+        return "msgpack"
+    if name == "arrow" and pyarrow is None:
+        return "pyarrow"
+    return None
+
+
+def to_columns(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """One list per field, nested objects flattened to dotted names (service_status.database).
+    Fields missing from a row are None."""
+    flat_rows = [_flatten(row) for row in rows]
+    names: Dict[str, None] = {}
+    for row in flat_rows:
+        names.update(dict.fromkeys(row))
+    return {name: [row.get(name) for row in flat_rows] for name in names}
+
+
+def render(name: str, document: Dict[str, Any]) -> Response:
+    """Serialize a /history document, its `data` rows as rows (json) or columns (other formats)"""
+    if name == "json":
+        return Response(_dumps(document), media_type=MEDIA_TYPES[name], headers=NEGOTIATED_HEADERS)
+
+    envelope = {key: value for key, value in document.items() if key != "data"}
+    columns = to_columns(document["data"])
+    if name == "columnar":
+        body = _dumps({**envelope, "columns": columns})
+    elif name == "msgpack":
+        body = msgpack.packb({**envelope, "columns": columns})
+    else:
+        body = _arrow_stream(envelope, columns)
+    return Response(body, media_type=MEDIA_TYPES[name], headers=NEGOTIATED_HEADERS)
+
+
+def _flatten(row: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def _dumps(document: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(document)
+    return json.dumps(document, separators=(",", ":")).encode()
+
+
+def _arrow_stream(envelope: Dict[str, Any], columns: Dict[str, List[Any]]) -> bytes:
+    table = pyarrow.table(columns)
+    table = table.replace_schema_metadata({ARROW_METADATA_KEY: _dumps(envelope)})
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
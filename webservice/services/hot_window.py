@@ -0,0 +1,301 @@
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+from collections import OrderedDict, defaultdict
+import logging
+import os
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from db import Base, AsyncReadSessionLocal
+from services.block_storage import BLOCK_METRICS, INTEGER_METRICS, STATUS_COLUMNS
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+HOT_WINDOW_ENABLED = os.getenv("HOT_WINDOW_ENABLED", "true").lower() == "true"
+HOT_WINDOW_POINTS = int(os.getenv("HOT_WINDOW_POINTS", "1000"))
+HOT_WINDOW_MAX_INFRAS = int(os.getenv("HOT_WINDOW_MAX_INFRAS", "64"))
+HOT_WINDOW_HYDRATE_RETRIES = 3
+
+_STAGED_KEY = "hot_window_rows"
+
+Loader = Callable[[AsyncSession], Awaitable[List[Dict[str, Any]]]]
+
+
+class InfraWindow:
+    """Preallocated ring buffers holding the last `capacity` points of one infrastructure,
+    one array per column.
+
+    `complete_from` is the event time from which every stored point is in the window
+    (None: every point is). It only moves forward, when a point is evicted.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.event_times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, len(BLOCK_METRICS)), dtype=np.float64)
+        self.status_codes = np.zeros((capacity, len(STATUS_COLUMNS)), dtype=np.uint8)
+        self.timestamps = np.empty(capacity, dtype=object)
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.created_at = np.empty(capacity, dtype=object)
+
+        self.statuses: List[str] = []
+        self._status_codes: Dict[str, int] = {}
+        self.size = 0
+        self.head = 0
+        self.complete_from: Optional[int] = None
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (
+            self.event_times, self.values, self.status_codes, self.timestamps, self.ids, self.created_at
+        ))
+
+    def append(self, rows: List[Dict[str, Any]]):
+        """Add flat metrics rows (metrics table columns, id and created_at optional)"""
+        n = len(rows)
+        if n == 0:
+            return
+        event_times = np.fromiter((row["event_time"] for row in rows), dtype=np.int64, count=n)
+
+        overflow = self.size + n - self.capacity
+        if overflow > 0:
+            evicted = event_times[:max(0, n - self.capacity)]
+            if self.size:
+                oldest = (self.head - self.size + np.arange(min(overflow, self.size))) % self.capacity
+                evicted = np.concatenate([self.event_times[oldest], evicted])
+            self._raise_floor(int(evicted.max()) + 1)
+
+        # only the last `capacity` rows survive
+        skip = max(0, n - self.capacity)
+        rows = rows[skip:]
+        slots = (self.head + np.arange(len(rows))) % self.capacity
+        self.event_times[slots] = event_times[skip:]
+        self.values[slots] = [[row[metric] for metric in BLOCK_METRICS] for row in rows]
+        self.status_codes[slots] = [[self._encode(row[column]) for column in STATUS_COLUMNS] for row in rows]
+        self.timestamps[slots] = [row["timestamp"] for row in rows]
+        self.ids[slots] = [row.get("id") or -1 for row in rows]
+        self.created_at[slots] = [row.get("created_at") for row in rows]
+
+        self.head = int((self.head + len(rows)) % self.capacity)
+        self.size = min(self.capacity, self.size + n)
+
+    def select(self, start_ms: Optional[int], end_ms: Optional[int], limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Most recent `limit` points in the range, newest first, or None when the window
+        cannot tell (part of the answer may be older than the window)"""
+        slots = self._ordered_slots()
+        times = self.event_times[slots]
+        lower = start_ms
+        if self.complete_from is not None:
+            lower = self.complete_from if start_ms is None else max(start_ms, self.complete_from)
+
+        mask = np.ones(len(slots), dtype=bool)
+        if lower is not None:
+            mask &= times >= lower
+        if end_ms is not None:
+            mask &= times <= end_ms
+        selected = slots[mask][::-1][:limit]
+
+        covered = self.complete_from is None or (start_ms is not None and start_ms >= self.complete_from)
+        if len(selected) < limit and not covered:
+            return None
+        return [self._row(slot) for slot in selected.tolist()]
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        if self.size == 0:
+            return None
+        return self._row(int(self._ordered_slots()[-1]))
+
+    def get_stats(self) -> Dict[str, Any]:
+        slots = self._ordered_slots()
+        stats: Dict[str, Any] = {
+            "points": int(self.size),
+            "start_event_time": int(self.event_times[slots[0]]) if self.size else None,
+            "end_event_time": int(self.event_times[slots[-1]]) if self.size else None,
+            "complete_from": self.complete_from,
+            "metrics": {},
+            "service_status": {}
+        }
+        if self.size == 0:
+            return stats
+
+        values = self.values[slots]
+        mins, maxs = values.min(axis=0), values.max(axis=0)
+        means, stds = values.mean(axis=0), values.std(axis=0)
+        for j, metric in enumerate(BLOCK_METRICS):
+            stats["metrics"][metric] = {
+                "min": float(mins[j]),
+                "max": float(maxs[j]),
+                "mean": float(means[j]),
+                "std": float(stds[j]),
+                "last": float(values[-1, j])
+            }
+        for j, column in enumerate(STATUS_COLUMNS):
+            counts = np.bincount(self.status_codes[slots, j], minlength=len(self.statuses))
+            stats["service_status"][column.removeprefix("service_status_")] = {
+                status: int(count) for status, count in zip(self.statuses, counts) if count
+            }
+        return stats
+
+    def _ordered_slots(self) -> np.ndarray:
+        """Occupied slots by event time, oldest first (late points may arrive out of order)"""
+        slots = (self.head - self.size + np.arange(self.size)) % self.capacity
+        return slots[np.argsort(self.event_times[slots], kind="stable")]
+
+    def _row(self, slot: int) -> Dict[str, Any]:
+        row = {"timestamp": self.timestamps[slot], "event_time": int(self.event_times[slot])}
+        if self.ids[slot] >= 0:
+            row["id"] = int(self.ids[slot])
+            row["created_at"] = self.created_at[slot]
+        for j, metric in enumerate(BLOCK_METRICS):
+            value = self.values[slot, j]
+            row[metric] = int(value) if metric in INTEGER_METRICS else float(value)
+        for j, column in enumerate(STATUS_COLUMNS):
+            row[column] = self.statuses[self.status_codes[slot, j]]
+        return row
+
+    def _encode(self, status: str) -> int:
+        code = self._status_codes.get(status)
+        if code is None:
+            code = self._status_codes[status] = len(self.statuses)
+            self.statuses.append(status)
+        return code
+
+    def _raise_floor(self, event_time: int):
+        if self.complete_from is None or event_time > self.complete_from:
+            self.complete_from = event_time
+
+
+class HotWindow:
+    """In-memory windows of the most recent points, for up to `max_infras` infrastructures
+    (least recently used evicted).
+
+    Committed inserts are appended to the resident windows. A missing window is hydrated
+    from the database on first use, in a fresh read transaction, and discarded if points
+    were appended for that infrastructure meanwhile.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = HOT_WINDOW_ENABLED,
+        capacity: int = HOT_WINDOW_POINTS,
+        max_infras: int = HOT_WINDOW_MAX_INFRAS
+    ):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.max_infras = max_infras
+
+        self._windows: "OrderedDict[int, InfraWindow]" = OrderedDict()
+        self._append_counts: Dict[int, int] = defaultdict(int)
+
+        self.hits = 0
+        self.misses = 0
+        self.hydrations = 0
+        self.evictions = 0
+
+    def append(self, infra_id: int, rows: List[Dict[str, Any]]):
+        self._append_counts[infra_id] += 1
+        window = self._windows.get(infra_id)
+        if window is not None:
+            window.append(rows)
+            self._windows.move_to_end(infra_id)
+
+    def stage(self, session: AsyncSession, infra_id: int, rows: List[Dict[str, Any]]):
+        """Append `rows` once the session's transaction commits"""
+        if self.enabled:
+            session.info.setdefault(_STAGED_KEY, []).append((infra_id, rows))
+
+    async def select(
+        self,
+        infra_id: int,
+        loader: Loader,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        limit: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Newest first flat rows of the range from memory, None when the database must answer"""
+        window = await self.get_window(infra_id, loader)
+        rows = window.select(start_ms, end_ms, limit) if window is not None else None
+        if rows is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return rows
+
+    async def get_window(self, infra_id: int, loader: Loader) -> Optional[InfraWindow]:
+        window = self._windows.get(infra_id)
+        if window is None:
+            window = await self.hydrate(infra_id, loader)
+        if window is not None:
+            self._windows.move_to_end(infra_id)
+        return window
+
+    async def hydrate(self, infra_id: int, loader: Loader) -> Optional[InfraWindow]:
+        """Load the last `capacity` points, `loader` returns them newest first as flat rows"""
+        for _ in range(HOT_WINDOW_HYDRATE_RETRIES):
+            appends = self._append_counts[infra_id]
+            async with AsyncReadSessionLocal() as session:
+                rows = await loader(session)
+            if self._append_counts[infra_id] != appends:
+                continue
+
+            window = InfraWindow(self.capacity)
+            window.append(rows[::-1])
+            if len(rows) >= self.capacity:
+                # older points exist in the database
+                window._raise_floor(rows[-1]["event_time"] + 1)
+
+            self._windows[infra_id] = window
+            self.hydrations += 1
+            while len(self._windows) > self.max_infras:
+                evicted, _ = self._windows.popitem(last=False)
+                self.evictions += 1
+                if DEBUG:
+                    logger.debug(f"Hot window of infra {evicted} evicted")
+            if DEBUG:
+                logger.debug(f"Hot window of infra {infra_id} hydrated with {len(rows)} points")
+            return window
+
+        logger.warning(f"Hot window of infra {infra_id} not hydrated, concurrent writes")
+        return None
+
+    def invalidate(self, infra_id: Optional[int] = None):
+        if infra_id is None:
+            self._windows.clear()
+        else:
+            self._windows.pop(infra_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "capacity": self.capacity,
+            "max_infras": self.max_infras,
+            "resident_infras": len(self._windows),
+            "memory_bytes": sum(window.nbytes for window in self._windows.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hydrations": self.hydrations,
+            "evictions": self.evictions
+        }
+
+
+hot_window = HotWindow()
+
+
+@event.listens_for(Session, "after_commit")
+def _append_staged_rows(session):
+    for infra_id, rows in session.info.pop(_STAGED_KEY, []):
+        hot_window.append(infra_id, rows)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_staged_rows(session, previous_transaction):
+    session.info.pop(_STAGED_KEY, None)
+
+
+def _invalidate(*args, **kwargs):
+    hot_window.invalidate()
+
+
+event.listen(Base.metadata, "after_drop", _invalidate)
+event.listen(Base.metadata, "after_create", _invalidate)
@@ -0,0 +1,97 @@
+from typing import Dict, Optional, Tuple
+import logging
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+from db import Base
+from models.sql import User, Infrastructure
+
+logger = logging.getLogger(__name__)
+
+
+class IdentityCache:
+    """(username, infra name) -> (user_id, infra_id), filled on first use and cleared whenever
+    a user or an infrastructure changes"""
+
+    def __init__(self):
+        self._ids: Dict[Tuple[str, str], Tuple[int, int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, session: AsyncSession, username: str, infra_name: str, create: bool = False) -> Tuple[int, int]:
+        """Returns (user_id, infra_id). With create=True an unknown infrastructure is registered for
+        the user inside the caller's transaction."""
+        key = (username, infra_name)
+        ids = self._ids.get(key)
+        if ids is not None:
+            self.hits += 1
+            return ids
+
+        self.misses += 1
+        ids = await self._select_ids(session, username, infra_name)
+        if ids is None:
+            if not create:
+                raise ValueError(f"Infrastructure '{infra_name}' not found for user '{username}'")
+            # not cached, the transaction may still roll back; the next lookup caches the committed row
+            return await self._create_infrastructure(session, username, infra_name)
+
+        self._ids[key] = ids
+        return ids
+
+    async def _select_ids(self, session: AsyncSession, username: str, infra_name: str) -> Optional[Tuple[int, int]]:
+        result = await session.execute(
+            select(User.id, Infrastructure.id)
+            .join(Infrastructure, Infrastructure.user_id == User.id)
+            .where(User.username == username, Infrastructure.name == infra_name)
+        )
+        row = result.first()
+        return (row[0], row[1]) if row is not None else None
+
+    async def _create_infrastructure(self, session: AsyncSession, username: str, infra_name: str) -> Tuple[int, int]:
+        result = await session.execute(select(User.id).where(User.username == username))
+        user_id = result.scalar_one_or_none()
+        if user_id is None:
+            raise ValueError(f"User '{username}' not found")
+
+        # concurrent writers registering the same name end up on the same row
+        await session.execute(
+            sqlite_insert(Infrastructure)
+            .values(name=infra_name, user_id=user_id)
+            .on_conflict_do_nothing(index_elements=["user_id", "name"])
+        )
+        logger.info(f"Registered infrastructure '{infra_name}' for user '{username}'")
+        return await self._select_ids(session, username, infra_name)
+
+    def invalidate(self):
+        if self._ids:
+            logger.debug(f"Identity cache invalidated ({len(self._ids)} entries)")
+        self._ids.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._ids), "hits": self.hits, "misses": self.misses}
+
+
+identity_cache = IdentityCache()
+
+
+def _invalidate(*args, **kwargs):
+    identity_cache.invalidate()
+
+
+for _model in (User, Infrastructure):
+    for _event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(_model, _event_name, _invalidate)
+
+event.listen(Base.metadata, "after_drop", _invalidate)
+event.listen(Base.metadata, "after_create", _invalidate)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_bulk_statement(orm_execute_state):
+    # bulk UPDATE / DELETE statements bypass the mapper events
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    if any(mapper.class_ in (User, Infrastructure) for mapper in orm_execute_state.all_mappers):
+        identity_cache.invalidate()
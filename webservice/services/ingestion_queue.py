@@ -0,0 +1,185 @@
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import logging
+from collections import defaultdict
+import os
+import time
+from db import AsyncSessionLocal
+from services.persistence import PersistenceService, DEFAULT_INFRA
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+QUEUE_MAX_SIZE = int(os.getenv("INGEST_QUEUE_MAX_SIZE", "50000"))
+QUEUE_BATCH_SIZE = int(os.getenv("INGEST_QUEUE_BATCH_SIZE", "1000"))
+QUEUE_FLUSH_INTERVAL = float(os.getenv("INGEST_QUEUE_FLUSH_INTERVAL_MS", "200")) / 1000
+# acknowledged metrics are only dropped once every attempt failed
+QUEUE_WRITE_ATTEMPTS = int(os.getenv("INGEST_QUEUE_WRITE_ATTEMPTS", "6"))
+QUEUE_RETRY_BACKOFF = float(os.getenv("INGEST_QUEUE_RETRY_BACKOFF_MS", "100")) / 1000
+QUEUE_RETRY_BACKOFF_MAX = 5.0
+
+
+class IngestionQueueFull(Exception):
+    pass
+
+
+class IngestionQueue:
+    """Write-behind queue: validated metrics are buffered in memory and a single
+    writer task commits them in micro-batches (group commit).
+
+    A failed write (e.g. database is locked) is retried with exponential backoff up to
+    `write_attempts` times, holding back the following batches meanwhile.
+    """
+
+    def __init__(
+        self,
+        persistence_service: PersistenceService,
+        max_size: int = QUEUE_MAX_SIZE,
+        batch_size: int = QUEUE_BATCH_SIZE,
+        flush_interval: float = QUEUE_FLUSH_INTERVAL,
+        write_attempts: int = QUEUE_WRITE_ATTEMPTS,
+        retry_backoff: float = QUEUE_RETRY_BACKOFF
+    ):
+        self.persistence_service = persistence_service
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_attempts = write_attempts
+        self.retry_backoff = retry_backoff
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+        self.enqueued_count = 0
+        self.written_count = 0
+        self.failed_count = 0
+        self.batch_count = 0
+        self.retry_count = 0
+        self.last_commit_lag = 0.0
+        self.last_commit_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._writer_task is not None and not self._writer_task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._writer_task = asyncio.create_task(self._writer_loop())
+        logger.info(f"Ingestion queue started (max_size={self.max_size}, batch_size={self.batch_size}, flush_interval={self.flush_interval:.3f}s)")
+
+    async def stop(self):
+        if not self.running:
+            return
+        await self.flush()
+        self._writer_task.cancel()
+        try:
+            await self._writer_task
+        except asyncio.CancelledError:
+            pass
+        self._writer_task = None
+        logger.info(f"Ingestion queue stopped ({self.written_count} written, {self.failed_count} failed)")
+
+    async def flush(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    def enqueue(self, metrics_list: List[Dict[str, Any]], infra_name: str = DEFAULT_INFRA) -> int:
+        """Enqueue validated metrics, all or nothing. Raises IngestionQueueFull when the batch does not fit."""
+        if not self.running:
+            raise RuntimeError("Ingestion queue is not running")
+
+        if self._queue.qsize() + len(metrics_list) > self.max_size:
+            raise IngestionQueueFull(f"Ingestion queue is full ({self._queue.qsize()}/{self.max_size})")
+
+        enqueued_at = time.monotonic()
+        for metrics_data in metrics_list:
+            self._queue.put_nowait((enqueued_at, infra_name, metrics_data))
+
+        self.enqueued_count += len(metrics_list)
+        return self._queue.qsize()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "lag_seconds": self.last_commit_lag,
+            "seconds_since_last_commit": time.monotonic() - self.last_commit_at if self.last_commit_at else None,
+            "enqueued": self.enqueued_count,
+            "written": self.written_count,
+            "failed": self.failed_count,
+            "retries": self.retry_count,
+            "batches": self.batch_count
+        }
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_batch(self, batch: List[Tuple[float, str, Dict[str, Any]]]):
+        by_infra = defaultdict(list)
+        for _, infra_name, item in batch:
+            by_infra[infra_name].append(item)
+
+        stored = 0
+        for infra_name, items in by_infra.items():
+            stored += await self._write_with_retry(items, infra_name)
+
+        now = time.monotonic()
+        self.batch_count += 1
+        self.written_count += stored
+        self.failed_count += len(batch) - stored
+        self.last_commit_lag = now - min(enqueued_at for enqueued_at, _, _ in batch)
+        self.last_commit_at = now
+
+        if stored < len(batch):
+            logger.error(f"Ingestion queue dropped {len(batch) - stored} metrics")
+        if DEBUG:
+            logger.debug(f"Ingestion queue committed {stored} metrics (lag {self.last_commit_lag:.3f}s, depth {self._queue.qsize()})")
+
+    async def _write_with_retry(self, items: List[Dict[str, Any]], infra_name: str) -> int:
+        backoff = self.retry_backoff
+        for attempt in range(1, self.write_attempts + 1):
+            try:
+                async with AsyncSessionLocal() as session:
+                    # the transaction is rolled back on failure, retrying never writes twice
+                    stored = await self.persistence_service.store_validated_metrics(session, items, infra_name)
+                if stored:
+                    return stored
+                error = "nothing stored"
+            except Exception as e:
+                error = str(e)
+
+            if attempt == self.write_attempts:
+                logger.error(f"Error writing ingestion queue batch for infrastructure '{infra_name}' after {attempt} attempts: {error}")
+                return 0
+            logger.warning(f"Ingestion queue write for infrastructure '{infra_name}' failed ({error}), retrying in {backoff:.2f}s")
+            self.retry_count += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, QUEUE_RETRY_BACKOFF_MAX)
+        return 0
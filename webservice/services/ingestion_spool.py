@@ -0,0 +1,291 @@
+from typing import Dict, Any, List, Optional
+import asyncio
+import json
+from collections import defaultdict
+import logging
+import os
+import time
+from sqlalchemy import delete
+from db import AsyncSessionLocal
+from models.sql import SpoolSegment
+from services.persistence import PersistenceService, DEFAULT_INFRA
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "./data/spool")
+SPOOL_SEGMENT_MAX_BYTES = int(os.getenv("INGEST_SPOOL_SEGMENT_MAX_BYTES", str(8 * 1024 * 1024)))
+SPOOL_SEGMENT_MAX_AGE = float(os.getenv("INGEST_SPOOL_SEGMENT_MAX_AGE_MS", "1000")) / 1000
+SPOOL_FSYNC_INTERVAL = float(os.getenv("INGEST_SPOOL_FSYNC_INTERVAL_MS", "10")) / 1000
+SPOOL_APPLY_INTERVAL = float(os.getenv("INGEST_SPOOL_APPLY_INTERVAL_MS", "500")) / 1000
+SPOOL_APPLY_ATTEMPTS = int(os.getenv("INGEST_SPOOL_APPLY_ATTEMPTS", "5"))
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson"
+FAILED_SUFFIX = ".failed"
+
+
+class IngestionSpool:
+    """Append-only, segment-rotated on-disk spool.
+
+    Validated metrics are appended as NDJSON lines to the active segment and
+    acknowledged once the (batched) fsync covering them completes. Sealed
+    segments are replayed into the metrics table by a background applier, each
+    segment in one transaction that also records the segment name so a replay
+    after a crash never inserts the same segment twice.
+
+    A segment that fails to apply holds back the later ones (segments are applied in
+    order) and is retried on the next pass. After `apply_attempts` failures it is
+    renamed to `<segment>.failed` and left for an operator.
+    """
+
+    def __init__(
+        self,
+        persistence_service: PersistenceService,
+        spool_dir: str = SPOOL_DIR,
+        segment_max_bytes: int = SPOOL_SEGMENT_MAX_BYTES,
+        segment_max_age: float = SPOOL_SEGMENT_MAX_AGE,
+        fsync_interval: float = SPOOL_FSYNC_INTERVAL,
+        apply_interval: float = SPOOL_APPLY_INTERVAL,
+        apply_attempts: int = SPOOL_APPLY_ATTEMPTS
+    ):
+        self.persistence_service = persistence_service
+        self.spool_dir = spool_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.fsync_interval = fsync_interval
+        self.apply_interval = apply_interval
+        self.apply_attempts = apply_attempts
+
+        self._active_file = None
+        self._active_name: Optional[str] = None
+        self._active_size = 0
+        self._active_opened_at = 0.0
+        self._segment_seq = 0
+
+        self._sync_waiters: List[asyncio.Future] = []
+        self._sync_task: Optional[asyncio.Task] = None
+        self._applier_task: Optional[asyncio.Task] = None
+        self._apply_lock = asyncio.Lock()
+        self._file_lock = asyncio.Lock()
+
+        self.spooled_count = 0
+        self.applied_count = 0
+        self.applied_segments = 0
+        self.fsync_count = 0
+        self.last_apply_lag = 0.0
+        self.failed_segments = 0
+        self._failed_attempts: Dict[str, int] = defaultdict(int)
+
+    @property
+    def running(self) -> bool:
+        return self._applier_task is not None and not self._applier_task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        os.makedirs(self.spool_dir, exist_ok=True)
+        pending = self._sealed_segments()
+        if pending:
+            logger.info(f"Recovering {len(pending)} unapplied spool segments")
+        self._applier_task = asyncio.create_task(self._applier_loop())
+        logger.info(f"Ingestion spool started in {self.spool_dir}")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._applier_task.cancel()
+        try:
+            await self._applier_task
+        except asyncio.CancelledError:
+            pass
+        self._applier_task = None
+
+        await self._sync()
+        await self._seal_active_segment()
+        await self.apply_pending()
+        logger.info(f"Ingestion spool stopped ({self.applied_count} applied)")
+
+    async def append(self, metrics_list: List[Dict[str, Any]], infra_name: str = DEFAULT_INFRA) -> int:
+        """Append validated metrics to the spool, returns once they are durable on disk"""
+        if not self.running:
+            raise RuntimeError("Ingestion spool is not running")
+
+        payload = b"".join(
+            json.dumps({"infra": infra_name, **metrics_data}, separators=(",", ":")).encode() + b"\n"
+            for metrics_data in metrics_list
+        )
+        async with self._file_lock:
+            if self._active_file is None:
+                self._open_segment()
+            self._active_file.write(payload)
+            self._active_size += len(payload)
+        self.spooled_count += len(metrics_list)
+
+        await self._wait_for_sync()
+
+        if self._active_size >= self.segment_max_bytes:
+            await self._seal_active_segment()
+
+        return len(metrics_list)
+
+    async def apply_pending(self) -> int:
+        """Replay every sealed segment into the database, oldest first. Stops at the first
+        segment that fails, which is quarantined once it failed `apply_attempts` times."""
+        applied = 0
+        async with self._apply_lock:
+            for name in self._sealed_segments():
+                try:
+                    applied += await self._apply_segment(name)
+                except Exception as e:
+                    self._failed_attempts[name] += 1
+                    attempts = self._failed_attempts[name]
+                    if attempts < self.apply_attempts:
+                        logger.error(f"Error applying spool segment {name} (attempt {attempts}/{self.apply_attempts}): {str(e)}")
+                        break
+                    self._quarantine(name, e)
+                    continue
+                self._failed_attempts.pop(name, None)
+        return applied
+
+    def get_stats(self) -> Dict[str, Any]:
+        pending = self._sealed_segments() if os.path.isdir(self.spool_dir) else []
+        return {
+            "running": self.running,
+            "spool_dir": self.spool_dir,
+            "active_segment": self._active_name,
+            "active_segment_bytes": self._active_size,
+            "pending_segments": len(pending),
+            "pending_bytes": sum(os.path.getsize(self._path(name)) for name in pending),
+            "lag_seconds": self.last_apply_lag,
+            "spooled": self.spooled_count,
+            "applied": self.applied_count,
+            "applied_segments": self.applied_segments,
+            "failed_segments": self.failed_segments,
+            "fsyncs": self.fsync_count
+        }
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.spool_dir, name)
+
+    def _sealed_segments(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.spool_dir)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX) and name != self._active_name
+        )
+
+    def _open_segment(self):
+        self._segment_seq += 1
+        self._active_name = f"{SEGMENT_PREFIX}{time.time_ns():020d}-{self._segment_seq:06d}{SEGMENT_SUFFIX}"
+        self._active_file = open(self._path(self._active_name), "ab")
+        self._active_size = 0
+        self._active_opened_at = time.monotonic()
+
+    async def _seal_active_segment(self):
+        async with self._file_lock:
+            if self._active_file is None:
+                return
+            self._active_file.flush()
+            await asyncio.to_thread(os.fsync, self._active_file.fileno())
+            self._active_file.close()
+            if DEBUG:
+                logger.debug(f"Sealed spool segment {self._active_name} ({self._active_size} bytes)")
+            self._active_file = None
+            self._active_name = None
+            self._active_size = 0
+
+    async def _wait_for_sync(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self._sync_waiters.append(waiter)
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_after_interval())
+        await waiter
+
+    async def _sync_after_interval(self):
+        while self._sync_waiters:
+            await asyncio.sleep(self.fsync_interval)
+            await self._sync()
+
+    async def _sync(self):
+        """Group fsync: one flush + fsync acknowledges every append made before it"""
+        waiters, self._sync_waiters = self._sync_waiters, []
+        try:
+            async with self._file_lock:
+                if self._active_file is not None:
+                    self._active_file.flush()
+                    await asyncio.to_thread(os.fsync, self._active_file.fileno())
+                    self.fsync_count += 1
+        except Exception as e:
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def _applier_loop(self):
+        while True:
+            try:
+                if (
+                    self._active_file is not None
+                    and self._active_size > 0
+                    and time.monotonic() - self._active_opened_at >= self.segment_max_age
+                ):
+                    await self._seal_active_segment()
+                await self.apply_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error applying spool segments: {str(e)}")
+            await asyncio.sleep(self.apply_interval)
+
+    def _quarantine(self, name: str, error: Exception):
+        os.replace(self._path(name), self._path(name + FAILED_SUFFIX))
+        self._failed_attempts.pop(name, None)
+        self.failed_segments += 1
+        logger.error(f"Spool segment {name} failed {self.apply_attempts} times, moved to {name + FAILED_SUFFIX}: {str(error)}")
+
+    def _read_segment(self, name: str):
+        by_infra = defaultdict(list)
+        record_count = 0
+        with open(self._path(name), "rb") as segment:
+            for line_number, line in enumerate(segment):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping torn record at line {line_number} of spool segment {name}")
+                    continue
+                by_infra[record.pop("infra", DEFAULT_INFRA)].append(record)
+                record_count += 1
+        return by_infra, record_count
+
+    async def _apply_segment(self, name: str) -> int:
+        path = self._path(name)
+        # segments are up to INGEST_SPOOL_SEGMENT_MAX_BYTES, read and parsed off the event loop
+        by_infra, record_count = await asyncio.to_thread(self._read_segment, name)
+
+        async with AsyncSessionLocal() as session:
+            if await session.get(SpoolSegment, name) is None:
+                for infra_name, records in by_infra.items():
+                    await self.persistence_service.insert_validated_metrics(session, records, infra_name)
+                session.add(SpoolSegment(name=name, record_count=record_count))
+                await session.commit()
+            else:
+                logger.info(f"Spool segment {name} was already applied")
+                record_count = 0
+
+        os.remove(path)
+        async with AsyncSessionLocal() as session:
+            await session.execute(delete(SpoolSegment).where(SpoolSegment.name == name))
+            await session.commit()
+
+        created_ns = int(name[len(SEGMENT_PREFIX):].split("-")[0])
+        self.last_apply_lag = max(0.0, time.time() - created_ns / 1e9)
+        self.applied_count += record_count
+        self.applied_segments += 1
+        if DEBUG:
+            logger.debug(f"Applied spool segment {name} ({record_count} records)")
+        return record_count
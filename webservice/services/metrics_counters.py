@@ -0,0 +1,152 @@
+from typing import Dict, Any, List
+import logging
+import os
+import time
+from sqlalchemy import case, desc, func, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.sql import Metrics, MetricsBlock, ColdPartition, MetricsCounter
+from services.response_cache import response_cache
+from services.time_utils import format_timestamp_ms
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+
+class MetricsCounterService:
+    """Per-infrastructure point count, first and last event time, latest `timestamp` and last
+    metrics id over every storage tier, so `/metrics/info` reads one row at any table size.
+
+    Updated in the transactions that add points (ingest) or remove them (retention), cold
+    tier exports move points without changing them. `reconcile` recomputes every counter
+    from the tables at startup.
+    """
+
+    async def apply(self, session: AsyncSession, infra_id: int, rows: List[Dict[str, Any]]):
+        """Count metrics rows just written in the session's transaction"""
+        rows = [row for row in rows if row.get("event_time") is not None]
+        if not rows:
+            return
+        last = max(reversed(rows), key=lambda row: row["event_time"])
+        ids = [row.get("id") for row in rows]
+        # ids are only returned by some insert paths, the rows just inserted hold the
+        # highest ids of the table (single writer)
+        last_id = max(ids) if None not in ids else select(func.max(Metrics.id)).scalar_subquery()
+
+        stmt = sqlite_insert(MetricsCounter).values(
+            infra_id=infra_id,
+            row_count=len(rows),
+            first_event_time=min(row["event_time"] for row in rows),
+            last_event_time=last["event_time"],
+            last_timestamp=last["timestamp"],
+            last_id=last_id
+        )
+        stored, new = MetricsCounter.__table__.c, stmt.excluded
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=["infra_id"],
+            set_={
+                "row_count": stored.row_count + new.row_count,
+                "first_event_time": func.min(func.coalesce(stored.first_event_time, new.first_event_time), new.first_event_time),
+                "last_event_time": func.max(func.coalesce(stored.last_event_time, new.last_event_time), new.last_event_time),
+                # ties go to the newest batch, like the (event_time, id) order of reads
+                "last_timestamp": case(
+                    (or_(stored.last_event_time.is_(None), new.last_event_time >= stored.last_event_time), new.last_timestamp),
+                    else_=stored.last_timestamp
+                ),
+                "last_id": func.coalesce(func.max(stored.last_id, new.last_id), stored.last_id, new.last_id)
+            }
+        ))
+
+    async def remove(self, session: AsyncSession, infra_id: int, count: int):
+        """Uncount points deleted in the session's transaction, `refresh_bounds` once done"""
+        if count:
+            response_cache.stage(session, infra_id)
+            await session.execute(
+                update(MetricsCounter)
+                .where(MetricsCounter.infra_id == infra_id)
+                .values(row_count=func.max(MetricsCounter.row_count - count, 0))
+            )
+
+    async def refresh_bounds(self, session: AsyncSession, infra_id: int):
+        """Recompute first and last event time (and latest timestamp) from the per-tier indexes,
+        after points were removed"""
+        bounds = await self.bounds(session, infra_id)
+        response_cache.stage(session, infra_id)
+        await session.execute(
+            update(MetricsCounter).where(MetricsCounter.infra_id == infra_id).values(**bounds)
+        )
+
+    async def reconcile(self, session: AsyncSession) -> int:
+        """Recompute the counters of every infrastructure holding points, the caller commits.
+        Returns the number of infrastructures."""
+        start_time = time.time()
+        counts: Dict[int, int] = {}
+        for query in (
+            select(Metrics.infra_id, func.count()).group_by(Metrics.infra_id),
+            select(MetricsBlock.infra_id, func.sum(MetricsBlock.point_count)).group_by(MetricsBlock.infra_id),
+            select(ColdPartition.infra_id, func.sum(ColdPartition.row_count)).group_by(ColdPartition.infra_id)
+        ):
+            for infra_id, count in (await session.execute(query)).all():
+                counts[infra_id] = counts.get(infra_id, 0) + int(count or 0)
+        last_ids = dict((await session.execute(
+            select(Metrics.infra_id, func.max(Metrics.id)).group_by(Metrics.infra_id)
+        )).all())
+
+        rows = [
+            {"infra_id": infra_id, "row_count": count, "last_id": last_ids.get(infra_id), **await self.bounds(session, infra_id)}
+            for infra_id, count in counts.items()
+        ]
+        for infra_id in set(counts) | set((await session.execute(select(MetricsCounter.infra_id))).scalars()):
+            response_cache.stage(session, infra_id)
+        await session.execute(MetricsCounter.__table__.delete())
+        if rows:
+            await session.execute(sqlite_insert(MetricsCounter), rows)
+        logger.info(f"Reconciled metrics counters of {len(rows)} infrastructures in {time.time() - start_time:.3f}s")
+        return len(rows)
+
+    async def get(self, session: AsyncSession, infra_id: int) -> Dict[str, Any]:
+        counter = await session.get(MetricsCounter, infra_id)
+        if counter is None:
+            return {"row_count": 0, "first_event_time": None, "last_event_time": None, "last_timestamp": None, "last_id": None}
+        return {
+            "row_count": counter.row_count,
+            "first_event_time": counter.first_event_time,
+            "last_event_time": counter.last_event_time,
+            "last_timestamp": counter.last_timestamp,
+            "last_id": counter.last_id
+        }
+
+    async def bounds(self, session: AsyncSession, infra_id: int) -> Dict[str, Any]:
+        """First and last event time (and latest timestamp) of the points stored in any tier,
+        read from the tables rather than the counter"""
+        # min/max per tier come straight from the (infra_id, time) indexes
+        hot_first, hot_last = (await session.execute(
+            select(func.min(Metrics.event_time), func.max(Metrics.event_time)).where(Metrics.infra_id == infra_id)
+        )).one()
+        block_first, block_last = (await session.execute(
+            select(func.min(MetricsBlock.start_time), func.max(MetricsBlock.end_time)).where(MetricsBlock.infra_id == infra_id)
+        )).one()
+        cold_first, cold_last = (await session.execute(
+            select(func.min(ColdPartition.min_event_time), func.max(ColdPartition.max_event_time)).where(ColdPartition.infra_id == infra_id)
+        )).one()
+
+        firsts = [value for value in (hot_first, block_first, cold_first) if value is not None]
+        lasts = [value for value in (hot_last, block_last, cold_last) if value is not None]
+        if not lasts:
+            return {"first_event_time": None, "last_event_time": None, "last_timestamp": None}
+        last_event_time = max(lasts)
+        if hot_last == last_event_time:
+            last_timestamp = await session.scalar(
+                select(Metrics.timestamp)
+                .where(Metrics.infra_id == infra_id, Metrics.event_time == last_event_time)
+                .order_by(desc(Metrics.id))
+                .limit(1)
+            )
+        else:
+            # blocks are not decoded and cold files not opened for one timestamp
+            last_timestamp = format_timestamp_ms(last_event_time)
+        return {"first_event_time": min(firsts), "last_event_time": last_event_time, "last_timestamp": last_timestamp}
+
+
+metrics_counters = MetricsCounterService()
@@ -0,0 +1,72 @@
+from typing import Dict, Any, List, Optional, Tuple, Callable, Mapping
+from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
+from services.cold_storage import COLD_COLUMNS
+
+STATUS_FIELDS = {
+    "database": "service_status_database",
+    "api_gateway": "service_status_api_gateway",
+    "cache": "service_status_cache"
+}
+
+# fields of a raw point in the API representation, in output order
+FIELDS = [column for column in COLD_COLUMNS if column not in STATUS_FIELDS.values() and column != "created_at"]
+FIELDS += ["service_status", "created_at"]
+
+# returned whatever `fields` asks for, they identify the point and resume pagination
+KEY_FIELDS = ("id", "timestamp", "event_time")
+
+# only stored in the metrics table and the cold tier, absent from block storage points
+OPTIONAL_FIELDS = ("id", "created_at")
+
+Mapper = Callable[[Mapping[str, Any]], Dict[str, Any]]
+
+
+def parse_fields(value: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Comma separated `fields` query parameter to API fields (key fields included),
+    None for every field. ValueError on unknown fields."""
+    if not value:
+        return None
+    requested = {field.strip() for field in value.split(",") if field.strip()}
+    unknown = requested - set(FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.update(KEY_FIELDS)
+    return tuple(field for field in FIELDS if field in requested)
+
+
+def storage_columns(fields: Optional[Tuple[str, ...]]) -> List[str]:
+    """Stored columns to read for `fields`, the keyset columns (event_time, id) always included"""
+    if fields is None:
+        return list(COLD_COLUMNS)
+    wanted = set(fields) | {"event_time", "id"}
+    if "service_status" in wanted:
+        wanted.update(STATUS_FIELDS.values())
+    return [column for column in COLD_COLUMNS if column in wanted]
+
+
+@lru_cache(maxsize=64)
+def get_mapper(fields: Optional[Tuple[str, ...]] = None) -> Mapper:
+    """Function turning a flat stored row (metrics table columns, from any tier) into the
+    API representation of `fields`, built once per field set"""
+    fields = tuple(FIELDS) if fields is None else fields
+    plain = [field for field in fields if field not in OPTIONAL_FIELDS and field != "service_status"]
+    get_plain = itemgetter(*plain) if len(plain) > 1 else (lambda row: (row[plain[0]],)) if plain else (lambda row: ())
+    with_status = "service_status" in fields
+    with_id = "id" in fields
+    with_created_at = "created_at" in fields
+
+    def map_row(row: Mapping[str, Any]) -> Dict[str, Any]:
+        metrics = {}
+        if with_id and row.get("id") is not None:
+            metrics["id"] = row["id"]
+        metrics.update(zip(plain, get_plain(row)))
+        if with_status:
+            metrics["service_status"] = {service: row.get(column) for service, column in STATUS_FIELDS.items()}
+        if with_created_at and row.get("created_at") is not None:
+            created_at = row["created_at"]
+            metrics["created_at"] = created_at.isoformat() if isinstance(created_at, datetime) else created_at
+        return metrics
+
+    return map_row
@@ -1,82 +1,226 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator, Callable, Awaitable
+import heapq
+import itertools
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import desc
-from models.sql import Metrics
+from sqlalchemy import desc, tuple_
+from models.sql import Infrastructure, Metrics
+from services.identity_cache import identity_cache
+from services.block_storage import block_storage
+from services.cold_storage import cold_storage
+from services.hot_window import hot_window
+from services.persistence import DEFAULT_USERNAME
+from services.metrics_projection import FIELDS, get_mapper, storage_columns
+from services.row_merge import Cursor, row_key, after_cursor, merge_newest_first
 import logging
 
 logger = logging.getLogger(__name__)
 
+LATEST_FIELDS = tuple(field for field in FIELDS if field not in ("id", "event_time", "created_at"))
+HISTORICAL_FIELDS = tuple(field for field in FIELDS if field not in ("id", "created_at"))
+
 
 class MetricsService:
-    async def get_latest_metrics(self, session: AsyncSession) -> Optional[Dict[str, Any]]:
+    async def get_infra_id(self, session: AsyncSession, infra_name: str) -> Optional[int]:
         try:
-            result = await session.execute(
-                select(Metrics).order_by(desc(Metrics.timestamp)).limit(1)
-            )
-            metric = result.scalar_one_or_none()
-            
-            if metric:
-                return {
-                    "timestamp": metric.timestamp,
-                    "cpu_usage": metric.cpu_usage,
-                    "memory_usage": metric.memory_usage,
-                    "latency_ms": metric.latency_ms,
-                    "disk_usage": metric.disk_usage,
-                    "network_in_kbps": metric.network_in_kbps,
-                    "network_out_kbps": metric.network_out_kbps,
-                    "io_wait": metric.io_wait,
-                    "thread_count": metric.thread_count,
-                    "active_connections": metric.active_connections,
-                    "error_rate": metric.error_rate,
-                    "uptime_seconds": metric.uptime_seconds,
-                    "temperature_celsius": metric.temperature_celsius,
-                    "power_consumption_watts": metric.power_consumption_watts,
-                    "service_status": {
-                        "database": metric.service_status_database,
-                        "api_gateway": metric.service_status_api_gateway,
-                        "cache": metric.service_status_cache
-                    }
-                }
+            _, infra_id = await identity_cache.resolve(session, DEFAULT_USERNAME, infra_name)
+            return infra_id
+        except ValueError:
             return None
+
+    async def get_latest_metrics(self, session: AsyncSession, infra_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            metrics = await self.get_metrics_range(session, infra_id, None, None, 1, LATEST_FIELDS)
+            return metrics[0] if metrics else None
         except Exception as e:
             logger.error(f"Error getting latest metrics from DB: {str(e)}")
             return None
 
-    async def get_historical_metrics(self, session: AsyncSession, points: int = 50) -> List[Dict[str, Any]]:
+    async def get_historical_metrics(self, session: AsyncSession, infra_id: int, points: int = 50) -> List[Dict[str, Any]]:
         try:
-            result = await session.execute(
-                select(Metrics).order_by(desc(Metrics.timestamp)).limit(points)
-            )
-            metrics = result.scalars().all()
-            
-            metrics_list = []
-            for metric in metrics:
-                metrics_list.append({
-                    "timestamp": metric.timestamp,
-                    "cpu_usage": metric.cpu_usage,
-                    "memory_usage": metric.memory_usage,
-                    "latency_ms": metric.latency_ms,
-                    "disk_usage": metric.disk_usage,
-                    "network_in_kbps": metric.network_in_kbps,
-                    "network_out_kbps": metric.network_out_kbps,
-                    "io_wait": metric.io_wait,
-                    "thread_count": metric.thread_count,
-                    "active_connections": metric.active_connections,
-                    "error_rate": metric.error_rate,
-                    "uptime_seconds": metric.uptime_seconds,
-                    "temperature_celsius": metric.temperature_celsius,
-                    "power_consumption_watts": metric.power_consumption_watts,
-                    "service_status": {
-                        "database": metric.service_status_database,
-                        "api_gateway": metric.service_status_api_gateway,
-                        "cache": metric.service_status_cache
-                    }
-                })
+            metrics_list = await self.get_metrics_range(session, infra_id, None, None, points, HISTORICAL_FIELDS)
             
             logger.info(f"Retrieved {len(metrics_list)} historical metrics")
             return metrics_list
             
         except Exception as e:
             logger.error(f"Error getting historical metrics from DB: {str(e)}")
-            return [] 
\ No newline at end of file
+            return []
+
+    async def get_metrics_range(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        limit: int,
+        fields: Optional[Tuple[str, ...]] = None,
+        before: Optional[Cursor] = None
+    ) -> List[Dict[str, Any]]:
+        """Most recent `limit` raw points in the range, newest first. Served from the hot window
+        when it covers the range, else hot SQLite rows merged with the Parquet cold tier and the
+        block storage. `fields` (API field names, None for all) projects every read, `before` is
+        a keyset cursor (see `row_merge.next_cursor`): only the points ordered after it are returned."""
+        map_row = get_mapper(fields)
+        if hot_window.enabled and before is None:
+            rows = await hot_window.select(infra_id, self._hot_window_loader(infra_id), start_ms, end_ms, limit)
+            if rows is not None:
+                return [map_row(row) for row in rows]
+        
+        rows = await self._read_stored_rows(session, infra_id, start_ms, end_ms, limit, storage_columns(fields), before)
+        return [map_row(row) for row in rows]
+
+    async def iter_metrics_range(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        before: Optional[Cursor] = None,
+        batch_size: int = 1000,
+        fields: Optional[Tuple[str, ...]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Every raw point in the range, newest first. SQLite rows are streamed from a server side
+        cursor `batch_size` at a time and cold files and blocks are loaded one at a time, so memory
+        does not grow with the range."""
+        if before is not None:
+            end_ms = before[0] if end_ms is None else min(end_ms, before[0])
+        map_row = get_mapper(fields)
+        columns = storage_columns(fields)
+        result = await session.stream(
+            self._table_query(infra_id, start_ms, end_ms, before, columns).execution_options(yield_per=batch_size)
+        )
+        try:
+            rows = merge_newest_first(
+                _mappings(result),
+                _keyset(cold_storage.iter_range(session, infra_id, start_ms, end_ms, columns), before),
+                _keyset(block_storage.iter_range(session, infra_id, start_ms, end_ms, columns), before)
+            )
+            async for row in rows:
+                yield map_row(row)
+        finally:
+            await result.close()
+
+    async def scan_metrics(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        metrics: List[str]
+    ) -> Dict[str, np.ndarray]:
+        """Every raw point in the range from every tier as one float64 NumPy array per metric
+        plus `event_time`, unordered, missing values as NaN"""
+        columns = ["event_time"] + list(metrics)
+        query = select(*[getattr(Metrics, column) for column in columns]).where(Metrics.infra_id == infra_id)
+        if start_ms is not None:
+            query = query.where(Metrics.event_time >= start_ms)
+        if end_ms is not None:
+            query = query.where(Metrics.event_time <= end_ms)
+        rows = (await session.execute(query)).all()
+        table = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+        parts = [{column: table[:, j] for j, column in enumerate(columns)}]
+
+        parts.append(await cold_storage.scan(session, infra_id, start_ms, end_ms, columns))
+        blocks = await block_storage.scan(session, infra_id, start_ms, end_ms)
+        parts.append({column: blocks[column].astype(np.float64) for column in columns})
+        return {column: np.concatenate([part[column] for part in parts]) for column in columns}
+
+    async def get_hot_window(self, infra_id: int):
+        return await hot_window.get_window(infra_id, self._hot_window_loader(infra_id))
+
+    async def hydrate_hot_window(self, session: AsyncSession):
+        """Load the windows of the first infrastructures at startup"""
+        result = await session.execute(select(Infrastructure.id).order_by(Infrastructure.id).limit(hot_window.max_infras))
+        for infra_id in result.scalars().all():
+            await hot_window.hydrate(infra_id, self._hot_window_loader(infra_id))
+        logger.info(f"Hot window hydrated for {hot_window.get_stats()['resident_infras']} infrastructures")
+
+    def _hot_window_loader(self, infra_id: int):
+        async def load(session: AsyncSession) -> List[Dict[str, Any]]:
+            return await self._read_stored_rows(session, infra_id, None, None, hot_window.capacity)
+        return load
+
+    async def _read_stored_rows(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        limit: int,
+        columns: Optional[List[str]] = None,
+        before: Optional[Cursor] = None
+    ) -> List[Dict[str, Any]]:
+        """Flat stored rows (metrics table columns) of every tier, newest first"""
+        if before is not None:
+            end_ms = before[0] if end_ms is None else min(end_ms, before[0])
+        result = await session.execute(self._table_query(infra_id, start_ms, end_ms, before, columns).limit(limit))
+        rows = [dict(row) for row in result.mappings()]
+        
+        # cold rows are older than the hot ones, a full page of hot rows bounds the cold range
+        cold_start_ms = start_ms
+        if len(rows) == limit:
+            cold_start_ms = max(start_ms or 0, rows[-1]["event_time"])
+        cold_rows = await _read_before(
+            lambda fetch: cold_storage.read(session, infra_id, cold_start_ms, end_ms, fetch, columns), limit, before
+        )
+        block_rows = await _read_before(
+            lambda fetch: block_storage.get_metrics_range(session, infra_id, start_ms, end_ms, fetch, columns), limit, before
+        )
+        if cold_rows or block_rows:
+            rows = heapq.merge(rows, cold_rows, block_rows, key=row_key, reverse=True)
+        
+        return list(itertools.islice(rows, limit))
+
+    @staticmethod
+    def _table_query(
+        infra_id: int,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        before: Optional[Cursor],
+        columns: Optional[List[str]] = None
+    ):
+        query = (
+            select(*[getattr(Metrics, column) for column in columns or storage_columns(None)])
+            .where(Metrics.infra_id == infra_id)
+            .order_by(desc(Metrics.event_time), desc(Metrics.id))
+        )
+        if start_ms is not None:
+            query = query.where(Metrics.event_time >= start_ms)
+        if end_ms is not None:
+            query = query.where(Metrics.event_time <= end_ms)
+        if before is not None:
+            # table rows all have an id, the count of id-less points returned does not apply
+            query = query.where(tuple_(Metrics.event_time, Metrics.id) < before[:2])
+        return query
+
+
+async def _read_before(
+    read: Callable[[int], Awaitable[List[Dict[str, Any]]]],
+    limit: int,
+    before: Optional[Cursor]
+) -> List[Dict[str, Any]]:
+    """`limit` newest rows ordered after the cursor, from a read bounded by the cursor's event time
+    only: rows sharing that event time but already returned are dropped and refetched"""
+    if before is None:
+        return await read(limit)
+    fetch = limit
+    while True:
+        rows = await read(fetch)
+        kept = list(filter(after_cursor(before), rows))
+        if len(kept) >= limit or len(rows) < fetch:
+            return kept[:limit]
+        fetch *= 2
+
+
+async def _keyset(rows: AsyncIterator[Dict[str, Any]], before: Optional[Cursor]) -> AsyncIterator[Dict[str, Any]]:
+    keep = after_cursor(before) if before is not None else None
+    async for row in rows:
+        if keep is None or keep(row):
+            yield row
+
+
+async def _mappings(result) -> AsyncIterator[Dict[str, Any]]:
+    async for row in result.mappings():
+        yield dict(row)
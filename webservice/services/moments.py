@@ -0,0 +1,112 @@
+from typing import Dict, Tuple
+from collections import defaultdict
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from db import Base, engine
+
+# metrics of the dashboard correlation matrix, in matrix order
+CORRELATION_METRICS = [
+    "cpu_usage", "memory_usage", "latency_ms", "disk_usage",
+    "network_in_kbps", "network_out_kbps", "io_wait",
+    "active_connections", "error_rate",
+    "temperature_celsius", "power_consumption_watts"
+]
+
+# upper triangle (diagonal included) of the co-moment matrix, as stored
+TRIANGLE = np.triu_indices(len(CORRELATION_METRICS))
+
+Moments = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+_WRITTEN_KEY = "moments_written_infras"
+
+# bumped once a transaction that changed an infrastructure's moments commits
+_generations: Dict[int, int] = defaultdict(int)
+
+
+def group_moments(values: np.ndarray, groups: np.ndarray, k: int) -> Moments:
+    """Per group point count (k,), means (k, m) and co-moment triangles (k, t) of the rows of
+    `values` (n, m), `groups` (n,) holding each row's group in [0, k)"""
+    counts = np.bincount(groups, minlength=k).astype(np.float64)
+    means = np.stack([np.bincount(groups, weights=column, minlength=k) for column in values.T], axis=1)
+    means /= np.maximum(counts, 1)[:, None]
+    centered = values - means[groups]
+    products = centered[:, TRIANGLE[0]] * centered[:, TRIANGLE[1]]
+    comoments = np.stack([np.bincount(groups, weights=column, minlength=k) for column in products.T], axis=1)
+    return counts, means, comoments
+
+
+def merge_moments(counts: np.ndarray, means: np.ndarray, comoments: np.ndarray) -> Moments:
+    """Combine partial moments (count (p,), means (p, m), triangles (p, t)) of disjoint point
+    sets into one (Chan et al. pairwise update, generalized to p parts)"""
+    total = counts.sum()
+    if total == 0:
+        m = means.shape[1]
+        return np.float64(0), np.zeros(m), np.zeros(len(TRIANGLE[0]))
+    mean = (counts[:, None] * means).sum(axis=0) / total
+    offsets = means - mean
+    comoment = comoments.sum(axis=0) + (counts[:, None] * offsets[:, TRIANGLE[0]] * offsets[:, TRIANGLE[1]]).sum(axis=0)
+    return total, mean, comoment
+
+
+def correlation_matrix(comoment: np.ndarray) -> np.ndarray:
+    """Pearson correlation matrix from a co-moment triangle, NaN where a variance is zero"""
+    m = len(CORRELATION_METRICS)
+    matrix = np.zeros((m, m))
+    matrix[TRIANGLE] = comoment
+    matrix = matrix + np.triu(matrix, 1).T
+    deviations = np.sqrt(np.diag(matrix))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = matrix / np.outer(deviations, deviations)
+    return np.clip(correlation, -1.0, 1.0)
+
+
+def _merge_means(count, means, other_count, other_means) -> bytes:
+    total = count + other_count
+    mean = (count * np.frombuffer(means) + other_count * np.frombuffer(other_means)) / total
+    return mean.tobytes()
+
+
+def _merge_comoments(count, means, comoments, other_count, other_means, other_comoments) -> bytes:
+    _, _, comoment = merge_moments(
+        np.array([count, other_count], dtype=np.float64),
+        np.stack([np.frombuffer(means), np.frombuffer(other_means)]),
+        np.stack([np.frombuffer(comoments), np.frombuffer(other_comoments)])
+    )
+    return comoment.tobytes()
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _register_functions(dbapi_connection, connection_record):
+    # the moments upsert merges the stored blobs with the new ones inside SQLite, no read
+    # round trip in the ingest transaction
+    dbapi_connection.create_function("moments_merge_means", 4, _merge_means, deterministic=True)
+    dbapi_connection.create_function("moments_merge_comoments", 6, _merge_comoments, deterministic=True)
+
+
+def mark_written(session, infra_id: int):
+    """Bump the infrastructure's generation once the session's transaction commits"""
+    session.info.setdefault(_WRITTEN_KEY, set()).add(infra_id)
+
+
+def generation(infra_id: int) -> int:
+    return _generations[infra_id]
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_generations(session):
+    for infra_id in session.info.pop(_WRITTEN_KEY, ()):
+        _generations[infra_id] += 1
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_written(session, previous_transaction):
+    session.info.pop(_WRITTEN_KEY, None)
+
+
+def _reset(*args, **kwargs):
+    for infra_id in list(_generations):
+        _generations[infra_id] += 1
+
+
+event.listen(Base.metadata, "after_drop", _reset)
@@ -1,47 +1,60 @@
 from typing import Dict, Any, List, Optional
 import logging
+import os
+from sqlalchemy import insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
-from models.sql import User, Infrastructure, Metrics
+from models.sql import Metrics
+from services.block_storage import block_storage
+from services.hot_window import hot_window
+from services.identity_cache import identity_cache
+from services.metrics_counters import metrics_counters
+from services.response_cache import response_cache
+from services.rollups import RollupService, ROLLUPS_ENABLED
+from services.time_utils import parse_timestamp_ms
 from services.validation import ValidationService
 
 logger = logging.getLogger(__name__)
 
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+DEFAULT_USERNAME = "jean"
+DEFAULT_INFRA = "default"
+# names an ingest may register: letters, digits and . _ : - (no leading separator)
+INFRA_NAME_PATTERN = r"^[A-Za-z0-9][A-Za-z0-9._:-]*$"
+INFRA_NAME_MAX_LENGTH = 64
+# false: ingesting for an unknown infrastructure is refused instead of registering it
+INFRA_AUTO_REGISTER = os.getenv("INFRA_AUTO_REGISTER", "true").lower() == "true"
+
 
 class PersistenceService:
     def __init__(self):
         self.validation_service = ValidationService()
+        self.rollup_service = RollupService()
+        self.auto_register = INFRA_AUTO_REGISTER
 
-    async def store_metrics(self, session: AsyncSession, metrics_data: Dict[str, Any]) -> bool:
+    async def store_metrics(self, session: AsyncSession, metrics_data: Dict[str, Any], infra_name: str = DEFAULT_INFRA) -> bool:
         try:
-            user = await self._get_user(session, "jean")
-            infra = await self._get_infrastructure(session, "default", user.id)
+            if block_storage.enabled:
+                await self.insert_validated_metrics(session, [metrics_data], infra_name)
+                await session.commit()
+                
+                logger.info(f"Metrics stored successfully in block storage of infrastructure '{infra_name}'")
+                return True
             
-            metrics = Metrics(
-                infra_id=infra.id,
-                user_id=user.id,
-                timestamp=metrics_data["timestamp"],
-                cpu_usage=metrics_data["cpu_usage"],
-                memory_usage=metrics_data["memory_usage"],
-                latency_ms=metrics_data["latency_ms"],
-                disk_usage=metrics_data["disk_usage"],
-                network_in_kbps=metrics_data["network_in_kbps"],
-                network_out_kbps=metrics_data["network_out_kbps"],
-                io_wait=metrics_data["io_wait"],
-                thread_count=metrics_data["thread_count"],
-                active_connections=metrics_data["active_connections"],
-                error_rate=metrics_data["error_rate"],
-                uptime_seconds=metrics_data["uptime_seconds"],
-                temperature_celsius=metrics_data["temperature_celsius"],
-                power_consumption_watts=metrics_data["power_consumption_watts"],
-                service_status_database=metrics_data["service_status"]["database"],
-                service_status_api_gateway=metrics_data["service_status"]["api_gateway"],
-                service_status_cache=metrics_data["service_status"]["cache"]
-            )
+            user_id, infra_id = await identity_cache.resolve(session, DEFAULT_USERNAME, infra_name, create=self.auto_register)
+            
+            row = self._to_row(metrics_data, user_id, infra_id)
+            metrics = Metrics(**row)
             
             session.add(metrics)
+            await session.flush()
+            await metrics_counters.apply(session, infra_id, [{**row, "id": metrics.id}])
+            response_cache.stage(session, infra_id)
+            if ROLLUPS_ENABLED:
+                await self.rollup_service.apply(session, infra_id, [row])
             await session.commit()
             await session.refresh(metrics)
+            if hot_window.enabled:
+                hot_window.append(infra_id, [{**row, "id": metrics.id, "created_at": metrics.created_at}])
             
             logger.info(f"Metrics stored successfully with ID: {metrics.id}")
             return True
@@ -51,49 +64,77 @@ class PersistenceService:
             await session.rollback()
             return False
 
-    async def store_metrics_batch(self, session: AsyncSession, metrics_list: List[Dict[str, Any]]) -> Dict[str, int]:
-        stored_count = 0
-        failed_count = 0
+    async def store_metrics_batch(self, session: AsyncSession, metrics_list: List[Dict[str, Any]], infra_name: str = DEFAULT_INFRA) -> Dict[str, int]:
+        valid_metrics, failed_count = self.validation_service.validate_metrics_batch(metrics_list)
         
-        for i, metrics_data in enumerate(metrics_list):
-            try:
-                validation_result = self.validation_service.validate_metrics(metrics_data)
-                
-                if not validation_result.is_valid:
-                    logger.warning(f"Metrics at index {i} failed validation: {len(validation_result.errors)} errors")
-                    for error in validation_result.errors:
-                        logger.debug(f"  - {error.field}: {error.message}")
-                    failed_count += 1
-                    continue
-                
-                success = await self.store_metrics(session, validation_result.data)
-                if success:
-                    stored_count += 1
-                else:
-                    failed_count += 1
-                    
-            except Exception as e:
-                logger.error(f"Error processing metrics at index {i}: {str(e)}")
-                failed_count += 1
+        stored_count = await self.store_validated_metrics(session, valid_metrics, infra_name)
+        failed_count += len(valid_metrics) - stored_count
         
         logger.info(f"Batch processing completed: {stored_count} stored, {failed_count} failed")
         return {"stored": stored_count, "failed": failed_count}
 
-    async def _get_user(self, session: AsyncSession, username: str) -> User:
-        result = await session.execute(select(User).where(User.username == username))
-        user = result.scalar_one()
-        if not user:
-            raise ValueError(f"User '{username}' not found")
-        return user
+    async def store_validated_metrics(self, session: AsyncSession, metrics_list: List[Dict[str, Any]], infra_name: str = DEFAULT_INFRA) -> int:
+        """Insert already validated metrics in a single transaction, returns the number of stored rows"""
+        if not metrics_list:
+            return 0
+        
+        try:
+            stored_count = await self.insert_validated_metrics(session, metrics_list, infra_name)
+            await session.commit()
+            
+            logger.info(f"Bulk stored {stored_count} metrics for infrastructure '{infra_name}'")
+            return stored_count
+            
+        except Exception as e:
+            logger.error(f"Error bulk storing metrics: {str(e)}")
+            await session.rollback()
+            return 0
+
+    async def insert_validated_metrics(self, session: AsyncSession, metrics_list: List[Dict[str, Any]], infra_name: str = DEFAULT_INFRA) -> int:
+        """Chunked executemany insert (or block storage append), the caller owns the transaction"""
+        user_id, infra_id = await identity_cache.resolve(session, DEFAULT_USERNAME, infra_name, create=self.auto_register)
+        
+        rows = [self._to_row(metrics_data, user_id, infra_id) for metrics_data in metrics_list]
+        if block_storage.enabled:
+            await block_storage.insert_rows(session, infra_id, rows)
+        elif hot_window.enabled:
+            # the window keeps the generated id and created_at of each row
+            stmt = insert(Metrics).returning(Metrics.id, Metrics.created_at, sort_by_parameter_order=True)
+            for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                result = await session.execute(stmt, rows[start:start + BULK_CHUNK_SIZE])
+                for row, (metrics_id, created_at) in zip(rows[start:start + BULK_CHUNK_SIZE], result.all()):
+                    row["id"] = metrics_id
+                    row["created_at"] = created_at
+        else:
+            for start in range(0, len(rows), BULK_CHUNK_SIZE):
+                await session.execute(insert(Metrics), rows[start:start + BULK_CHUNK_SIZE])
+        await metrics_counters.apply(session, infra_id, rows)
+        response_cache.stage(session, infra_id)
+        hot_window.stage(session, infra_id, rows)
+        if ROLLUPS_ENABLED:
+            await self.rollup_service.apply(session, infra_id, rows)
+        return len(rows)
 
-    async def _get_infrastructure(self, session: AsyncSession, name: str, user_id: int) -> Infrastructure:
-        result = await session.execute(
-            select(Infrastructure).where(
-                Infrastructure.name == name,
-                Infrastructure.user_id == user_id
-            )
-        )
-        infra = result.scalar_one()
-        if not infra:
-            raise ValueError(f"Infrastructure '{name}' not found for user {user_id}")
-        return infra 
\ No newline at end of file
+    def _to_row(self, metrics_data: Dict[str, Any], user_id: int, infra_id: int) -> Dict[str, Any]:
+        return {
+            "infra_id": infra_id,
+            "user_id": user_id,
+            "timestamp": metrics_data["timestamp"],
+            "event_time": parse_timestamp_ms(metrics_data["timestamp"]),
+            "cpu_usage": metrics_data["cpu_usage"],
+            "memory_usage": metrics_data["memory_usage"],
+            "latency_ms": metrics_data["latency_ms"],
+            "disk_usage": metrics_data["disk_usage"],
+            "network_in_kbps": metrics_data["network_in_kbps"],
+            "network_out_kbps": metrics_data["network_out_kbps"],
+            "io_wait": metrics_data["io_wait"],
+            "thread_count": metrics_data["thread_count"],
+            "active_connections": metrics_data["active_connections"],
+            "error_rate": metrics_data["error_rate"],
+            "uptime_seconds": metrics_data["uptime_seconds"],
+            "temperature_celsius": metrics_data["temperature_celsius"],
+            "power_consumption_watts": metrics_data["power_consumption_watts"],
+            "service_status_database": metrics_data["service_status"]["database"],
+            "service_status_api_gateway": metrics_data["service_status"]["api_gateway"],
+            "service_status_cache": metrics_data["service_status"]["cache"]
+        }
@@ -0,0 +1,120 @@
+from typing import List, Optional, Sequence, Tuple
+from array import array
+import sys
+import numpy as np
+from sqlalchemy import event
+from db import engine
+
+# DDSketch (Masson et al.): a value is counted in the logarithmic bucket holding it, any
+# quantile is then returned within RELATIVE_ACCURACY of the exact one, and two sketches
+# merge exactly by adding their bucket counts. Changing the accuracy requires a rollup rebuild.
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = np.log(GAMMA)
+# smaller magnitudes are counted as zero
+MIN_INDEXABLE = 1e-9
+# signed keys: 0 for zero, key + OFFSET for positive values, -(key + OFFSET) for negative
+# ones, so sorting keys sorts the values they stand for
+OFFSET = 1 - int(np.ceil(np.log(MIN_INDEXABLE) / LOG_GAMMA))
+
+Sketch = Tuple[np.ndarray, np.ndarray]
+
+
+def sketch_keys(values: np.ndarray) -> np.ndarray:
+    """Signed bucket key (int64) of every value, NaN values excluded by the caller"""
+    magnitudes = np.abs(values)
+    indexable = magnitudes >= MIN_INDEXABLE
+    keys = np.zeros(values.shape, dtype=np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        keys[indexable] = np.ceil(np.log(magnitudes[indexable]) / LOG_GAMMA).astype(np.int64) + OFFSET
+    return np.where(values < 0, -keys, keys)
+
+
+def key_values(keys: np.ndarray) -> np.ndarray:
+    """Value each signed key stands for, the point of its bucket with the lowest relative error"""
+    magnitudes = np.abs(keys) - OFFSET
+    values = 2 * np.power(GAMMA, magnitudes.astype(np.float64)) / (GAMMA + 1)
+    return np.where(keys == 0, 0.0, np.sign(keys) * values)
+
+
+def encode(keys: np.ndarray, counts: np.ndarray) -> bytes:
+    """Sorted keys (int32) followed by their counts (int64)"""
+    return keys.astype("<i4").tobytes() + counts.astype("<i8").tobytes()
+
+
+def decode(blob: bytes) -> Sketch:
+    n = len(blob) // 12
+    return np.frombuffer(blob, "<i4", n).astype(np.int64), np.frombuffer(blob, "<i8", n, offset=4 * n)
+
+
+def group_sketches(keys: np.ndarray, groups: np.ndarray, k: int) -> List[Optional[bytes]]:
+    """Encoded sketch of every group in [0, k) of the signed `keys`, None for empty groups"""
+    if not len(keys):
+        return [None] * k
+    combined = groups.astype(np.int64) * (1 << 32) + (keys + (1 << 31))
+    unique, counts = np.unique(combined, return_counts=True)
+    unique_groups = unique >> 32
+    unique_keys = (unique & 0xFFFFFFFF) - (1 << 31)
+    bounds = np.searchsorted(unique_groups, np.arange(k + 1))
+    return [
+        encode(unique_keys[bounds[g]:bounds[g + 1]], counts[bounds[g]:bounds[g + 1]])
+        if bounds[g + 1] > bounds[g] else None
+        for g in range(k)
+    ]
+
+
+def merge(blobs: Sequence[Optional[bytes]]) -> Sketch:
+    """Sorted keys and counts of the union of encoded sketches"""
+    decoded = [decode(blob) for blob in blobs if blob]
+    if not decoded:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    keys = np.concatenate([keys for keys, _ in decoded])
+    counts = np.concatenate([counts for _, counts in decoded])
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+
+
+def quantiles(sketch: Sketch, qs: Sequence[float], low: float, high: float) -> List[Optional[float]]:
+    """Values at the quantiles `qs` (in [0, 1]) of a merged sketch, clamped to the exact
+    minimum and maximum of the points, None for an empty sketch"""
+    keys, counts = sketch
+    total = counts.sum()
+    if total == 0:
+        return [None] * len(qs)
+    cumulative = np.cumsum(counts)
+    ranks = np.asarray(qs, dtype=np.float64) * (total - 1)
+    values = key_values(keys[np.searchsorted(cumulative, ranks, side="right")])
+    return np.clip(values, low, high).tolist()
+
+
+def _merge_blobs(blob, other) -> Optional[bytes]:
+    # called once per upserted bucket on small sketches, plain Python beats NumPy's call overhead
+    if not blob or not other:
+        return blob or other
+    merged = dict(zip(*_decode_array(blob)))
+    for key, count in zip(*_decode_array(other)):
+        merged[key] = merged.get(key, 0) + count
+    keys = sorted(merged)
+    return _encode_array(array("i", keys), array("q", [merged[key] for key in keys]))
+
+
+def _decode_array(blob: bytes) -> Tuple[array, array]:
+    n = len(blob) // 12
+    keys, counts = array("i", blob[:4 * n]), array("q", blob[4 * n:])
+    if sys.byteorder == "big":
+        keys.byteswap()
+        counts.byteswap()
+    return keys, counts
+
+
+def _encode_array(keys: array, counts: array) -> bytes:
+    if sys.byteorder == "big":
+        keys.byteswap()
+        counts.byteswap()
+    return keys.tobytes() + counts.tobytes()
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _register_functions(dbapi_connection, connection_record):
+    # rollup upserts merge the stored sketch with the new one inside SQLite
+    dbapi_connection.create_function("quantile_sketch_merge", 2, _merge_blobs, deterministic=True)
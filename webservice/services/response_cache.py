@@ -0,0 +1,116 @@
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+from collections import OrderedDict, defaultdict
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from db import Base
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+# bounds the staleness of responses depending on the clock (ranges ending now)
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "30"))
+
+_STAGED_KEY = "response_cache_infras"
+
+Key = Tuple[str, Optional[int], Tuple[Tuple[str, Any], ...]]
+
+
+class ResponseCache:
+    """Read-through cache of GET endpoint results keyed on (endpoint, infra_id, normalized
+    params), valid while the infrastructure's data version is unchanged.
+
+    The persistence layer and retention bump the version of an infrastructure once a
+    transaction changing its points commits (`stage`) or right after (`bump`). Entries also
+    expire after `ttl` seconds, the least recently used ones are evicted past `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, ttl: float = RESPONSE_CACHE_TTL_S, enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: "OrderedDict[Key, Tuple[int, float, Any]]" = OrderedDict()
+        self._versions: Dict[Optional[int], int] = defaultdict(int)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, infra_id: Optional[int]) -> int:
+        return self._versions[infra_id]
+
+    async def get_or_compute(
+        self,
+        endpoint: str,
+        infra_id: Optional[int],
+        params: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Cached result of `compute` for these params, computed and stored on a miss.
+        Params set to None are ignored, `infra_id` None is never invalidated by ingestion."""
+        if not self.enabled:
+            return await compute()
+
+        key = (endpoint, infra_id, tuple(sorted((name, value) for name, value in params.items() if value is not None)))
+        version = self._versions[infra_id]
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None and entry[0] == version and entry[1] > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        value = await compute()
+        # a commit during the computation bumped the version, the entry is already stale
+        self._entries[key] = (version, now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def stage(self, session, infra_id: int):
+        """Bump the infrastructure's version once the session's transaction commits"""
+        session.info.setdefault(_STAGED_KEY, set()).add(infra_id)
+
+    def bump(self, infra_id: int):
+        self._versions[infra_id] += 1
+
+    def clear(self):
+        for infra_id in list(self._versions):
+            self._versions[infra_id] += 1
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions
+        }
+
+
+response_cache = ResponseCache()
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_staged(session):
+    for infra_id in session.info.pop(_STAGED_KEY, ()):
+        response_cache.bump(infra_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_staged(session, previous_transaction):
+    session.info.pop(_STAGED_KEY, None)
+
+
+def _clear(*args, **kwargs):
+    response_cache.clear()
+
+
+event.listen(Base.metadata, "after_drop", _clear)
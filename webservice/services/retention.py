@@ -0,0 +1,254 @@
+from typing import Dict, Any, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+from sqlalchemy import delete, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db import AsyncSessionLocal, engine
+from models.sql import Infrastructure, Metrics, MetricsRollup, ServiceStatusRollup, MetricsMoments, RetentionPolicy
+from services.block_storage import block_storage
+from services.cold_storage import cold_storage
+from services.hot_window import hot_window
+from services.metrics_counters import metrics_counters
+from services.moments import mark_written
+from services.response_cache import response_cache
+from services.rollups import RESOLUTIONS
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+# 0 keeps data forever, only infrastructures with an explicit policy (or these set) are purged
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "0"))
+RETENTION_ROLLUP_DAYS = int(os.getenv("RETENTION_ROLLUP_DAYS", "0"))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL_S", "300"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+
+DAY_MS = 86_400_000
+
+
+class RetentionService:
+    """Purges raw metrics and rollups older than each infrastructure's policy.
+
+    Rows are deleted in batches of `batch_size`, one short writer transaction per batch so
+    ingestion is never blocked for long. Cold tier files and storage blocks whose rows are all
+    expired are deleted with the raw rows. Freed pages are returned to the filesystem with `PRAGMA incremental_vacuum`. A retention of 0 days keeps data forever.
+    """
+
+    def __init__(
+        self,
+        raw_days: int = RETENTION_RAW_DAYS,
+        rollup_days: int = RETENTION_ROLLUP_DAYS,
+        interval: float = RETENTION_INTERVAL,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        vacuum_pages: int = RETENTION_VACUUM_PAGES
+    ):
+        self.raw_days = raw_days
+        self.rollup_days = rollup_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+
+        self._task: Optional[asyncio.Task] = None
+        self._run_lock = asyncio.Lock()
+
+        self.run_count = 0
+        self.purged_raw_count = 0
+        self.purged_rollup_count = 0
+        self.dropped_cold_file_count = 0
+        self.vacuumed_pages = 0
+        self.last_run_seconds = 0.0
+        self.total_run_seconds = 0.0
+        self.last_run_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._retention_loop())
+        logger.info(f"Retention started (raw={self.raw_days}d, rollups={self.rollup_days}d, interval={self.interval:.0f}s)")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        logger.info("Retention stopped")
+
+    async def get_policies(self, session: AsyncSession) -> List[Dict[str, Any]]:
+        result = await session.execute(
+            select(Infrastructure.id, Infrastructure.name, RetentionPolicy.raw_days, RetentionPolicy.rollup_days)
+            .outerjoin(RetentionPolicy, RetentionPolicy.infra_id == Infrastructure.id)
+            .order_by(Infrastructure.id)
+        )
+        return [
+            {
+                "infra_id": infra_id,
+                "infra": name,
+                "raw_days": raw_days if raw_days is not None else self.raw_days,
+                "rollup_days": rollup_days if rollup_days is not None else self.rollup_days
+            }
+            for infra_id, name, raw_days, rollup_days in result.all()
+        ]
+
+    async def set_policy(self, session: AsyncSession, infra_id: int, raw_days: Optional[int], rollup_days: Optional[int]):
+        policy = await session.get(RetentionPolicy, infra_id)
+        if policy is None:
+            policy = RetentionPolicy(infra_id=infra_id)
+            session.add(policy)
+        policy.raw_days = raw_days
+        policy.rollup_days = rollup_days
+        await session.commit()
+
+    async def run_once(self, now_ms: Optional[int] = None) -> Dict[str, Any]:
+        """One purge pass over every infrastructure followed by an incremental vacuum"""
+        async with self._run_lock:
+            start_time = time.time()
+            now_ms = now_ms if now_ms is not None else int(start_time * 1000)
+
+            async with AsyncSessionLocal() as session:
+                policies = await self.get_policies(session)
+
+            purged_raw = 0
+            purged_rollups = 0
+            dropped_cold_files = 0
+            for policy in policies:
+                if policy["raw_days"] > 0:
+                    cutoff_ms = now_ms - policy["raw_days"] * DAY_MS
+                    purged = await self._purge_raw(policy["infra_id"], cutoff_ms)
+                    purged += await block_storage.purge(policy["infra_id"], cutoff_ms)
+                    dropped = await cold_storage.drop_partitions(policy["infra_id"], cutoff_ms)
+                    if purged or dropped:
+                        # the window may still hold purged points
+                        hot_window.invalidate(policy["infra_id"])
+                        async with AsyncSessionLocal() as session:
+                            await metrics_counters.refresh_bounds(session, policy["infra_id"])
+                            await session.commit()
+                    purged_raw += purged
+                    dropped_cold_files += dropped
+                if policy["rollup_days"] > 0:
+                    purged_rollups += await self._purge_rollups(policy["infra_id"], now_ms - policy["rollup_days"] * DAY_MS)
+
+            vacuumed = await self._incremental_vacuum() if purged_raw or purged_rollups else 0
+
+            elapsed = time.time() - start_time
+            self.run_count += 1
+            self.purged_raw_count += purged_raw
+            self.purged_rollup_count += purged_rollups
+            self.dropped_cold_file_count += dropped_cold_files
+            self.vacuumed_pages += vacuumed
+            self.last_run_seconds = elapsed
+            self.total_run_seconds += elapsed
+            self.last_run_at = time.monotonic()
+
+            if purged_raw or purged_rollups:
+                logger.info(f"Retention purged {purged_raw} raw rows and {purged_rollups} rollup rows in {elapsed:.3f}s ({vacuumed} pages vacuumed)")
+            return {
+                "purged_raw": purged_raw,
+                "purged_rollups": purged_rollups,
+                "dropped_cold_files": dropped_cold_files,
+                "vacuumed_pages": vacuumed,
+                "seconds": elapsed
+            }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+            "default_raw_days": self.raw_days,
+            "default_rollup_days": self.rollup_days,
+            "runs": self.run_count,
+            "purged_raw": self.purged_raw_count,
+            "purged_rollups": self.purged_rollup_count,
+            "dropped_cold_files": self.dropped_cold_file_count,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_run_seconds": self.last_run_seconds,
+            "total_run_seconds": self.total_run_seconds,
+            "seconds_since_last_run": time.monotonic() - self.last_run_at if self.last_run_at else None
+        }
+
+    async def _purge_raw(self, infra_id: int, cutoff_ms: int) -> int:
+        purged = 0
+        while True:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    delete(Metrics).where(Metrics.id.in_(
+                        select(Metrics.id)
+                        .where(Metrics.infra_id == infra_id, Metrics.event_time < cutoff_ms)
+                        .limit(self.batch_size)
+                    ))
+                )
+                await metrics_counters.remove(session, infra_id, result.rowcount)
+                await session.commit()
+            purged += result.rowcount
+            if result.rowcount < self.batch_size:
+                return purged
+            await asyncio.sleep(0)
+
+    async def _purge_rollups(self, infra_id: int, cutoff_ms: int) -> int:
+        purged = 0
+        for model in (MetricsRollup, ServiceStatusRollup, MetricsMoments):
+            for resolution in RESOLUTIONS:
+                while True:
+                    deleted, done = await self._purge_rollup_batch(model, infra_id, resolution, cutoff_ms)
+                    purged += deleted
+                    if done:
+                        break
+                    await asyncio.sleep(0)
+        return purged
+
+    async def _purge_rollup_batch(self, model, infra_id: int, resolution: str, cutoff_ms: int) -> Tuple[int, bool]:
+        # WITHOUT ROWID tables: bound the batch by the bucket found `batch_size` rows into the expired range
+        conditions = [model.infra_id == infra_id, model.resolution == resolution, model.bucket_start < cutoff_ms]
+        async with AsyncSessionLocal() as session:
+            boundary = (await session.execute(
+                select(model.bucket_start).where(*conditions)
+                .order_by(model.bucket_start)
+                .offset(self.batch_size)
+                .limit(1)
+            )).scalar_one_or_none()
+
+            if boundary is None:
+                result = await session.execute(delete(model).where(*conditions))
+            else:
+                result = await session.execute(delete(model).where(*conditions, model.bucket_start < boundary))
+                if result.rowcount == 0:
+                    result = await session.execute(delete(model).where(*conditions, model.bucket_start <= boundary))
+            if model is MetricsMoments and result.rowcount:
+                mark_written(session, infra_id)
+            if result.rowcount:
+                response_cache.stage(session, infra_id)
+            await session.commit()
+        return result.rowcount, boundary is None
+
+    async def _incremental_vacuum(self) -> int:
+        async with engine.connect() as conn:
+            freelist_before = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+            raw = await conn.get_raw_connection()
+            # the pragma frees one page per step, fetching its rows runs it to completion
+            cursor = await raw.driver_connection.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})")
+            await cursor.fetchall()
+            await cursor.close()
+            freelist_after = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+        return max(0, freelist_before - freelist_after)
+
+    async def _retention_loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error during retention run: {str(e)}")
+            await asyncio.sleep(self.interval)
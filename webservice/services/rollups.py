@@ -0,0 +1,368 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter
+import logging
+import os
+import time
+import numpy as np
+from sqlalchemy import delete, case, desc, func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from models.sql import Metrics, MetricsRollup, ServiceStatusRollup, MetricsMoments
+from services.block_storage import block_storage
+from services.cold_storage import cold_storage
+from services.metrics_counters import metrics_counters
+from services.moments import CORRELATION_METRICS, group_moments, mark_written
+from services.quantile_sketch import sketch_keys, group_sketches
+from services.response_cache import response_cache
+from services.time_utils import format_timestamp_ms
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_REBUILD_BATCH_SIZE = int(os.getenv("ROLLUP_REBUILD_BATCH_SIZE", "5000"))
+ROLLUP_UPSERT_CHUNK_SIZE = 500
+
+# finest first
+RESOLUTIONS = {"1m": 60_000, "1h": 3_600_000, "1d": 86_400_000}
+ROLLUP_METRICS = [
+    "cpu_usage", "memory_usage", "latency_ms", "disk_usage",
+    "network_in_kbps", "network_out_kbps", "io_wait", "thread_count",
+    "active_connections", "error_rate", "uptime_seconds",
+    "temperature_celsius", "power_consumption_watts"
+]
+SERVICES = ["database", "api_gateway", "cache"]
+CORRELATION_COLUMNS = [ROLLUP_METRICS.index(metric) for metric in CORRELATION_METRICS]
+
+
+class RollupService:
+    """Per-infrastructure min/max/sum/count/last aggregates and quantile sketches of every
+    numeric metric, service state counts and the means and co-moments of CORRELATION_METRICS,
+    bucketed at each resolution of RESOLUTIONS.
+
+    `apply` folds a batch of metrics rows into the buckets with one upsert per bucket
+    and is called in the same transaction as the raw insert.
+    """
+
+    def __init__(self, resolutions: Dict[str, int] = RESOLUTIONS):
+        self.resolutions = resolutions
+
+    async def apply(self, session: AsyncSession, infra_id: int, rows: List[Dict[str, Any]]):
+        """Fold metrics rows (the column dicts written to the metrics table) into the rollups"""
+        rows = [row for row in rows if row.get("event_time") is not None]
+        if not rows:
+            return
+
+        n = len(rows)
+        event_times = np.fromiter((row["event_time"] for row in rows), dtype=np.int64, count=n)
+        values = np.array([[row[metric] for metric in ROLLUP_METRICS] for row in rows], dtype=np.float64)
+        present = ~np.isnan(values)
+        keys = sketch_keys(values)
+
+        metric_rows = []
+        moment_rows = []
+        status_counts = Counter()
+        for resolution, size in self.resolutions.items():
+            bucket_keys, inverse = np.unique(event_times - event_times % size, return_inverse=True)
+            k = len(bucket_keys)
+            moment_rows += self._moment_rows(infra_id, resolution, bucket_keys, inverse, values)
+            counts = np.bincount(inverse, minlength=k)
+
+            # last row of each bucket by event time, ties go to the latest row of the batch
+            order = np.lexsort((np.arange(n), event_times, inverse))
+            last_rows = order[np.r_[np.flatnonzero(np.diff(inverse[order])), n - 1]]
+            last_times = event_times[last_rows]
+
+            for j, metric in enumerate(ROLLUP_METRICS):
+                column = values[:, j]
+                sums = np.bincount(inverse, weights=column, minlength=k)
+                mins = np.full(k, np.inf)
+                np.minimum.at(mins, inverse, column)
+                maxs = np.full(k, -np.inf)
+                np.maximum.at(maxs, inverse, column)
+                lasts = column[last_rows]
+                sketches = group_sketches(keys[present[:, j], j], inverse[present[:, j]], k)
+
+                for b in range(k):
+                    metric_rows.append({
+                        "infra_id": infra_id,
+                        "resolution": resolution,
+                        "bucket_start": int(bucket_keys[b]),
+                        "metric": metric,
+                        "count": int(counts[b]),
+                        "sum_value": float(sums[b]),
+                        "min_value": float(mins[b]),
+                        "max_value": float(maxs[b]),
+                        "last_time": int(last_times[b]),
+                        "last_value": float(lasts[b]),
+                        "sketch": sketches[b]
+                    })
+
+            buckets = bucket_keys[inverse].tolist()
+            for service in SERVICES:
+                column = f"service_status_{service}"
+                status_counts.update(
+                    (resolution, bucket, service, row[column]) for bucket, row in zip(buckets, rows)
+                )
+
+        status_rows = [
+            {
+                "infra_id": infra_id,
+                "resolution": resolution,
+                "bucket_start": bucket,
+                "service": service,
+                "status": status,
+                "count": count
+            }
+            for (resolution, bucket, service, status), count in status_counts.items()
+        ]
+
+        for start in range(0, len(metric_rows), ROLLUP_UPSERT_CHUNK_SIZE):
+            await session.execute(self._metric_upsert(), metric_rows[start:start + ROLLUP_UPSERT_CHUNK_SIZE])
+        for start in range(0, len(status_rows), ROLLUP_UPSERT_CHUNK_SIZE):
+            await session.execute(self._status_upsert(), status_rows[start:start + ROLLUP_UPSERT_CHUNK_SIZE])
+        for start in range(0, len(moment_rows), ROLLUP_UPSERT_CHUNK_SIZE):
+            await session.execute(self._moments_upsert(), moment_rows[start:start + ROLLUP_UPSERT_CHUNK_SIZE])
+        if moment_rows:
+            mark_written(session, infra_id)
+
+        if DEBUG:
+            logger.debug(f"Rollups updated for infra {infra_id}: {n} rows into {len(metric_rows)} metric buckets")
+
+    async def rebuild(self, session: AsyncSession, infra_id: int) -> int:
+        """Recompute the rollups of an infrastructure from the raw metrics (hot, cold and blocks),
+        the caller owns the transaction.
+
+        Buckets older than the oldest stored raw point are kept: once retention purged raw
+        points, the rollups are the only record of them. Buckets holding the oldest raw point
+        are kept as well when older buckets show that some of their points were purged.
+        """
+        start_time = time.time()
+        since = (await metrics_counters.bounds(session, infra_id))["first_event_time"]
+        if since is None:
+            logger.info(f"No raw metrics to rebuild the rollups of infra {infra_id} from, rollups kept")
+            return 0
+
+        first_buckets = {resolution: since - since % size for resolution, size in self.resolutions.items()}
+        purged = await session.scalar(
+            select(MetricsRollup.bucket_start)
+            .where(
+                MetricsRollup.infra_id == infra_id,
+                or_(*(
+                    (MetricsRollup.resolution == resolution) & (MetricsRollup.bucket_start < first_bucket)
+                    for resolution, first_bucket in first_buckets.items()
+                ))
+            )
+            .limit(1)
+        ) is not None
+        boundaries = {
+            resolution: first_bucket + size if purged and first_bucket < since else first_bucket
+            for (resolution, size), first_bucket in zip(self.resolutions.items(), first_buckets.values())
+        }
+        for resolution, boundary in boundaries.items():
+            for model in (MetricsRollup, ServiceStatusRollup, MetricsMoments):
+                await session.execute(delete(model).where(
+                    model.infra_id == infra_id,
+                    model.resolution == resolution,
+                    model.bucket_start >= boundary
+                ))
+        mark_written(session, infra_id)
+        response_cache.stage(session, infra_id)
+
+        columns = [Metrics.id, Metrics.event_time] + [getattr(Metrics, metric) for metric in ROLLUP_METRICS] + [
+            getattr(Metrics, f"service_status_{service}") for service in SERVICES
+        ]
+        last_id = 0
+        total = 0
+        while True:
+            result = await session.execute(
+                select(*columns)
+                .where(Metrics.infra_id == infra_id, Metrics.id > last_id)
+                .order_by(Metrics.id)
+                .limit(ROLLUP_REBUILD_BATCH_SIZE)
+            )
+            rows = [dict(row) for row in result.mappings()]
+            if not rows:
+                break
+            await self._apply_since(session, infra_id, rows, boundaries)
+            last_id = rows[-1]["id"]
+            total += len(rows)
+
+        cold_columns = [column.name for column in columns[1:]]
+        async for rows in cold_storage.iter_partitions(session, infra_id, cold_columns):
+            await self._apply_since(session, infra_id, rows, boundaries)
+            total += len(rows)
+        async for rows in block_storage.iter_rows(session, infra_id, cold_columns):
+            await self._apply_since(session, infra_id, rows, boundaries)
+            total += len(rows)
+
+        logger.info(f"Rebuilt rollups of infra {infra_id} from {total} rows since {format_timestamp_ms(since)} in {time.time() - start_time:.3f}s")
+        return total
+
+    async def _apply_since(self, session: AsyncSession, infra_id: int, rows: List[Dict[str, Any]], boundaries: Dict[str, int]):
+        # resolutions sharing a boundary are folded together, usually all of them
+        groups: Dict[int, Dict[str, int]] = {}
+        for resolution, boundary in boundaries.items():
+            groups.setdefault(boundary, {})[resolution] = self.resolutions[resolution]
+        for boundary, resolutions in groups.items():
+            kept = [row for row in rows if row.get("event_time") is not None and row["event_time"] >= boundary]
+            await RollupService(resolutions).apply(session, infra_id, kept)
+
+    async def estimate_raw_count(self, session: AsyncSession, infra_id: int, start_ms: int, end_ms: int) -> int:
+        """Raw points in the range, from the hourly buckets overlapping it (may overcount the edges)"""
+        size = self.resolutions["1h"]
+        result = await session.execute(
+            select(func.coalesce(func.sum(MetricsRollup.count), 0)).where(
+                MetricsRollup.infra_id == infra_id,
+                MetricsRollup.resolution == "1h",
+                MetricsRollup.bucket_start >= start_ms - start_ms % size,
+                MetricsRollup.bucket_start <= end_ms,
+                MetricsRollup.metric == ROLLUP_METRICS[0]
+            )
+        )
+        return result.scalar()
+
+    async def choose_resolution(self, session: AsyncSession, infra_id: int, start_ms: int, end_ms: int, max_points: int) -> str:
+        """Raw data when it fits the point budget, else the finest resolution whose buckets fit it"""
+        if await self.estimate_raw_count(session, infra_id, start_ms, end_ms) <= max_points:
+            return "raw"
+        for resolution, size in self.resolutions.items():
+            if (end_ms - start_ms) // size + 1 <= max_points:
+                return resolution
+        return list(self.resolutions)[-1]
+
+    async def get_series(
+        self,
+        session: AsyncSession,
+        infra_id: int,
+        resolution: str,
+        start_ms: Optional[int],
+        end_ms: Optional[int],
+        limit: int,
+        fields: Optional[Tuple[str, ...]] = None
+    ) -> List[Dict[str, Any]]:
+        """Most recent `limit` buckets in the range, newest first, with the metrics and service
+        status in `fields` (None for all)"""
+        size = self.resolutions[resolution]
+        metrics = [metric for metric in ROLLUP_METRICS if fields is None or metric in fields]
+        # every metric has the bucket's count, one is read when none is wanted
+        queried = metrics or ROLLUP_METRICS[:1]
+        with_status = fields is None or "service_status" in fields
+        conditions = [
+            MetricsRollup.infra_id == infra_id,
+            MetricsRollup.resolution == resolution,
+            MetricsRollup.metric.in_(queried)
+        ]
+        if start_ms is not None:
+            conditions.append(MetricsRollup.bucket_start >= start_ms - start_ms % size)
+        if end_ms is not None:
+            conditions.append(MetricsRollup.bucket_start <= end_ms)
+
+        result = await session.execute(
+            select(MetricsRollup)
+            .where(*conditions)
+            .order_by(desc(MetricsRollup.bucket_start), MetricsRollup.metric)
+            .limit(limit * len(queried))
+        )
+        points: Dict[int, Dict[str, Any]] = {}
+        for rollup in result.scalars():
+            point = points.get(rollup.bucket_start)
+            if point is None:
+                point = points[rollup.bucket_start] = {
+                    "timestamp": format_timestamp_ms(rollup.bucket_start),
+                    "event_time": rollup.bucket_start,
+                    "count": rollup.count
+                }
+                if with_status:
+                    point["service_status"] = {service: {} for service in SERVICES}
+            if rollup.metric in metrics:
+                point[rollup.metric] = {
+                    "min": rollup.min_value,
+                    "max": rollup.max_value,
+                    "avg": rollup.sum_value / rollup.count,
+                    "last": rollup.last_value
+                }
+
+        if points and with_status:
+            result = await session.execute(
+                select(ServiceStatusRollup).where(
+                    ServiceStatusRollup.infra_id == infra_id,
+                    ServiceStatusRollup.resolution == resolution,
+                    ServiceStatusRollup.bucket_start >= min(points),
+                    ServiceStatusRollup.bucket_start <= max(points)
+                )
+            )
+            for rollup in result.scalars():
+                if rollup.bucket_start in points:
+                    points[rollup.bucket_start]["service_status"][rollup.service][rollup.status] = rollup.count
+
+        return list(points.values())
+
+    def _metric_upsert(self):
+        stmt = sqlite_insert(MetricsRollup)
+        excluded = stmt.excluded
+        return stmt.on_conflict_do_update(
+            index_elements=["infra_id", "resolution", "bucket_start", "metric"],
+            set_={
+                "count": MetricsRollup.count + excluded["count"],
+                "sum_value": MetricsRollup.sum_value + excluded.sum_value,
+                "min_value": func.min(MetricsRollup.min_value, excluded.min_value),
+                "max_value": func.max(MetricsRollup.max_value, excluded.max_value),
+                "last_value": case(
+                    (excluded.last_time >= MetricsRollup.last_time, excluded.last_value),
+                    else_=MetricsRollup.last_value
+                ),
+                "last_time": func.max(MetricsRollup.last_time, excluded.last_time),
+                # registered by services.quantile_sketch
+                "sketch": func.quantile_sketch_merge(MetricsRollup.sketch, excluded.sketch)
+            }
+        )
+
+    def _moment_rows(
+        self,
+        infra_id: int,
+        resolution: str,
+        bucket_keys: np.ndarray,
+        inverse: np.ndarray,
+        values: np.ndarray
+    ) -> List[Dict[str, Any]]:
+        values = values[:, CORRELATION_COLUMNS]
+        # the correlation matrix only holds points where every metric is known
+        complete = ~np.isnan(values).any(axis=1)
+        counts, means, comoments = group_moments(values[complete], inverse[complete], len(bucket_keys))
+        return [
+            {
+                "infra_id": infra_id,
+                "resolution": resolution,
+                "bucket_start": int(bucket_keys[b]),
+                "count": int(counts[b]),
+                "means": means[b].tobytes(),
+                "comoments": comoments[b].tobytes()
+            }
+            for b in np.flatnonzero(counts).tolist()
+        ]
+
+    def _moments_upsert(self):
+        # blobs are merged by the SQL functions registered in services.moments, every
+        # right-hand side reads the stored values
+        stmt = sqlite_insert(MetricsMoments)
+        stored, new = MetricsMoments.__table__.c, stmt.excluded
+        return stmt.on_conflict_do_update(
+            index_elements=["infra_id", "resolution", "bucket_start"],
+            set_={
+                "count": stored["count"] + new["count"],
+                "means": func.moments_merge_means(stored["count"], stored.means, new["count"], new.means),
+                "comoments": func.moments_merge_comoments(
+                    stored["count"], stored.means, stored.comoments, new["count"], new.means, new.comoments
+                )
+            }
+        )
+
+    def _status_upsert(self):
+        stmt = sqlite_insert(ServiceStatusRollup)
+        return stmt.on_conflict_do_update(
+            index_elements=["infra_id", "resolution", "bucket_start", "service", "status"],
+            set_={"count": ServiceStatusRollup.count + stmt.excluded["count"]}
+        )
+
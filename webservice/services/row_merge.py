@@ -0,0 +1,110 @@
+from typing import Dict, Any, List, Optional, Tuple, Callable, Awaitable, AsyncIterator
+import base64
+import binascii
+import heapq
+
+Row = Dict[str, Any]
+Chunk = Tuple[int, Callable[[], Awaitable[List[Row]]]]
+# (event_time, id, points without id already returned at event_time)
+Cursor = Tuple[int, int, int]
+
+
+def row_key(row: Row) -> Tuple[int, int]:
+    """Keyset order of raw points: event time, then id (0 for points stored without one)"""
+    return row["event_time"], row.get("id") or 0
+
+
+def next_cursor(rows: List[Row], before: Optional[Cursor] = None) -> Cursor:
+    """Cursor resuming after the last of `rows` (a page read after `before`).
+
+    Points stored without an id (blocks) share the key (event_time, 0), the cursor then also
+    counts how many of them were returned at that event time, so the next page skips exactly
+    those and not their twins.
+    """
+    event_time, row_id = row_key(rows[-1])
+    returned = 0
+    if row_id == 0:
+        for row in reversed(rows):
+            if row_key(row) != (event_time, 0):
+                break
+            returned += 1
+        if before is not None and before[:2] == (event_time, 0):
+            returned += before[2]
+    return event_time, row_id, returned
+
+
+def after_cursor(before: Cursor) -> Callable[[Row], bool]:
+    """Predicate of the rows ordered after `before`, to apply to newest first rows in order:
+    keys below the cursor's, and the points without id sharing its key past the ones it returned"""
+    key, returned = before[:2], before[2]
+    seen = 0
+
+    def keep(row: Row) -> bool:
+        nonlocal seen
+        row_key_ = row_key(row)
+        if row_key_ < key:
+            return True
+        if row_key_ == key and key[1] == 0:
+            seen += 1
+            return seen > returned
+        return False
+    return keep
+
+
+def encode_cursor(key: Cursor) -> str:
+    """Opaque pagination cursor of (event_time, id, id-less points returned at event_time)"""
+    return base64.urlsafe_b64encode(":".join(str(part) for part in key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Cursor made by `encode_cursor` (or a two part one, before blocks were counted),
+    ValueError if it is not one"""
+    try:
+        parts = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid cursor: {cursor}")
+        event_time, row_id, returned = (int(part) for part in [*parts, "0"][:3])
+        return event_time, row_id, returned
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+async def iter_chunks_newest_first(chunks: List[Chunk]) -> AsyncIterator[Row]:
+    """Rows of possibly overlapping chunks, newest first.
+
+    `chunks` are (newest event time, loader) sorted by newest event time descending. A chunk
+    is loaded only once it may hold the next row, so memory is bounded by the chunks that
+    overlap in time (usually one).
+    """
+    heap = []
+    position = 0
+    index = 0
+    while index < len(chunks) or heap:
+        while index < len(chunks) and (not heap or chunks[index][0] >= -heap[0][0]):
+            for row in await chunks[index][1]():
+                event_time, row_id = row_key(row)
+                heapq.heappush(heap, (-event_time, -row_id, position, row))
+                position += 1
+            index += 1
+        if heap:
+            yield heapq.heappop(heap)[3]
+
+
+async def merge_newest_first(*iterators: AsyncIterator[Row]) -> AsyncIterator[Row]:
+    """k-way merge of row iterators that are each newest first"""
+    heap = []
+    for position, iterator in enumerate(iterators):
+        row = await anext(iterator, None)
+        if row is not None:
+            event_time, row_id = row_key(row)
+            heap.append((-event_time, -row_id, position, row))
+    heapq.heapify(heap)
+    while heap:
+        _, _, position, row = heap[0]
+        yield row
+        following = await anext(iterators[position], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            event_time, row_id = row_key(following)
+            heapq.heapreplace(heap, (-event_time, -row_id, position, following))
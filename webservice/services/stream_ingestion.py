@@ -0,0 +1,125 @@
+from typing import Dict, Any, List, AsyncIterator, Tuple
+import logging
+import os
+import time
+from db import AsyncSessionLocal
+from services.decompression import BodyDecodingError
+from services.persistence import PersistenceService, DEFAULT_INFRA
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+NDJSON_CHUNK_SIZE = int(os.getenv("NDJSON_CHUNK_SIZE", "1000"))
+NDJSON_MAX_LINE_BYTES = int(os.getenv("NDJSON_MAX_LINE_BYTES", str(64 * 1024)))
+NDJSON_MAX_ERRORS_PER_CHUNK = 20
+
+
+class LineTooLong(Exception):
+    pass
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = NDJSON_MAX_LINE_BYTES) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split a byte stream into (line_number, line) pairs without buffering more than one line"""
+    buffer = b""
+    line_number = 0
+
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b"\n")
+        buffer = lines.pop()
+        for line in lines:
+            line_number += 1
+            # a whole line may arrive within one chunk, the limit must not depend on chunk sizes
+            if len(line) > max_line_bytes:
+                raise LineTooLong(f"Line {line_number} exceeds {max_line_bytes} bytes")
+            if line.strip():
+                yield line_number, line
+        if len(buffer) > max_line_bytes:
+            raise LineTooLong(f"Line {line_number + 1} exceeds {max_line_bytes} bytes")
+
+    if buffer.strip():
+        yield line_number + 1, buffer
+
+
+class StreamIngestionService:
+    """Validates and persists an NDJSON stream in fixed-size chunks, one transaction per chunk"""
+
+    def __init__(self, persistence_service: PersistenceService, chunk_size: int = NDJSON_CHUNK_SIZE):
+        self.persistence_service = persistence_service
+        self.validation_service = persistence_service.validation_service
+        self.chunk_size = chunk_size
+
+    async def ingest(self, chunks: AsyncIterator[bytes], infra_name: str = DEFAULT_INFRA) -> AsyncIterator[Dict[str, Any]]:
+        start_time = time.time()
+        total_stored = 0
+        total_failed = 0
+        chunk_index = 0
+        pending: List[Tuple[int, bytes]] = []
+
+        try:
+            async for line_number, line in iter_ndjson_lines(chunks):
+                pending.append((line_number, line))
+                if len(pending) >= self.chunk_size:
+                    result = await self._process_chunk(chunk_index, pending, infra_name)
+                    total_stored += result["stored"]
+                    total_failed += result["failed"]
+                    chunk_index += 1
+                    pending = []
+                    yield result
+
+            if pending:
+                result = await self._process_chunk(chunk_index, pending, infra_name)
+                total_stored += result["stored"]
+                total_failed += result["failed"]
+                chunk_index += 1
+                yield result
+
+        except (LineTooLong, BodyDecodingError) as e:
+            logger.warning(f"NDJSON ingestion aborted: {str(e)}")
+            yield {
+                "status": "error",
+                "message": str(e),
+                "stored": total_stored,
+                "failed": total_failed,
+                "chunks": chunk_index,
+                "processing_time": time.time() - start_time
+            }
+            return
+
+        total_time = time.time() - start_time
+        logger.info(f"NDJSON ingestion completed in {total_time:.3f}s: {total_stored} stored, {total_failed} failed in {chunk_index} chunks")
+
+        yield {
+            "status": "success" if total_stored > 0 else "error",
+            "stored": total_stored,
+            "failed": total_failed,
+            "chunks": chunk_index,
+            "processing_time": total_time
+        }
+
+    async def _process_chunk(self, chunk_index: int, lines: List[Tuple[int, bytes]], infra_name: str) -> Dict[str, Any]:
+        valid_metrics = []
+        errors = []
+
+        for line_number, line in lines:
+            validation_result = self.validation_service.validate_metrics_json(line)
+            if validation_result.is_valid:
+                valid_metrics.append(validation_result.data)
+            else:
+                errors.append({"line": line_number, "errors": [e.model_dump() for e in validation_result.errors]})
+
+        async with AsyncSessionLocal() as session:
+            stored = await self.persistence_service.store_validated_metrics(session, valid_metrics, infra_name)
+
+        failed = len(lines) - stored
+        if DEBUG:
+            logger.debug(f"NDJSON chunk {chunk_index}: {stored} stored, {failed} failed")
+
+        return {
+            "chunk": chunk_index,
+            "first_line": lines[0][0],
+            "last_line": lines[-1][0],
+            "stored": stored,
+            "failed": failed,
+            "errors": errors[:NDJSON_MAX_ERRORS_PER_CHUNK]
+        }
@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta, timezone
+import re
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+DURATION_UNITS_MS = {"s": 1000, "m": 60_000, "h": 3_600_000, "d": 86_400_000}
+
+
+def parse_timestamp_ms(value: str) -> int:
+    """ISO 8601 string to epoch milliseconds, naive timestamps are taken as UTC. Raises ValueError."""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(milliseconds=1)
+
+
+def format_timestamp_ms(event_time: int) -> str:
+    return (EPOCH + timedelta(milliseconds=event_time)).isoformat().replace("+00:00", "Z")
+
+
+def parse_duration_ms(value: str) -> int:
+    """Duration like 30s, 5m, 1h or 7d to milliseconds. Raises ValueError."""
+    match = re.fullmatch(r"(\d+)([smhd])", value.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid duration: {value}")
+    return int(match.group(1)) * DURATION_UNITS_MS[match.group(2)]
@@ -1,129 +1,177 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple, Literal, TypedDict, Annotated, Union
 import logging
+import os
+from pydantic import TypeAdapter, Field, Strict, AfterValidator
+from pydantic import ValidationError as PydanticValidationError
 from models.validation import ValidationResult, ValidationError
-from models.metrics import InfrastructureMetrics
+from services.batch_validation import ColumnarBatchValidator
+from services.time_utils import parse_timestamp_ms
 
 logger = logging.getLogger(__name__)
 
+COLUMNAR_BATCH_MIN_SIZE = int(os.getenv("COLUMNAR_BATCH_MIN_SIZE", "256"))
+
+
+def _check_timestamp(value: str) -> str:
+    parse_timestamp_ms(value)
+    return value
+
 
 class ValidationService:
     def __init__(self):
         self.required_fields = [
-            "timestamp", "cpu_usage", "memory_usage", "latency_ms", 
-            "disk_usage", "network_in_kbps", "network_out_kbps", 
-            "io_wait", "thread_count", "active_connections", 
-            "error_rate", "uptime_seconds", "temperature_celsius", 
+            "timestamp", "cpu_usage", "memory_usage", "latency_ms",
+            "disk_usage", "network_in_kbps", "network_out_kbps",
+            "io_wait", "thread_count", "active_connections",
+            "error_rate", "uptime_seconds", "temperature_celsius",
             "power_consumption_watts", "service_status"
         ]
-        
+
         self.field_validations = {
             "cpu_usage": {"type": int, "min": 0, "max": 100},
             "memory_usage": {"type": int, "min": 0, "max": 100},
             "latency_ms": {"type": int, "min": 1},
             "disk_usage": {"type": int, "min": 0, "max": 100},
-            "network_in_kbps": {"type": int, "min": 0},
-            "network_out_kbps": {"type": int, "min": 0},
+            "network_in_kbps": {"type": int, "min": 1},
+            "network_out_kbps": {"type": int, "min": 1},
             "io_wait": {"type": int, "min": 0, "max": 100},
-            "thread_count": {"type": int, "min": 0},
+            "thread_count": {"type": int, "min": 1},
             "active_connections": {"type": int, "min": 0},
             "error_rate": {"type": float, "min": 0.0, "max": 1.0},
-            "uptime_seconds": {"type": int, "min": 0},
+            "uptime_seconds": {"type": int, "min": 1},
             "temperature_celsius": {"type": int, "min": 0, "max": 200},
-            "power_consumption_watts": {"type": int, "min": 0},
+            "power_consumption_watts": {"type": int, "min": 1},
         }
 
+        self.required_services = ["database", "api_gateway", "cache"]
+        self.valid_statuses = ["online", "degraded", "offline"]
+
+        self.adapter = self._compile_adapter()
+        self.columnar_validator = ColumnarBatchValidator(self)
+
     def validate_metrics(self, data: Dict[str, Any]) -> ValidationResult:
+        try:
+            return ValidationResult.model_construct(is_valid=True, errors=[], data=self.adapter.validate_python(data))
+        except PydanticValidationError as e:
+            return ValidationResult(is_valid=False, errors=self._convert_errors(e))
+
+    def row_errors(self, data: Any) -> List[ValidationError]:
+        """Errors of one record, without building a ValidationResult"""
+        try:
+            self.adapter.validate_python(data)
+            return []
+        except PydanticValidationError as e:
+            return self._convert_errors(e)
+
+    def validate_metrics_json(self, raw: Union[bytes, str]) -> ValidationResult:
+        """Parse and validate a single JSON document in one pass"""
+        try:
+            return ValidationResult.model_construct(is_valid=True, errors=[], data=self.adapter.validate_json(raw))
+        except PydanticValidationError as e:
+            return ValidationResult(is_valid=False, errors=self._convert_errors(e))
+
+    def validate_metrics_batch(self, metrics_list: List[Any]) -> Tuple[List[Dict[str, Any]], int]:
+        """Validate every element of a batch, returns the validated metrics and the number of rejected ones"""
+        if len(metrics_list) >= COLUMNAR_BATCH_MIN_SIZE:
+            return self._validate_metrics_batch_columnar(metrics_list)
+        return self._validate_metrics_batch_rows(metrics_list)
+
+    def _validate_metrics_batch_rows(self, metrics_list: List[Any]) -> Tuple[List[Dict[str, Any]], int]:
+        valid_metrics = []
+        failed_count = 0
+        validate = self.adapter.validate_python
+
+        for i, metrics_data in enumerate(metrics_list):
+            # the compiled adapter directly, a ValidationResult per row doubles the cost
+            try:
+                valid_metrics.append(validate(metrics_data))
+            except PydanticValidationError as e:
+                errors = self._convert_errors(e)
+                logger.warning(f"Metrics at index {i} failed validation: {len(errors)} errors")
+                for error in errors:
+                    logger.debug(f"  - {error.field}: {error.message}")
+                failed_count += 1
+
+        return valid_metrics, failed_count
+
+    def _validate_metrics_batch_columnar(self, metrics_list: List[Any]) -> Tuple[List[Dict[str, Any]], int]:
+        _, errors, valid_metrics = self.columnar_validator.validate(metrics_list)
+
+        for i, row_errors in errors.items():
+            logger.warning(f"Metrics at index {i} failed validation: {len(row_errors)} errors")
+            for error in row_errors:
+                logger.debug(f"  - {error.field}: {error.message}")
+
+        return valid_metrics, len(errors)
+
+    def _compile_adapter(self) -> TypeAdapter:
+        """Build a strict TypedDict schema from the rules above, compiled once by pydantic-core"""
+        service_status_row = TypedDict("ServiceStatusRow", {
+            service: Literal[tuple(self.valid_statuses)]
+            for service in self.required_services
+        })
+
+        fields = {}
+        for field in self.required_fields:
+            if field in self.field_validations:
+                validation = self.field_validations[field]
+                constraints = {}
+                if "min" in validation:
+                    constraints["ge"] = validation["min"]
+                if "max" in validation:
+                    constraints["le"] = validation["max"]
+                fields[field] = Annotated[validation["type"], Strict(), Field(**constraints)]
+            elif field == "service_status":
+                fields[field] = service_status_row
+            elif field == "timestamp":
+                fields[field] = Annotated[str, Strict(), AfterValidator(_check_timestamp)]
+            else:
+                fields[field] = Annotated[str, Strict()]
+
+        return TypeAdapter(TypedDict("MetricsRow", fields))
+
+    def _convert_errors(self, exc: PydanticValidationError) -> List[ValidationError]:
+        """Map pydantic errors to the API error format (field, message, value)"""
         errors = []
-        
-        if not isinstance(data, dict):
-            return ValidationResult(
-                is_valid=False,
-                errors=[ValidationError(field="root", message="Data must be a dictionary")]
-            )
 
-        for field in self.required_fields:
-            if field not in data:
-                errors.append(ValidationError(
-                    field=field,
-                    message=f"Required field '{field}' is missing"
-                ))
+        for error in exc.errors(include_url=False):
+            loc = [str(part) for part in error["loc"]]
+            error_type = error["type"]
+            value = error.get("input")
+
+            if not loc:
+                if error_type == "json_invalid":
+                    errors.append(ValidationError(field="root", message=error["msg"]))
+                else:
+                    errors.append(ValidationError(field="root", message="Data must be a dictionary"))
                 continue
 
-            if field in self.field_validations:
-                field_errors = self._validate_field(field, data[field])
-                errors.extend(field_errors)
+            field = ".".join(loc)
+
+            if loc[0] == "service_status":
+                if len(loc) == 1:
+                    if error_type == "missing":
+                        errors.append(ValidationError(field=field, message=f"Required field '{field}' is missing"))
+                    else:
+                        errors.append(ValidationError(field=field, message="Service status must be a dictionary", value=value))
+                elif error_type == "missing":
+                    errors.append(ValidationError(field=field, message=f"Required service '{loc[1]}' is missing"))
+                else:
+                    errors.append(ValidationError(field=field, message=f"Service status must be one of {self.valid_statuses}", value=value))
+                continue
 
-        service_status_errors = self._validate_service_status(data.get("service_status", {}))
-        errors.extend(service_status_errors)
-
-        is_valid = len(errors) == 0
-        
-        if is_valid:
-            try:
-                validated_data = InfrastructureMetrics(**data)
-                return ValidationResult(is_valid=True, data=validated_data.model_dump())
-            except Exception as e:
-                errors.append(ValidationError(
-                    field="pydantic_validation",
-                    message=f"Pydantic validation failed: {str(e)}"
-                ))
-                is_valid = False
-
-        return ValidationResult(is_valid=is_valid, errors=errors)
-
-    def _validate_field(self, field: str, value: Any) -> List[ValidationError]:
-        errors = []
-        validation = self.field_validations[field]
-        
-        if not isinstance(value, validation["type"]):
-            errors.append(ValidationError(
-                field=field,
-                message=f"Field '{field}' must be of type {validation['type'].__name__}",
-                value=value
-            ))
-            return errors
-
-        if "min" in validation and value < validation["min"]:
-            errors.append(ValidationError(
-                field=field,
-                message=f"Field '{field}' must be >= {validation['min']}",
-                value=value
-            ))
-
-        if "max" in validation and value > validation["max"]:
-            errors.append(ValidationError(
-                field=field,
-                message=f"Field '{field}' must be <= {validation['max']}",
-                value=value
-            ))
+            if error_type == "missing":
+                errors.append(ValidationError(field=field, message=f"Required field '{field}' is missing"))
+            elif field == "timestamp" and error_type == "value_error":
+                errors.append(ValidationError(field=field, message="Field 'timestamp' must be an ISO 8601 datetime", value=value))
+            elif error_type == "greater_than_equal":
+                errors.append(ValidationError(field=field, message=f"Field '{field}' must be >= {error['ctx']['ge']}", value=value))
+            elif error_type == "less_than_equal":
+                errors.append(ValidationError(field=field, message=f"Field '{field}' must be <= {error['ctx']['le']}", value=value))
+            elif error_type.endswith("_type") or error_type.endswith("_parsing"):
+                expected = self.field_validations[field]["type"] if field in self.field_validations else str
+                errors.append(ValidationError(field=field, message=f"Field '{field}' must be of type {expected.__name__}", value=value))
+            else:
+                errors.append(ValidationError(field=field, message=f"Field '{field}': {error['msg']}", value=value))
 
         return errors
-
-    def _validate_service_status(self, service_status: Any) -> List[ValidationError]:
-        errors = []
-        
-        if not isinstance(service_status, dict):
-            errors.append(ValidationError(
-                field="service_status",
-                message="Service status must be a dictionary",
-                value=service_status
-            ))
-            return errors
-
-        required_services = ["database", "api_gateway", "cache"]
-        valid_statuses = ["online", "degraded", "offline"]
-
-        for service in required_services:
-            if service not in service_status:
-                errors.append(ValidationError(
-                    field=f"service_status.{service}",
-                    message=f"Required service '{service}' is missing"
-                ))
-            elif service_status[service] not in valid_statuses:
-                errors.append(ValidationError(
-                    field=f"service_status.{service}",
-                    message=f"Service status must be one of {valid_statuses}",
-                    value=service_status[service]
-                ))
-
-        return errors 
\ No newline at end of file
@@ -0,0 +1,104 @@
+from typing import Dict, Any, Optional
+import asyncio
+import logging
+import os
+import time
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+
+WAL_CHECKPOINT_INTERVAL = float(os.getenv("WAL_CHECKPOINT_INTERVAL_S", "30"))
+WAL_TRUNCATE_PAGES = int(os.getenv("WAL_TRUNCATE_PAGES", "10000"))
+
+
+class WalCheckpointer:
+    """Background WAL checkpoints on the writer engine.
+
+    A PASSIVE checkpoint runs every interval and never blocks readers or the writer.
+    When the WAL has grown past `truncate_pages` (readers kept it from being fully
+    checkpointed) a TRUNCATE checkpoint resets the file.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        interval: float = WAL_CHECKPOINT_INTERVAL,
+        truncate_pages: int = WAL_TRUNCATE_PAGES
+    ):
+        self.engine = engine
+        self.interval = interval
+        self.truncate_pages = truncate_pages
+
+        self._task: Optional[asyncio.Task] = None
+
+        self.checkpoint_count = 0
+        self.truncate_count = 0
+        self.last_wal_pages = 0
+        self.last_checkpointed_pages = 0
+        self.last_busy = False
+        self.last_checkpoint_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._checkpoint_loop())
+        logger.info(f"WAL checkpointer started (interval={self.interval:.1f}s, truncate_pages={self.truncate_pages})")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.checkpoint("TRUNCATE")
+        logger.info(f"WAL checkpointer stopped ({self.checkpoint_count} checkpoints)")
+
+    async def checkpoint(self, mode: str = "PASSIVE") -> Dict[str, Any]:
+        async with self.engine.connect() as conn:
+            busy, wal_pages, checkpointed_pages = (await conn.execute(text(f"PRAGMA wal_checkpoint({mode})"))).one()
+
+        self.checkpoint_count += 1
+        if mode == "TRUNCATE":
+            self.truncate_count += 1
+        self.last_busy = bool(busy)
+        self.last_wal_pages = wal_pages
+        self.last_checkpointed_pages = checkpointed_pages
+        self.last_checkpoint_at = time.monotonic()
+
+        if DEBUG:
+            logger.debug(f"WAL checkpoint ({mode}): busy={busy}, wal_pages={wal_pages}, checkpointed={checkpointed_pages}")
+        return {"busy": self.last_busy, "wal_pages": wal_pages, "checkpointed_pages": checkpointed_pages}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "truncate_pages": self.truncate_pages,
+            "checkpoints": self.checkpoint_count,
+            "truncates": self.truncate_count,
+            "wal_pages": self.last_wal_pages,
+            "checkpointed_pages": self.last_checkpointed_pages,
+            "busy": self.last_busy,
+            "seconds_since_last_checkpoint": time.monotonic() - self.last_checkpoint_at if self.last_checkpoint_at else None
+        }
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                result = await self.checkpoint("PASSIVE")
+                if result["wal_pages"] >= self.truncate_pages:
+                    await self.checkpoint("TRUNCATE")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error during WAL checkpoint: {str(e)}")
@@ -0,0 +1,47 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import engine, Base
+from models.sql import User, Infrastructure
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def clean_db():
+    """Empty schema holding the default user and infrastructure, before every test"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        user = User(username="jean", password="jean")
+        session.add(user)
+        await session.commit()
+        await session.refresh(user)
+        infra = Infrastructure(name="default", user_id=user.id)
+        session.add(infra)
+        await session.commit()
+    yield
+
+
+@pytest.fixture
+def valid_metrics_data():
+    return {
+        "timestamp": "2023-10-01T12:00:00Z",
+        "cpu_usage": 85,
+        "memory_usage": 75,
+        "latency_ms": 150,
+        "disk_usage": 60,
+        "network_in_kbps": 1000,
+        "network_out_kbps": 800,
+        "io_wait": 5,
+        "thread_count": 50,
+        "active_connections": 100,
+        "error_rate": 0.02,
+        "uptime_seconds": 3600,
+        "temperature_celsius": 45,
+        "power_consumption_watts": 300,
+        "service_status": {
+            "database": "online",
+            "api_gateway": "online",
+            "cache": "online"
+        }
+    }
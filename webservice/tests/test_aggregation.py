@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from services.aggregation import bucket_stats, parse_functions
+
+
+def make_points(valid_metrics_data, minutes):
+    return [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T12:{minute:02d}:00Z", cpu_usage=minute)
+        for minute in minutes
+    ]
+
+
+def test_bucket_stats_match_numpy():
+    rng = np.random.default_rng(0)
+    event_times = rng.integers(0, 10 * 60_000, 5000).astype(np.float64)
+    values = rng.normal(50, 10, 5000)
+    values[::50] = np.nan
+    functions = parse_functions("avg,min,max,stddev,p95,p50")
+    starts, stats = bucket_stats({"event_time": event_times, "cpu_usage": values}, 60_000, ["cpu_usage"], functions)
+
+    assert starts.tolist() == [minute * 60_000 for minute in range(10)]
+    for i, start in enumerate(starts):
+        selected = values[(event_times >= start) & (event_times < start + 60_000)]
+        selected = selected[~np.isnan(selected)]
+        cpu = stats["cpu_usage"]
+        assert cpu["count"][i] == len(selected)
+        assert cpu["sum"][i] == pytest.approx(selected.sum())
+        assert cpu["min"][i] == selected.min() and cpu["max"][i] == selected.max()
+        assert cpu["stddev"][i] == pytest.approx(selected.std())
+        assert cpu["p95"][i] == pytest.approx(np.percentile(selected, 95))
+        assert cpu["p50"][i] == pytest.approx(np.median(selected))
+
+    with pytest.raises(ValueError):
+        parse_functions("avg,median")
+
+
+@pytest.mark.asyncio
+async def test_aggregate_raw_points(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(10)))
+        response = await client.get("/api/metrics/aggregate", params={
+            "start_time": "2023-10-01T12:00:00Z",
+            "end_time": "2023-10-01T12:09:30Z",
+            "bucket": "5m",
+            "metrics": "cpu_usage",
+            "functions": "avg,max,count,p50,stddev,rolling_mean",
+            "window": 2
+        })
+
+    data = response.json()["data"]
+    assert data["source"] == "raw"
+    assert data["series"] == [
+        {
+            "timestamp": "2023-10-01T12:00:00Z",
+            "event_time": 1696161600000,
+            "cpu_usage": {"avg": 2.0, "max": 4.0, "count": 5, "p50": 2.0, "stddev": pytest.approx(np.std(range(5))), "rolling_mean": 2.0}
+        },
+        {
+            "timestamp": "2023-10-01T12:05:00Z",
+            "event_time": 1696161900000,
+            "cpu_usage": {"avg": 7.0, "max": 9.0, "count": 5, "p50": 7.0, "stddev": pytest.approx(np.std(range(5))), "rolling_mean": 4.5}
+        }
+    ]
+
+
+@pytest.mark.asyncio
+async def test_aggregate_from_rollups_matches_raw_points(valid_metrics_data):
+    params = {"start_time": "2023-10-01T12:00:00Z", "end_time": "2023-10-01T12:14:59.999Z", "bucket": "5m", "functions": "avg,min,max,count"}
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(12)))
+        from_rollups = (await client.get("/api/metrics/aggregate", params=params)).json()["data"]
+        from_raw = (await client.get("/api/metrics/aggregate", params=dict(params, functions="avg,min,max,count,p100"))).json()["data"]
+        unknown = await client.get("/api/metrics/aggregate", params=dict(params, metrics="cpu_usage,password"))
+        too_many = await client.get("/api/metrics/aggregate", params=dict(params, bucket="1s", end_time="2023-10-02T12:00:00Z"))
+
+    assert from_rollups["source"] == "1m"
+    assert from_raw["source"] == "raw"
+    assert len(from_rollups["series"]) == 3
+    for rollup_point, raw_point in zip(from_rollups["series"], from_raw["series"]):
+        for metric, values in rollup_point.items():
+            if isinstance(values, dict):
+                assert values == {name: value for name, value in raw_point[metric].items() if name != "p100"}
+    assert from_rollups["series"][2]["cpu_usage"] == {"avg": 10.5, "min": 10.0, "max": 11.0, "count": 2}
+    assert unknown.status_code == 400
+    assert too_many.status_code == 400
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from main import app
+from db import engine
+from models.sql import Metrics, MetricsBlock
+from services import block_codec
+from services.block_codec import encode_block, decode_block
+from services.block_storage import block_storage, BLOCK_METRICS
+
+
+@pytest.fixture
+def blocks(monkeypatch):
+    monkeypatch.setattr(block_storage, "enabled", True)
+    monkeypatch.setattr(block_storage, "block_points", 4)
+
+
+def make_points(valid_metrics_data, count):
+    statuses = ["online", "degraded", "offline"]
+    return [
+        dict(
+            valid_metrics_data,
+            timestamp=f"2023-10-01T12:{minute:02d}:00Z",
+            cpu_usage=40 + minute,
+            error_rate=0.01 * minute,
+            thread_count=50 + minute,
+            service_status={"database": statuses[minute % 3], "api_gateway": "online", "cache": "online"}
+        )
+        for minute in range(count)
+    ]
+
+
+def test_block_codec_roundtrip_is_bit_exact():
+    rng = np.random.default_rng(0)
+    event_times = np.array([1_700_000_000_000, 1_700_000_010_000, 1_700_000_009_000, 1_700_000_030_000, 5], dtype=np.int64)
+    values = rng.normal(size=(5, len(BLOCK_METRICS)))
+    values[0, 0] = np.nan
+    values[1, 1] = -0.0
+    statuses = np.array([["online", "degraded", "offline"]] * 5, dtype=object)
+    timestamps = np.array(["", "2023-11-14T23:13:30+01:00", "", "", "1970-01-01T00:00:00.005"], dtype=object)
+
+    decoded_times, decoded_values, decoded_statuses, decoded_timestamps = decode_block(encode_block(event_times, values, statuses, timestamps))
+
+    assert decoded_times.tolist() == event_times.tolist()
+    assert decoded_values.view(np.uint64).tolist() == values.view(np.uint64).tolist()
+    assert decoded_statuses.tolist() == statuses.tolist()
+    assert decoded_timestamps.tolist() == timestamps.tolist()
+    assert decode_block(encode_block(event_times, values, statuses))[3].tolist() == [""] * 5
+
+
+def test_regular_series_compresses_below_table_row_size():
+    n = 1024
+    event_times = 1_700_000_000_000 + np.arange(n, dtype=np.int64) * 10_000
+    values = np.tile(np.array([50.0, 75.0, 150.0] + [1.0] * (len(BLOCK_METRICS) - 3)), (n, 1))
+    statuses = np.full((n, 3), "online", dtype=object)
+
+    assert len(encode_block(event_times, values, statuses)) / n < 2
+
+
+@pytest.mark.asyncio
+async def test_block_backend_serves_the_same_history(blocks, valid_metrics_data):
+    points = make_points(valid_metrics_data, 10)
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=points[:5])
+        await client.post("/api/ingest", json=points[9])
+        await client.post("/api/ingest", json=points[5:9])
+        history = (await client.get("/api/history", params={"resolution": "raw"})).json()
+        page = (await client.get("/api/history", params={
+            "resolution": "raw", "limit": 3, "start_time": "2023-10-01T12:02:00Z", "end_time": "2023-10-01T12:07:00Z"
+        })).json()
+        info = (await client.get("/api/metrics/info")).json()
+
+    async with AsyncSession(engine) as session:
+        staged = (await session.execute(select(Metrics.timestamp).order_by(Metrics.event_time))).scalars().all()
+        sizes = (await session.execute(select(MetricsBlock.point_count).order_by(MetricsBlock.start_time))).scalars().all()
+
+    # the two newest points wait in the metrics table for a full block
+    assert sizes == [4, 4]
+    assert staged == [points[8]["timestamp"], points[9]["timestamp"]]
+    assert info == {"total_count": 10, "latest_timestamp": "2023-10-01T12:09:00Z"}
+    assert [p["timestamp"] for p in history["data"]] == [p["timestamp"] for p in reversed(points)]
+    for stored, sent in zip(history["data"], reversed(points)):
+        assert stored["service_status"] == sent["service_status"]
+        assert stored["error_rate"] == sent["error_rate"]
+        assert stored["thread_count"] == sent["thread_count"] and isinstance(stored["thread_count"], int)
+    assert [p["timestamp"] for p in page["data"]] == ["2023-10-01T12:07:00Z", "2023-10-01T12:06:00Z", "2023-10-01T12:05:00Z"]
+
+
+@pytest.mark.asyncio
+async def test_block_scan_and_rollup_rebuild(blocks, valid_metrics_data):
+    points = make_points(valid_metrics_data, 10)
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=points)
+        series = (await client.get("/api/history", params={"resolution": "1m", "start_time": "2023-10-01T12:00:00Z"})).json()
+        rebuild = (await client.post("/api/metrics/rollups/rebuild")).json()
+        rebuilt = (await client.get("/api/history", params={"resolution": "1m", "start_time": "2023-10-01T12:00:00Z"})).json()
+
+    async with AsyncSession(engine) as session:
+        arrays = await block_storage.scan(session, 1, start_ms=None, end_ms=None)
+
+    # the last two points are still staged in the metrics table
+    assert arrays["cpu_usage"].tolist() == [p["cpu_usage"] for p in points[:8]]
+    assert np.all(np.diff(arrays["event_time"]) > 0)
+    assert rebuild["data"]["rows"] == 10
+    assert rebuilt["data"] == series["data"]
+
+
+@pytest.mark.asyncio
+async def test_each_point_is_encoded_once(blocks, valid_metrics_data, monkeypatch):
+    encoded = []
+
+    def counting_encode_block(event_times, *columns):
+        encoded.append(len(event_times))
+        return block_codec.encode_block(event_times, *columns)
+
+    monkeypatch.setattr("services.block_storage.encode_block", counting_encode_block)
+    points = make_points(valid_metrics_data, 10)
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        for point in points:
+            await client.post("/api/ingest", json=point)
+        history = (await client.get("/api/history", params={"resolution": "raw"})).json()
+        info = (await client.get("/api/metrics/info")).json()
+
+    assert encoded == [4, 4]
+    assert info == {"total_count": 10, "latest_timestamp": "2023-10-01T12:09:00Z"}
+    assert [p["timestamp"] for p in history["data"]] == [p["timestamp"] for p in reversed(points)]
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import pytest
+from datetime import datetime, timedelta, timezone
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from main import app
+from db import engine
+from models.sql import Metrics, ColdPartition
+from services.cold_storage import cold_storage, ColdStorage
+from services.retention import RetentionService
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture(autouse=True)
+def cold_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(cold_storage, "directory", str(tmp_path))
+
+
+def hours_ago(hours):
+    return (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+
+
+async def ingest_points(client, valid_metrics_data, hours, **params):
+    points = [dict(valid_metrics_data, timestamp=hours_ago(h), cpu_usage=h % 100) for h in hours]
+    response = await client.post("/api/ingest", params=params, json=points)
+    assert response.status_code == 200
+
+
+async def count(model, *conditions):
+    async with AsyncSession(engine) as session:
+        return (await session.execute(select(func.count()).select_from(model).where(*conditions))).scalar()
+
+
+@pytest.mark.asyncio
+async def test_export_moves_sealed_days_to_parquet(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await ingest_points(client, valid_metrics_data, range(0, 24 * 12, 6))
+
+    tier = ColdStorage(directory=cold_storage.directory, after_days=7, max_rows_per_file=3)
+    result = await tier.run_once()
+
+    async with AsyncSession(engine) as session:
+        partitions = (await session.execute(select(ColdPartition))).scalars().all()
+        hot_min = (await session.execute(select(func.min(Metrics.event_time)))).scalar()
+
+    assert result["exported_rows"] == sum(p.row_count for p in partitions) > 0
+    assert all(p.row_count <= 3 for p in partitions)
+    assert all(os.path.exists(os.path.join(cold_storage.directory, p.path)) for p in partitions)
+    assert max(p.max_event_time for p in partitions) < hot_min
+    assert await count(Metrics) + result["exported_rows"] == 48
+
+    # sealed days are gone, a second run has nothing to do
+    assert (await tier.run_once())["exported_rows"] == 0
+
+
+@pytest.mark.asyncio
+async def test_history_merges_hot_and_cold_rows(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await ingest_points(client, valid_metrics_data, range(0, 24 * 12, 6))
+        before = (await client.get("/api/history", params={"limit": 1000, "resolution": "raw"})).json()
+        info_before = (await client.get("/api/metrics/info")).json()
+
+        await ColdStorage(directory=cold_storage.directory, after_days=7).run_once()
+
+        after = (await client.get("/api/history", params={"limit": 1000, "resolution": "raw"})).json()
+        info_after = (await client.get("/api/metrics/info")).json()
+        page = (await client.get("/api/history", params={
+            "limit": 5, "resolution": "raw", "start_time": hours_ago(24 * 10), "end_time": hours_ago(24 * 8)
+        })).json()
+        cold = (await client.get("/api/metrics/cold")).json()["data"]
+
+    assert after["data"] == before["data"]
+    assert info_after == info_before
+    assert len(page["data"]) == 5
+    assert [p["event_time"] for p in page["data"]] == sorted((p["event_time"] for p in page["data"]), reverse=True)
+    assert page["data"] == [p for p in before["data"] if p["event_time"] <= page["data"][0]["event_time"]][:5]
+    assert len(cold["partitions"]) > 0
+
+
+@pytest.mark.asyncio
+async def test_cold_rows_feed_analysis_and_rollup_rebuild(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await ingest_points(client, valid_metrics_data, range(24 * 8, 24 * 12, 6))
+        series = (await client.get("/api/history", params={"start_time": hours_ago(24 * 13), "resolution": "1d"})).json()
+
+        await ColdStorage(directory=cold_storage.directory, after_days=7).run_once()
+        assert await count(Metrics) == 0
+
+        response = await client.post("/api/metrics/rollups/rebuild")
+        assert response.json()["data"]["rows"] == 16
+        rebuilt = (await client.get("/api/history", params={"start_time": hours_ago(24 * 13), "resolution": "1d"})).json()
+
+    assert rebuilt["data"] == series["data"]
+
+
+@pytest.mark.asyncio
+async def test_retention_drops_expired_cold_files(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await ingest_points(client, valid_metrics_data, range(24 * 8, 24 * 12, 6))
+    await ColdStorage(directory=cold_storage.directory, after_days=7).run_once()
+
+    async with AsyncSession(engine) as session:
+        paths = (await session.execute(select(ColdPartition.path))).scalars().all()
+
+    result = await RetentionService(raw_days=9, rollup_days=0).run_once()
+
+    async with AsyncSession(engine) as session:
+        remaining = (await session.execute(select(ColdPartition.path))).scalars().all()
+
+    assert result["dropped_cold_files"] == len(paths) - len(remaining) > 0
+    assert len(remaining) > 0
+    assert all(os.path.exists(os.path.join(cold_storage.directory, p)) == (p in remaining) for p in paths)
+
+
+@pytest.mark.asyncio
+async def test_export_writes_the_file_outside_the_writer(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await ingest_points(client, valid_metrics_data, range(24 * 8, 24 * 9, 6))
+        tier = ColdStorage(directory=cold_storage.directory, after_days=7)
+        loop = asyncio.get_running_loop()
+        write_file = tier._write_file
+        written = []
+
+        def write_while_ingesting(path, rows):
+            # the single writer connection must stay free while the file is written
+            asyncio.run_coroutine_threadsafe(ingest_points(client, valid_metrics_data, [1]), loop).result(timeout=10)
+            written.append(path)
+            return write_file(path, rows)
+
+        tier._write_file = write_while_ingesting
+        result = await tier.run_once()
+
+    assert result["exported_rows"] == 4
+    assert await count(Metrics) == len(written)
+
+
+@pytest.mark.asyncio
+async def test_export_drops_the_file_of_rows_deleted_meanwhile(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await ingest_points(client, valid_metrics_data, range(24 * 8, 24 * 9, 6))
+    tier = ColdStorage(directory=cold_storage.directory, after_days=7)
+    loop = asyncio.get_running_loop()
+    write_file = tier._write_file
+    written = []
+
+    async def purge_one(first_id):
+        async with AsyncSession(engine) as session:
+            await session.execute(delete(Metrics).where(Metrics.id == first_id))
+            await session.commit()
+
+    def write_while_purging(path, rows):
+        asyncio.run_coroutine_threadsafe(purge_one(rows[0].id), loop).result(timeout=10)
+        written.append(path)
+        return write_file(path, rows)
+
+    tier._write_file = write_while_purging
+    result = await tier.run_once()
+
+    assert result["exported_rows"] == 0
+    assert await count(ColdPartition) == 0 and await count(Metrics) == 3
+    assert not os.path.exists(os.path.join(cold_storage.directory, written[0]))
+
+    # the next run exports what is left
+    tier._write_file = write_file
+    assert (await tier.run_once())["exported_rows"] == 3
@@ -0,0 +1,111 @@
+import gzip
+import json
+import pytest
+import zstandard
+from httpx import AsyncClient, ASGITransport
+from main import app
+from db import engine
+from models.sql import Metrics
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import func
+import services.decompression
+
+
+async def count_metrics() -> int:
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(func.count(Metrics.id)))
+        return result.scalar()
+
+
+@pytest.mark.asyncio
+async def test_gzip_single_metrics(valid_metrics_data):
+    body = gzip.compress(json.dumps(valid_metrics_data).encode())
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post(
+            "/api/ingest",
+            content=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.json()["data"]["cpu_usage"] == 85
+    assert await count_metrics() == 1
+
+
+@pytest.mark.asyncio
+async def test_zstd_batch_metrics(valid_metrics_data):
+    body = zstandard.ZstdCompressor().compress(json.dumps([valid_metrics_data] * 50).encode())
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post(
+            "/api/ingest",
+            content=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "zstd"}
+        )
+        assert response.status_code == 200
+        assert response.json()["batch_result"]["stored"] == 50
+    assert await count_metrics() == 50
+
+
+@pytest.mark.asyncio
+async def test_gzip_ndjson_stream(valid_metrics_data):
+    body = gzip.compress(("\n".join(json.dumps(valid_metrics_data) for _ in range(30)) + "\n").encode())
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post(
+            "/api/ingest",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        summary = json.loads(response.text.splitlines()[-1])
+        assert summary["stored"] == 30
+    assert await count_metrics() == 30
+
+
+@pytest.mark.asyncio
+async def test_decompressed_size_limit(valid_metrics_data, monkeypatch):
+    monkeypatch.setattr(services.decompression, "MAX_DECOMPRESSED_BYTES", 10_000)
+    body = gzip.compress(json.dumps([valid_metrics_data] * 500).encode())
+    assert len(body) < 10_000
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post(
+            "/api/ingest",
+            content=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+        assert response.status_code == 413
+    assert await count_metrics() == 0
+
+
+@pytest.mark.asyncio
+async def test_zstd_bomb_is_decompressed_in_bounded_steps():
+    bomb = zstandard.ZstdCompressor().compress(bytes(64 * 1024 * 1024))
+    assert len(bomb) < 4096
+
+    async def chunks():
+        for start in range(0, len(bomb), 1000):
+            yield bomb[start:start + 1000]
+
+    steps = []
+    with pytest.raises(services.decompression.DecompressedSizeExceeded):
+        async for output in services.decompression.iter_decoded_body(chunks(), "zstd", max_bytes=1024 * 1024):
+            steps.append(len(output))
+    assert max(steps) <= services.decompression.OUTPUT_CHUNK_BYTES
+    assert sum(steps) <= 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_unsupported_and_corrupt_encoding(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post(
+            "/api/ingest",
+            content=b"anything",
+            headers={"Content-Type": "application/json", "Content-Encoding": "br"}
+        )
+        assert response.status_code == 415
+
+        response = await client.post(
+            "/api/ingest",
+            content=b"not gzip at all",
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+        )
+        assert response.status_code == 400
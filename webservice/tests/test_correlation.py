@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from services.moments import CORRELATION_METRICS, group_moments, merge_moments, correlation_matrix
+
+
+def make_points(count, seed, first_second=0):
+    rng = np.random.default_rng(seed)
+    cpu = rng.integers(0, 101, count)
+    points = []
+    for i in range(count):
+        second = first_second + i * 20
+        points.append({
+            "timestamp": f"2023-10-01T12:{second // 60:02d}:{second % 60:02d}Z",
+            "cpu_usage": int(cpu[i]),
+            "memory_usage": int(100 - cpu[i]),
+            "latency_ms": int(cpu[i] * 3 + rng.integers(1, 50)),
+            "disk_usage": 60,
+            "network_in_kbps": int(rng.integers(1, 5000)),
+            "network_out_kbps": int(rng.integers(1, 5000)),
+            "io_wait": int(rng.integers(0, 20)),
+            "thread_count": 50,
+            "active_connections": int(rng.integers(0, 500)),
+            "error_rate": float(rng.random()),
+            "uptime_seconds": 3600,
+            "temperature_celsius": int(rng.integers(30, 80)),
+            "power_consumption_watts": int(cpu[i] * 2 + rng.integers(100, 200)),
+            "service_status": {"database": "online", "api_gateway": "online", "cache": "online"}
+        })
+    return points
+
+
+def expected_matrix(points, metrics=CORRELATION_METRICS):
+    values = np.array([[point[metric] for metric in metrics] for point in points], dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.corrcoef(values, rowvar=False)
+
+
+def assert_matrix(actual, expected):
+    actual = np.array([[np.nan if value is None else value for value in row] for row in actual])
+    np.testing.assert_allclose(actual, expected, atol=1e-9)
+
+
+def test_merged_moments_match_a_single_pass():
+    rng = np.random.default_rng(7)
+    values = rng.normal(size=(1000, len(CORRELATION_METRICS))) * rng.uniform(1, 1000, len(CORRELATION_METRICS)) + 500
+    values[:, 1] = values[:, 0] * 2 + rng.normal(size=1000)
+    groups = rng.integers(0, 13, 1000)
+
+    counts, means, comoments = group_moments(values, groups, 16)
+    assert counts[13:].sum() == 0
+    total, mean, comoment = merge_moments(counts, means, comoments)
+    assert total == 1000
+    np.testing.assert_allclose(mean, values.mean(axis=0))
+    np.testing.assert_allclose(correlation_matrix(comoment), np.corrcoef(values, rowvar=False), atol=1e-12)
+
+    # merging already merged parts gives the same moments
+    halves = [merge_moments(counts[part], means[part], comoments[part]) for part in (slice(0, 5), slice(5, 16))]
+    merged = merge_moments(*(np.array(column) for column in zip(*halves)))
+    np.testing.assert_allclose(merged[2], comoment)
+
+
+@pytest.mark.asyncio
+async def test_correlation_endpoint_merges_incremental_batches():
+    first, second = make_points(60, seed=1), make_points(60, seed=2, first_second=10)
+    params = {"window": "1h", "end_time": "2023-10-01T12:59:59Z"}
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        # the second batch lands in the buckets of the first one
+        await client.post("/api/ingest", json=first)
+        await client.post("/api/ingest", json=second)
+        response = await client.get("/api/metrics/correlation", params=params)
+        subset = await client.get("/api/metrics/correlation", params=dict(params, metrics="power_consumption_watts,cpu_usage"))
+        tumbling = await client.get("/api/metrics/correlation", params=dict(params, window="30m", mode="tumbling", end_time="2023-10-01T12:05:00Z"))
+        unknown = await client.get("/api/metrics/correlation", params=dict(params, metrics="cpu_usage,thread_count"))
+        invalid = await client.get("/api/metrics/correlation", params=dict(params, window="45s"))
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["resolution"] == "1m"
+    assert data["start_time"] == "2023-10-01T12:00:00Z"
+    assert data["count"] == 120
+    assert data["metrics"] == CORRELATION_METRICS
+    assert_matrix(data["matrix"], expected_matrix(first + second))
+    assert data["matrix"][0][1] == pytest.approx(-1.0)
+    assert data["matrix"][3][3] is None
+
+    subset_data = subset.json()["data"]
+    assert_matrix(subset_data["matrix"], expected_matrix(first + second, ["power_consumption_watts", "cpu_usage"]))
+
+    tumbling_data = tumbling.json()["data"]
+    assert (tumbling_data["start_time"], tumbling_data["end_time"]) == ("2023-10-01T12:00:00Z", "2023-10-01T12:29:59.999000Z")
+    in_window = [point for point in first + second if point["timestamp"] < "2023-10-01T12:30"]
+    assert tumbling_data["count"] == len(in_window)
+    assert_matrix(tumbling_data["matrix"], expected_matrix(in_window))
+
+    assert unknown.status_code == 400
+    assert invalid.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_correlation_cache_is_invalidated_by_ingest():
+    points = make_points(30, seed=3)
+    params = {"window": "1h", "end_time": "2023-10-01T12:59:59Z"}
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=points)
+        first = (await client.get("/api/metrics/correlation", params=params)).json()["data"]
+        again = (await client.get("/api/metrics/correlation", params=params)).json()["data"]
+        extra = make_points(1, seed=4, first_second=1800)
+        await client.post("/api/ingest", json=extra[0])
+        after = (await client.get("/api/metrics/correlation", params=params)).json()["data"]
+
+    assert (first["cached"], again["cached"], after["cached"]) == (False, True, False)
+    assert again["matrix"] == first["matrix"]
+    assert after["count"] == 31
+    assert_matrix(after["matrix"], expected_matrix(points + extra))
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from services.downsampling import lttb
+
+
+def make_points(valid_metrics_data, minutes):
+    return [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T12:{minute:02d}:00Z", cpu_usage=minute)
+        for minute in minutes
+    ]
+
+
+def test_lttb_keeps_extremes_of_every_series():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.vstack([np.sin(x / 50), np.zeros(1000)])
+    y[1, 420] = 100
+    y[1, 700] = -100
+
+    kept = lttb(x, y, 50)
+    assert kept.shape == (2, 50)
+    assert (np.diff(kept, axis=1) > 0).all()
+    assert kept[:, 0].tolist() == [0, 0] and kept[:, -1].tolist() == [999, 999]
+    assert {420, 700} <= set(kept[1].tolist())
+    # each series is downsampled independently of the others
+    assert kept[0].tolist() == lttb(x, y[:1], 50)[0].tolist()
+    assert lttb(x[:10], y[:, :10], 50).tolist() == [list(range(10))] * 2
+
+
+@pytest.mark.asyncio
+async def test_series_endpoint_downsamples_every_metric(valid_metrics_data):
+    points = [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T12:{minute:02d}:00Z", cpu_usage=99 if minute == 17 else 10, memory_usage=minute)
+        for minute in range(40)
+    ]
+    params = {"start_time": "2023-10-01T12:00:00Z", "metrics": "cpu_usage,memory_usage", "points": 8}
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=points)
+        response = await client.get("/api/metrics/series", params=params)
+        everything = await client.get("/api/metrics/series", params=dict(params, points=100))
+        unknown = await client.get("/api/metrics/series", params=dict(params, metrics="cpu_usage,password"))
+
+    data = response.json()["data"]
+    assert data["source_points"] == 40
+    cpu = data["series"]["cpu_usage"]
+    assert len(cpu["event_time"]) == len(cpu["value"]) == 8
+    assert 99 in cpu["value"]
+    assert cpu["event_time"][0] == 1696161600000
+    assert data["series"]["memory_usage"]["value"][-1] == 39
+    assert everything.json()["data"]["series"]["memory_usage"]["value"] == list(range(40))
+    assert unknown.status_code == 400
@@ -0,0 +1,81 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+from main import app
+from db import engine
+from db_init import init_db
+from services.time_utils import parse_timestamp_ms
+
+
+def test_parse_timestamp_ms():
+    assert parse_timestamp_ms("2023-10-01T12:00:00Z") == 1696161600000
+    assert parse_timestamp_ms("2023-10-01T14:00:00.250+02:00") == 1696161600250
+    assert parse_timestamp_ms("2023-10-01T12:00:00") == 1696161600000
+    with pytest.raises(ValueError):
+        parse_timestamp_ms("not a date")
+
+
+@pytest.mark.asyncio
+async def test_history_orders_and_filters_on_event_time(valid_metrics_data):
+    # lexically "2023-10-01T13:30:00+02:00" sorts after "2023-10-01T12:00:00Z" but happens before it
+    timestamps = ["2023-10-01T12:00:00Z", "2023-10-01T13:30:00+02:00", "2023-10-01T12:30:00Z"]
+    batch = [dict(valid_metrics_data, timestamp=ts) for ts in timestamps]
+
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=batch)
+
+        response = await client.get("/api/history")
+        ranged = await client.get("/api/history", params={"start_time": "2023-10-01T12:00:00Z"})
+        invalid = await client.get("/api/history", params={"start_time": "noon"})
+        info = await client.get("/api/metrics/info")
+
+    assert [m["timestamp"] for m in response.json()["data"]] == [timestamps[2], timestamps[0], timestamps[1]]
+    assert response.json()["data"][0]["event_time"] == parse_timestamp_ms(timestamps[2])
+    assert ranged.json()["total_retrieved"] == 2
+    assert invalid.status_code == 400
+    assert info.json()["latest_timestamp"] == timestamps[2]
+
+
+@pytest.mark.asyncio
+async def test_init_db_backfills_event_time_of_existing_rows():
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_metrics_infra_id_event_time"))
+        await conn.execute(text("ALTER TABLE metrics DROP COLUMN event_time"))
+        await conn.execute(text(
+            "INSERT INTO metrics (infra_id, user_id, timestamp) VALUES "
+            "(1, 1, '2023-10-01T12:00:00Z'), (1, 1, '2023-10-01T14:00:00.250+02:00')"
+        ))
+
+    await init_db()
+
+    async with engine.connect() as conn:
+        event_times = (await conn.execute(text("SELECT event_time FROM metrics ORDER BY id"))).scalars().all()
+        plan = " ".join(str(row[-1]) for row in await conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM metrics WHERE infra_id = 1 AND event_time >= 0 ORDER BY event_time DESC"
+        )))
+
+    assert event_times == [1696161600000, 1696161600250]
+    assert "ix_metrics_infra_id_event_time" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.asyncio
+async def test_init_db_backfills_unparseable_timestamps_from_created_at(caplog):
+    async with engine.begin() as conn:
+        await conn.execute(text("DROP INDEX ix_metrics_infra_id_event_time"))
+        await conn.execute(text("ALTER TABLE metrics DROP COLUMN event_time"))
+        await conn.execute(text(
+            "INSERT INTO metrics (infra_id, user_id, timestamp, created_at) VALUES "
+            "(1, 1, '2023-10-01T12:00:00Z', '2023-10-02 08:00:00'), (1, 1, 'yesterday noon', '2023-10-02 08:00:00'), "
+            "(1, 1, 'not a date', NULL)"
+        ))
+
+    with caplog.at_level("WARNING", logger="db_init"):
+        await init_db()
+
+    async with engine.connect() as conn:
+        event_times = (await conn.execute(text("SELECT event_time FROM metrics ORDER BY id"))).scalars().all()
+
+    assert event_times == [1696161600000, parse_timestamp_ms("2023-10-02T08:00:00Z"), None]
+    assert "Backfilled event_time of 1 metrics rows" in caplog.text
+    assert "1 metrics rows have neither a parseable timestamp nor created_at" in caplog.text
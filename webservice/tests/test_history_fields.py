@@ -0,0 +1,73 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from services.block_storage import block_storage
+from services.hot_window import hot_window
+from services.metrics_projection import FIELDS, parse_fields, get_mapper, storage_columns
+
+
+def make_points(valid_metrics_data, minutes):
+    return [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T12:{minute:02d}:00Z", cpu_usage=minute)
+        for minute in minutes
+    ]
+
+
+def test_fields_are_parsed_and_mapped():
+    assert parse_fields(None) is None
+    assert parse_fields("memory_usage, cpu_usage") == ("id", "timestamp", "event_time", "cpu_usage", "memory_usage")
+    assert "service_status_cache" in storage_columns(parse_fields("service_status"))
+    assert "created_at" not in storage_columns(parse_fields("cpu_usage"))
+    with pytest.raises(ValueError):
+        parse_fields("cpu_usage,password")
+
+    row = {
+        "timestamp": "2023-10-01T12:00:00Z", "event_time": 1696161600000, "cpu_usage": 85.0,
+        "service_status_database": "online", "service_status_api_gateway": "offline", "service_status_cache": "online"
+    }
+    assert get_mapper(("timestamp", "cpu_usage", "service_status"))(row) == {
+        "timestamp": "2023-10-01T12:00:00Z",
+        "cpu_usage": 85.0,
+        "service_status": {"database": "online", "api_gateway": "offline", "cache": "online"}
+    }
+    # id and created_at are left out of points stored without them
+    assert set(get_mapper(None)(dict(row, **{metric: 1 for metric in FIELDS[3:-2]}))) == set(FIELDS) - {"id", "created_at"}
+    assert get_mapper(("timestamp",)) is get_mapper(("timestamp",))
+
+
+@pytest.mark.asyncio
+async def test_history_returns_requested_fields(monkeypatch, valid_metrics_data):
+    params = {"resolution": "raw", "fields": "cpu_usage,latency_ms"}
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(5)))
+        from_window = (await client.get("/api/history", params=params)).json()
+        monkeypatch.setattr(hot_window, "enabled", False)
+        from_table = (await client.get("/api/history", params=dict(params, limit=2))).json()
+        everything = (await client.get("/api/history", params={"resolution": "raw", "limit": 1})).json()
+        unknown = await client.get("/api/history", params={"fields": "cpu_usage,secret"})
+
+    assert [set(point) for point in from_window["data"]] == [{"id", "timestamp", "event_time", "cpu_usage", "latency_ms"}] * 5
+    assert [point["cpu_usage"] for point in from_window["data"]] == [4, 3, 2, 1, 0]
+    assert from_table["data"] == from_window["data"][:2]
+    assert from_table["next_cursor"] is not None
+    assert list(everything["data"][0]) == FIELDS
+    assert unknown.status_code == 400
+    assert unknown.json()["message"] == "Unknown fields: secret"
+
+
+@pytest.mark.asyncio
+async def test_rollup_history_returns_requested_fields(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(5)))
+        cpu = (await client.get("/api/history", params={"resolution": "1m", "fields": "cpu_usage"})).json()
+        status = (await client.get("/api/history", params={"resolution": "1h", "fields": "service_status"})).json()
+
+    assert len(cpu["data"]) == 5
+    assert set(cpu["data"][0]) == {"timestamp", "event_time", "count", "cpu_usage"}
+    assert cpu["data"][0]["cpu_usage"]["last"] == 4
+    assert status["data"] == [{
+        "timestamp": "2023-10-01T12:00:00Z",
+        "event_time": 1696161600000,
+        "count": 5,
+        "service_status": {"database": {"online": 5}, "api_gateway": {"online": 5}, "cache": {"online": 5}}
+    }]
@@ -0,0 +1,72 @@
+import json
+import msgpack
+import pyarrow.ipc
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from services.history_formats import negotiate, to_columns, COLUMNAR_JSON_MEDIA_TYPE
+
+
+def make_points(valid_metrics_data, minutes):
+    return [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T12:{minute:02d}:00Z", cpu_usage=minute)
+        for minute in minutes
+    ]
+
+
+def test_format_negotiation():
+    assert negotiate(None, None) == "json"
+    assert negotiate(None, "*/*") == "json"
+    assert negotiate(None, "application/x-msgpack") == "msgpack"
+    assert negotiate(None, "application/json;q=0.5, application/vnd.apache.arrow.stream") == "arrow"
+    assert negotiate(None, f"text/html, {COLUMNAR_JSON_MEDIA_TYPE};q=0.9, application/json;q=0.8") == "columnar"
+    assert negotiate("json", "application/msgpack") == "json"
+    assert to_columns([{"a": 1, "s": {"x": "up"}}, {"a": 2, "s": {"y": "down"}}]) == {
+        "a": [1, 2], "s.x": ["up", None], "s.y": [None, "down"]
+    }
+
+
+@pytest.mark.asyncio
+async def test_history_formats_hold_the_same_points(valid_metrics_data):
+    params = {"resolution": "raw", "limit": 3}
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(5)))
+        rows = await client.get("/api/history", params=params)
+        columnar = await client.get("/api/history", params=dict(params, format="columnar"))
+        packed = await client.get("/api/history", params=params, headers={"Accept": "application/msgpack"})
+        arrow = await client.get("/api/history", params=params, headers={"Accept": "application/vnd.apache.arrow.stream"})
+
+    expected = to_columns(rows.json()["data"])
+    assert rows.headers["content-type"] == "application/json"
+    assert columnar.headers["content-type"] == COLUMNAR_JSON_MEDIA_TYPE
+    # the CORS middleware adds Origin
+    assert all("Accept" in response.headers["vary"].split(", ") for response in (rows, columnar, packed, arrow))
+    assert columnar.json()["columns"] == expected
+    assert columnar.json()["next_cursor"] == rows.json()["next_cursor"]
+    assert "data" not in columnar.json()
+    assert expected["cpu_usage"] == [4, 3, 2]
+    assert expected["service_status.cache"] == ["online"] * 3
+
+    unpacked = msgpack.unpackb(packed.content)
+    assert packed.headers["content-type"] == "application/msgpack"
+    assert unpacked["columns"] == expected
+    assert unpacked["total_retrieved"] == 3
+
+    table = pyarrow.ipc.open_stream(arrow.content).read_all()
+    assert table.to_pydict() == expected
+    assert json.loads(table.schema.metadata[b"history"])["resolution"] == "raw"
+    assert len(packed.content) < len(columnar.content) < len(rows.content)
+
+
+@pytest.mark.asyncio
+async def test_rollups_are_columnar_and_stream_stays_ndjson(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(3)))
+        rollups = (await client.get("/api/history", params={"resolution": "1m", "format": "columnar"})).json()
+        stream = await client.get("/api/history", params={"stream": True}, headers={"Accept": "application/msgpack"})
+        arrow_stream = await client.get("/api/history", params={"stream": True, "format": "arrow"})
+
+    assert rollups["columns"]["cpu_usage.last"] == [2.0, 1.0, 0.0]
+    assert rollups["columns"]["service_status.database.online"] == [1, 1, 1]
+    assert stream.headers["content-type"] == "application/x-ndjson"
+    assert arrow_stream.status_code == 400
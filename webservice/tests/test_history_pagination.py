@@ -0,0 +1,116 @@
+import json
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from services.block_storage import block_storage
+from services.hot_window import hot_window
+from services.row_merge import encode_cursor, decode_cursor
+
+
+def make_points(valid_metrics_data, minutes):
+    return [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T12:{minute:02d}:00Z", cpu_usage=minute)
+        for minute in minutes
+    ]
+
+
+async def read_pages(client, **params):
+    pages = []
+    cursor = None
+    while True:
+        response = await client.get("/api/history", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.json()
+        pages.append(page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor((1696161600000, 42, 0))) == (1696161600000, 42, 0)
+    assert decode_cursor(encode_cursor((1696161600000, 0, 3))) == (1696161600000, 0, 3)
+    assert decode_cursor(encode_cursor((1696161600000, 42))) == (1696161600000, 42, 0)
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+@pytest.mark.asyncio
+async def test_cursor_walks_every_point_once(valid_metrics_data):
+    # three points share each timestamp, the id breaks the ties
+    points = make_points(valid_metrics_data, [minute for minute in range(7) for _ in range(3)])
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=points)
+        pages = await read_pages(client, limit=4, resolution="raw")
+        window = await read_pages(client, limit=4, resolution="raw", start_time="2023-10-01T12:02:00Z", end_time="2023-10-01T12:04:00Z")
+
+    rows = [row for page in pages for row in page]
+    assert [len(page) for page in pages] == [4, 4, 4, 4, 4, 1]
+    assert len({row["id"] for row in rows}) == 21
+    assert [(row["event_time"], row["id"]) for row in rows] == sorted(
+        ((row["event_time"], row["id"]) for row in rows), reverse=True
+    )
+    assert [row["cpu_usage"] for row in window[0] + window[1] + window[2]] == [4, 4, 4, 3, 3, 3, 2, 2, 2]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("window", [True, False])
+async def test_cursor_walks_block_points_sharing_a_timestamp(monkeypatch, valid_metrics_data, window):
+    monkeypatch.setattr(block_storage, "enabled", True)
+    monkeypatch.setattr(block_storage, "block_points", 4)
+    monkeypatch.setattr(hot_window, "enabled", window)
+    # five points per timestamp spread over several blocks, one sent with an offset
+    points = [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T12:{minute:02d}:00Z", cpu_usage=10 * minute + i)
+        for minute in range(3) for i in range(5)
+    ]
+    points[7]["timestamp"] = "2023-10-01T14:01:00+02:00"
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=points[:6])
+        await client.post("/api/ingest", json=points[6:])
+        pages = await read_pages(client, limit=3)
+        first = (await client.get("/api/history", params={"limit": 3})).json()
+        resumed = await client.get("/api/history", params={"stream": True, "cursor": first["next_cursor"]})
+
+    rows = [row for page in pages for row in page]
+    assert [len(page) for page in pages] == [3, 3, 3, 3, 3, 0]
+    assert sorted(row["cpu_usage"] for row in rows) == sorted(point["cpu_usage"] for point in points)
+    # newest first, the most recently stored point of a timestamp first
+    assert [row["cpu_usage"] for row in rows] == [24, 23, 22, 21, 20, 14, 13, 12, 11, 10, 4, 3, 2, 1, 0]
+    assert [row["timestamp"] for row in rows if row["cpu_usage"] == 12] == ["2023-10-01T14:01:00+02:00"]
+    assert [json.loads(line)["cpu_usage"] for line in resumed.text.splitlines()] == [row["cpu_usage"] for row in rows[3:]]
+
+
+@pytest.mark.asyncio
+async def test_stream_returns_table_and_block_points(monkeypatch, valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(0, 10, 2)))
+        monkeypatch.setattr(block_storage, "enabled", True)
+        monkeypatch.setattr(block_storage, "block_points", 2)
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(1, 10, 2)))
+
+        response = await client.get("/api/history", params={"stream": True, "limit": 3})
+        resumed = await client.get("/api/history", params={
+            "stream": True, "cursor": encode_cursor((1696161600000 + 5 * 60_000, 0, 1))
+        })
+        pages = await read_pages(client, limit=3)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["cpu_usage"] for row in streamed] == list(range(9, -1, -1))
+    assert [row["cpu_usage"] for row in streamed] == [row["cpu_usage"] for page in pages for row in page]
+    assert [json.loads(line)["cpu_usage"] for line in resumed.text.splitlines()] == [4, 3, 2, 1, 0]
+
+
+@pytest.mark.asyncio
+async def test_invalid_cursor_and_rollup_pagination_are_rejected():
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        invalid = await client.get("/api/history", params={"cursor": "%%%"})
+        rollup = await client.get("/api/history", params={"cursor": encode_cursor((0, 0)), "resolution": "1h"})
+        stream_rollup = await client.get("/api/history", params={"stream": True, "resolution": "1m"})
+
+    assert invalid.status_code == 400
+    assert invalid.json()["message"] == "Invalid cursor"
+    assert rollup.status_code == 400
+    assert stream_rollup.status_code == 400
@@ -0,0 +1,110 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from services.hot_window import hot_window, HotWindow, InfraWindow
+
+
+@pytest.fixture(autouse=True)
+def small_hot_window(monkeypatch):
+    monkeypatch.setattr(hot_window, "capacity", 8)
+    for counter in ("hits", "misses", "hydrations", "evictions"):
+        monkeypatch.setattr(hot_window, counter, 0)
+
+
+def make_points(valid_metrics_data, minutes):
+    return [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T12:{minute:02d}:00Z", cpu_usage=minute)
+        for minute in minutes
+    ]
+
+
+def window_rows(valid_metrics_data, minutes):
+    return [
+        {
+            "timestamp": f"2023-10-01T12:{minute:02d}:00Z",
+            "event_time": 1696161600000 + minute * 60_000,
+            **{key: value for key, value in valid_metrics_data.items() if key not in ("timestamp", "service_status")},
+            "cpu_usage": minute,
+            **{f"service_status_{service}": status for service, status in valid_metrics_data["service_status"].items()}
+        }
+        for minute in minutes
+    ]
+
+
+def test_window_tracks_the_oldest_complete_event_time(valid_metrics_data):
+    window = InfraWindow(4)
+    window.append(window_rows(valid_metrics_data, [0, 1, 2]))
+    assert window.complete_from is None
+    assert [row["cpu_usage"] for row in window.select(None, None, 10)] == [2, 1, 0]
+
+    # a late point and an overflow: minute 0 then 1 are evicted
+    window.append(window_rows(valid_metrics_data, [5, 3, 4]))
+    assert window.size == 4
+    assert window.complete_from == 1696161600000 + 60_000 + 1
+    assert [row["cpu_usage"] for row in window.select(None, None, 3)] == [5, 4, 3]
+    assert window.select(None, None, 5) is None
+    assert window.latest()["cpu_usage"] == 5
+
+    stats = window.get_stats()
+    assert stats["points"] == 4
+    assert stats["metrics"]["cpu_usage"]["mean"] == 3.5
+    assert stats["service_status"]["database"] == {"online": 4}
+
+
+@pytest.mark.asyncio
+async def test_hydration_is_retried_on_concurrent_appends(valid_metrics_data):
+    window = HotWindow(enabled=True, capacity=4, max_infras=2)
+
+    async def racing_loader(session):
+        window.append(1, window_rows(valid_metrics_data, [9]))
+        return window_rows(valid_metrics_data, [1, 0])
+
+    assert await window.hydrate(1, racing_loader) is None
+
+    async def loader(session):
+        return window_rows(valid_metrics_data, [1, 0])
+
+    hydrated = await window.hydrate(1, loader)
+    assert [row["cpu_usage"] for row in hydrated.select(None, None, 10)] == [1, 0]
+
+
+@pytest.mark.asyncio
+async def test_history_is_served_from_the_window(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(12)))
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, [12])[0])
+
+        recent = (await client.get("/api/history", params={"limit": 5, "resolution": "raw"})).json()
+        assert hot_window.hits == 1
+        older = (await client.get("/api/history", params={"limit": 20, "resolution": "raw"})).json()
+        assert hot_window.misses == 1
+        window = (await client.get("/api/metrics/window")).json()["data"]["window"]
+
+        hot_window.enabled = False
+        try:
+            stored = (await client.get("/api/history", params={"limit": 20, "resolution": "raw"})).json()
+        finally:
+            hot_window.enabled = True
+
+    assert [p["cpu_usage"] for p in recent["data"]] == [12, 11, 10, 9, 8]
+    assert recent["data"] == stored["data"][:5]
+    assert older["data"] == stored["data"]
+    assert window["points"] == 8
+    assert window["metrics"]["cpu_usage"]["max"] == 12
+
+
+@pytest.mark.asyncio
+async def test_idle_infrastructures_are_evicted(valid_metrics_data, monkeypatch):
+    monkeypatch.setattr(hot_window, "max_infras", 1)
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, range(3)))
+        await client.post("/api/ingest", params={"infra": "web-1"}, json=make_points(valid_metrics_data, range(2)))
+
+        await client.get("/api/anomalies")
+        await client.get("/api/anomalies", params={"infra": "web-1"})
+        await client.post("/api/ingest", json=make_points(valid_metrics_data, [7]))
+        history = (await client.get("/api/history", params={"resolution": "raw"})).json()
+
+    assert hot_window.get_stats()["resident_infras"] == 1
+    assert hot_window.evictions >= 1
+    assert [p["cpu_usage"] for p in history["data"]] == [7, 2, 1, 0]
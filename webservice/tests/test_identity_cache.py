@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import event, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from db import engine
+from models.sql import User, Infrastructure
+from services.identity_cache import identity_cache
+from services.persistence import PersistenceService
+
+
+@pytest.fixture
+def statements():
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+@pytest.mark.asyncio
+async def test_warm_cache_skips_identity_selects(valid_metrics_data, statements):
+    persistence_service = PersistenceService()
+
+    async with AsyncSession(engine) as session:
+        await persistence_service.store_validated_metrics(session, [valid_metrics_data])
+    statements.clear()
+
+    async with AsyncSession(engine) as session:
+        stored = await persistence_service.store_validated_metrics(session, [valid_metrics_data] * 3)
+
+    assert stored == 3
+    assert not any(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+    assert identity_cache.get_stats()["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidated_when_infrastructure_changes():
+    async with AsyncSession(engine) as session:
+        assert await identity_cache.resolve(session, "jean", "default") == (1, 1)
+
+        infra = (await session.execute(select(Infrastructure))).scalar_one()
+        infra.name = "renamed"
+        await session.commit()
+
+        assert identity_cache.get_stats()["entries"] == 0
+        with pytest.raises(ValueError):
+            await identity_cache.resolve(session, "jean", "default")
+
+
+@pytest.mark.asyncio
+async def test_cache_invalidated_by_bulk_update():
+    async with AsyncSession(engine) as session:
+        await identity_cache.resolve(session, "jean", "default")
+
+        await session.execute(update(User).where(User.username == "jean").values(username="paul"))
+        await session.commit()
+
+        assert identity_cache.get_stats()["entries"] == 0
+        assert await identity_cache.resolve(session, "paul", "default") == (1, 1)
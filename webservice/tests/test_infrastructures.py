@@ -0,0 +1,125 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from main import app
+from db import engine
+from models.sql import Infrastructure, Metrics
+from api.metrics import persistence_service
+from services.anomaly_detection import AnomalyDetectorRegistry, anomaly_detectors
+
+
+@pytest.mark.asyncio
+async def test_ingest_registers_unknown_infrastructure(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post("/api/ingest", params={"infra": "web-1"}, json=[valid_metrics_data] * 3)
+        assert response.status_code == 200
+        response = await client.post("/api/ingest", params={"infra": "web-1"}, json=valid_metrics_data)
+        assert response.status_code == 200
+
+    async with AsyncSession(engine) as session:
+        infras = (await session.execute(select(Infrastructure).where(Infrastructure.name == "web-1"))).scalars().all()
+        assert len(infras) == 1
+        count = (await session.execute(
+            select(Metrics).where(Metrics.infra_id == infras[0].id)
+        )).scalars().all()
+        assert len(count) == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", ["", "x" * 65, "-web", "web 1", "web/1", "wëb"])
+async def test_ingest_rejects_invalid_infrastructure_names(valid_metrics_data, name):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post("/api/ingest", params={"infra": name}, json=valid_metrics_data)
+    assert response.status_code == 422
+
+    async with AsyncSession(engine) as session:
+        names = (await session.execute(select(Infrastructure.name))).scalars().all()
+    assert names == ["default"]
+
+
+@pytest.mark.asyncio
+async def test_ingest_without_auto_registration_rejects_unknown_infrastructure(valid_metrics_data, monkeypatch):
+    monkeypatch.setattr(persistence_service, "auto_register", False)
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        unknown = await client.post("/api/ingest", params={"infra": "web-1"}, json=[valid_metrics_data] * 2)
+        known = await client.post("/api/ingest", json=valid_metrics_data)
+
+    assert unknown.status_code == 404
+    assert unknown.json()["message"] == "Unknown infrastructure 'web-1'"
+    assert known.status_code == 200
+    async with AsyncSession(engine) as session:
+        names = (await session.execute(select(Infrastructure.name))).scalars().all()
+    assert names == ["default"]
+
+
+@pytest.mark.asyncio
+async def test_history_is_scoped_to_infrastructure(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", params={"infra": "web-1"}, json=[valid_metrics_data] * 2)
+        await client.post("/api/ingest", params={"infra": "db-1"}, json=dict(valid_metrics_data, cpu_usage=10))
+        await client.post("/api/ingest", json=valid_metrics_data)
+
+        web = (await client.get("/api/history", params={"infra": "web-1"})).json()
+        db = (await client.get("/api/history", params={"infra": "db-1"})).json()
+        default = (await client.get("/api/history")).json()
+        info = (await client.get("/api/metrics/info", params={"infra": "db-1"})).json()
+
+    assert web["infra"] == "web-1"
+    assert web["total_retrieved"] == 2
+    assert db["total_retrieved"] == 1
+    assert db["data"][0]["cpu_usage"] == 10
+    assert default["total_retrieved"] == 1
+    assert info["total_count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_read_endpoints_reject_unknown_infrastructure():
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        assert (await client.get("/api/history", params={"infra": "nope"})).status_code == 404
+        assert (await client.get("/api/metrics/info", params={"infra": "nope"})).status_code == 404
+        assert (await client.get("/api/anomalies", params={"infra": "nope"})).status_code == 404
+        detectors = len(anomaly_detectors)
+        assert (await client.get("/api/anomalies/history", params={"infra": "nope"})).status_code == 404
+        assert (await client.get("/api/analysis", params={"infra": "nope"})).status_code == 404
+    # unknown names never get a detector
+    assert len(anomaly_detectors) == detectors
+
+
+@pytest.mark.asyncio
+async def test_anomalies_use_latest_metrics_of_infrastructure(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", params={"infra": "web-1"}, json=dict(valid_metrics_data, cpu_usage=99))
+        await client.post("/api/ingest", params={"infra": "db-1"}, json=dict(valid_metrics_data, cpu_usage=10))
+
+        response = await client.get("/api/anomalies", params={"infra": "db-1"})
+
+    assert response.status_code == 200
+    assert not any(anomaly["metric"] == "cpu_usage" for anomaly in response.json()["anomalies"])
+
+
+def test_anomaly_detectors_are_bounded():
+    detectors = AnomalyDetectorRegistry(max_infras=2)
+    first = detectors.get(1)
+    first.detect_anomalies({"thread_count": 50})
+    detectors.get(2)
+    assert detectors.get(1) is first
+    detectors.get(3)
+
+    assert len(detectors) == 2 and detectors.evictions == 1
+    assert detectors.get(1) is first
+    # 2 was the least recently used, its detector starts over
+    assert detectors.get(2).get_history_summary()["thread_count"]["count"] == 0
+
+
+@pytest.mark.asyncio
+async def test_infrastructure_reads_use_composite_index():
+    async with engine.connect() as conn:
+        result = await conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM metrics WHERE infra_id = 1 ORDER BY event_time DESC LIMIT 10"
+        ))
+        plan = " ".join(str(row[-1]) for row in result)
+
+    assert "ix_metrics_infra_id_event_time" in plan
+    assert "TEMP B-TREE" not in plan
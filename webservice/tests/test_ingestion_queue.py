@@ -0,0 +1,125 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from db import engine
+from models.sql import Metrics
+from services.ingestion_queue import IngestionQueue, IngestionQueueFull
+from services.persistence import PersistenceService
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import func
+import api.metrics
+
+
+async def count_metrics() -> int:
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(func.count(Metrics.id)))
+        return result.scalar()
+
+
+@pytest.mark.asyncio
+async def test_queue_group_commits_and_flushes_on_stop(valid_metrics_data):
+    queue = IngestionQueue(PersistenceService(), max_size=1000, batch_size=40, flush_interval=0.05)
+    await queue.start()
+
+    for _ in range(5):
+        queue.enqueue([valid_metrics_data.copy() for _ in range(20)])
+
+    await queue.stop()
+
+    assert await count_metrics() == 100
+    stats = queue.get_stats()
+    assert stats["written"] == 100
+    assert stats["failed"] == 0
+    assert stats["queue_depth"] == 0
+    assert stats["batches"] < 100
+    assert stats["running"] is False
+
+
+@pytest.mark.asyncio
+async def test_queue_rejects_when_full(valid_metrics_data):
+    queue = IngestionQueue(PersistenceService(), max_size=10, batch_size=10, flush_interval=0.05)
+    await queue.start()
+
+    with pytest.raises(IngestionQueueFull):
+        queue.enqueue([valid_metrics_data.copy() for _ in range(11)])
+
+    await queue.stop()
+    assert await count_metrics() == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_retries_failed_writes(valid_metrics_data, monkeypatch):
+    persistence_service = PersistenceService()
+    store = persistence_service.store_validated_metrics
+    attempts = []
+
+    async def locked_twice(session, metrics_list, infra_name):
+        attempts.append(len(metrics_list))
+        if len(attempts) <= 2:
+            # store_validated_metrics rolls back and reports nothing stored
+            return 0
+        return await store(session, metrics_list, infra_name)
+
+    monkeypatch.setattr(persistence_service, "store_validated_metrics", locked_twice)
+    queue = IngestionQueue(persistence_service, max_size=100, batch_size=20, flush_interval=0.01, retry_backoff=0.01)
+    await queue.start()
+    queue.enqueue([valid_metrics_data.copy() for _ in range(20)])
+    await queue.stop()
+
+    assert attempts == [20, 20, 20]
+    assert await count_metrics() == 20
+    stats = queue.get_stats()
+    assert (stats["written"], stats["failed"], stats["retries"]) == (20, 0, 2)
+
+
+@pytest.mark.asyncio
+async def test_queue_drops_batch_after_last_attempt(valid_metrics_data, monkeypatch):
+    persistence_service = PersistenceService()
+
+    async def unavailable(session, metrics_list, infra_name):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(persistence_service, "store_validated_metrics", unavailable)
+    queue = IngestionQueue(persistence_service, max_size=100, batch_size=20, flush_interval=0.01, write_attempts=3, retry_backoff=0.01)
+    await queue.start()
+    queue.enqueue([valid_metrics_data.copy() for _ in range(5)])
+    await queue.stop()
+
+    stats = queue.get_stats()
+    assert (stats["written"], stats["failed"], stats["retries"]) == (0, 5, 2)
+
+
+@pytest.mark.asyncio
+async def test_ingest_endpoint_queue_mode(valid_metrics_data, monkeypatch):
+    monkeypatch.setattr(api.metrics, "INGEST_MODE", "queue")
+    queue = IngestionQueue(PersistenceService(), max_size=100, batch_size=10, flush_interval=0.05)
+    monkeypatch.setattr(api.metrics, "ingestion_queue", queue)
+    await queue.start()
+
+    invalid_metrics_data = valid_metrics_data.copy()
+    invalid_metrics_data["cpu_usage"] = "bad"
+
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post("/api/ingest", json=valid_metrics_data)
+        assert response.status_code == 202
+        assert response.json()["status"] == "accepted"
+
+        response = await client.post("/api/ingest", json=[valid_metrics_data, invalid_metrics_data])
+        assert response.status_code == 202
+        assert response.json()["batch_result"] == {"accepted": 1, "failed": 1}
+
+        response = await client.post("/api/ingest", json=invalid_metrics_data)
+        assert response.status_code == 422
+
+        await queue.flush()
+
+        response = await client.get("/api/ingest/metrics")
+        assert response.status_code == 200
+        data = response.json()["data"]
+        assert data["mode"] == "queue"
+        assert data["queue"]["written"] == 2
+        assert "lag_seconds" in data["queue"]
+
+    await queue.stop()
+    assert await count_metrics() == 2
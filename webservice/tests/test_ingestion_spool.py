@@ -0,0 +1,107 @@
+import json
+import os
+import pytest
+from db import engine
+from models.sql import Infrastructure, Metrics, SpoolSegment
+from services.ingestion_spool import IngestionSpool
+from services.persistence import PersistenceService
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import func
+
+
+async def count_metrics() -> int:
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(func.count(Metrics.id)))
+        return result.scalar()
+
+
+@pytest.mark.asyncio
+async def test_spool_appends_rotates_and_applies(tmp_path, valid_metrics_data):
+    spool = IngestionSpool(PersistenceService(), spool_dir=str(tmp_path), segment_max_bytes=2048, apply_interval=60)
+    await spool.start()
+
+    for _ in range(10):
+        await spool.append([valid_metrics_data.copy() for _ in range(3)])
+
+    stats = spool.get_stats()
+    assert stats["spooled"] == 30
+    assert stats["pending_segments"] >= 1
+    assert await count_metrics() == 0
+
+    await spool.stop()
+
+    assert await count_metrics() == 30
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.asyncio
+async def test_spool_recovers_segments_at_startup(tmp_path, valid_metrics_data):
+    segment = tmp_path / "segment-00000000000000000001-000001.ndjson"
+    lines = [json.dumps(valid_metrics_data) for _ in range(4)]
+    segment.write_text("\n".join(lines) + "\n" + '{"timestamp": "2023-10')
+
+    spool = IngestionSpool(PersistenceService(), spool_dir=str(tmp_path), apply_interval=60)
+    await spool.start()
+    await spool.apply_pending()
+
+    assert await count_metrics() == 4
+    assert not segment.exists()
+    await spool.stop()
+
+
+@pytest.mark.asyncio
+async def test_spool_skips_already_applied_segment(tmp_path, valid_metrics_data):
+    name = "segment-00000000000000000001-000001.ndjson"
+    (tmp_path / name).write_text(json.dumps(valid_metrics_data) + "\n")
+    async with AsyncSession(engine) as session:
+        session.add(SpoolSegment(name=name, record_count=1))
+        await session.commit()
+
+    spool = IngestionSpool(PersistenceService(), spool_dir=str(tmp_path), apply_interval=60)
+    await spool.start()
+    await spool.apply_pending()
+    await spool.stop()
+
+    assert await count_metrics() == 0
+    assert not (tmp_path / name).exists()
+
+
+@pytest.mark.asyncio
+async def test_spool_quarantines_segment_failing_repeatedly(tmp_path, valid_metrics_data):
+    poison = "segment-00000000000000000001-000001.ndjson"
+    good = "segment-00000000000000000002-000002.ndjson"
+    (tmp_path / poison).write_text(json.dumps({"timestamp": "2023-10-01T12:00:00Z"}) + "\n")
+    (tmp_path / good).write_text(json.dumps(valid_metrics_data) + "\n")
+
+    spool = IngestionSpool(PersistenceService(), spool_dir=str(tmp_path), apply_interval=60, apply_attempts=3)
+    # the segments behind a failing one wait for it
+    assert await spool.apply_pending() == 0
+    assert await count_metrics() == 0
+    assert (tmp_path / good).exists()
+
+    await spool.apply_pending()
+    assert await spool.apply_pending() == 1
+
+    assert await count_metrics() == 1
+    assert sorted(os.listdir(tmp_path)) == [poison + ".failed"]
+    assert spool.get_stats()["failed_segments"] == 1
+    assert spool.get_stats()["pending_segments"] == 0
+
+
+@pytest.mark.asyncio
+async def test_spool_keeps_infrastructure_of_each_record(tmp_path, valid_metrics_data):
+    spool = IngestionSpool(PersistenceService(), spool_dir=str(tmp_path), apply_interval=60)
+    await spool.start()
+
+    await spool.append([valid_metrics_data.copy() for _ in range(2)], "web-1")
+    await spool.append([valid_metrics_data.copy()])
+    await spool.stop()
+
+    async with AsyncSession(engine) as session:
+        result = await session.execute(
+            select(Infrastructure.name, func.count(Metrics.id))
+            .join(Metrics, Metrics.infra_id == Infrastructure.id)
+            .group_by(Infrastructure.name)
+        )
+        assert dict(result.all()) == {"default": 1, "web-1": 2}
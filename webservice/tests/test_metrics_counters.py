@@ -0,0 +1,111 @@
+import re
+import pytest
+from datetime import datetime, timedelta, timezone
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from main import app
+from db import engine, read_engine
+from models.sql import Metrics, MetricsCounter
+from services.metrics_counters import metrics_counters
+from services.retention import RetentionService
+from services.time_utils import parse_timestamp_ms
+
+
+@pytest.fixture
+def read_statements():
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(read_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(read_engine.sync_engine, "before_cursor_execute", record)
+
+
+def days_ago(days, minutes=0):
+    return (datetime.now(timezone.utc) - timedelta(days=days, minutes=minutes)).isoformat()
+
+
+async def counters():
+    async with AsyncSession(engine) as session:
+        return {counter.infra_id: counter for counter in (await session.execute(select(MetricsCounter))).scalars()}
+
+
+def snapshot(counter):
+    return counter.row_count, counter.first_event_time, counter.last_event_time, counter.last_timestamp, counter.last_id
+
+
+@pytest.mark.asyncio
+async def test_ingest_maintains_counters(valid_metrics_data, read_statements):
+    batch = [dict(valid_metrics_data, timestamp=f"2023-10-01T12:0{i}:00+00:00") for i in range(5)]
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=batch)
+        await client.post("/api/ingest", json=dict(valid_metrics_data, timestamp="2023-10-01T11:00:00Z"))
+        await client.post("/api/ingest", json=[dict(valid_metrics_data, timestamp="2023-10-01T12:04:00Z")])
+        read_statements.clear()
+        info = (await client.get("/api/metrics/info")).json()
+
+    # a late point does not move the latest timestamp, a tie goes to the newest row
+    assert info == {"total_count": 7, "latest_timestamp": "2023-10-01T12:04:00Z"}
+    assert read_statements
+    assert not any(re.search(r"\bFROM (metrics|metrics_blocks|cold_partitions)\b", statement) for statement in read_statements)
+
+    counter = (await counters())[1]
+    async with AsyncSession(engine) as session:
+        max_id = (await session.execute(select(func.max(Metrics.id)))).scalar()
+    assert counter.first_event_time == parse_timestamp_ms("2023-10-01T11:00:00Z")
+    assert counter.last_event_time == parse_timestamp_ms("2023-10-01T12:04:00Z")
+    assert counter.last_id == max_id
+
+
+@pytest.mark.asyncio
+async def test_retention_updates_counters(valid_metrics_data):
+    old = [dict(valid_metrics_data, timestamp=days_ago(20, minutes=i)) for i in range(7)]
+    recent = [dict(valid_metrics_data, timestamp=days_ago(1, minutes=i)) for i in range(3)]
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=old + recent)
+        await client.post("/api/ingest", params={"infra": "web-1"}, json=old)
+
+        await RetentionService(raw_days=14, rollup_days=365, batch_size=2).run_once()
+        info = (await client.get("/api/metrics/info")).json()
+        web = (await client.get("/api/metrics/info", params={"infra": "web-1"})).json()
+
+    assert info == {"total_count": 3, "latest_timestamp": recent[0]["timestamp"]}
+    assert web == {"total_count": 0, "latest_timestamp": None}
+    maintained = await counters()
+    assert maintained[1].first_event_time == parse_timestamp_ms(recent[-1]["timestamp"])
+
+    async with AsyncSession(engine) as session:
+        await metrics_counters.reconcile(session)
+        await session.commit()
+    reconciled = await counters()
+    assert 2 not in reconciled
+    assert snapshot(maintained[1]) == snapshot(reconciled[1])
+
+
+@pytest.mark.asyncio
+async def test_reconcile_counts_rows_written_behind_the_counters(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=valid_metrics_data)
+    async with AsyncSession(engine) as session:
+        row = (await session.execute(select(Metrics).limit(1))).scalar_one()
+        columns = {column.name: getattr(row, column.name) for column in Metrics.__table__.columns if column.name not in ("id", "created_at")}
+        await session.execute(insert(Metrics), [
+            dict(columns, timestamp="2023-10-02T08:00:00Z", event_time=parse_timestamp_ms("2023-10-02T08:00:00Z")),
+            dict(columns, timestamp="2023-09-30T08:00:00Z", event_time=parse_timestamp_ms("2023-09-30T08:00:00Z"))
+        ])
+        await session.commit()
+
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        stale = (await client.get("/api/metrics/info")).json()
+        async with AsyncSession(engine) as session:
+            assert await metrics_counters.reconcile(session) == 1
+            await session.commit()
+        info = (await client.get("/api/metrics/info")).json()
+
+    assert stale["total_count"] == 1
+    assert info == {"total_count": 3, "latest_timestamp": "2023-10-02T08:00:00Z"}
+    assert (await counters())[1].first_event_time == parse_timestamp_ms("2023-09-30T08:00:00Z")
@@ -2,51 +2,11 @@ import pytest
 import asyncio
 from httpx import AsyncClient, ASGITransport
 from main import app
-from db import engine, Base
-from models.sql import User, Infrastructure
+from db import engine
+from models.sql import Metrics
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 import sqlalchemy
-import pytest_asyncio
-
-@pytest_asyncio.fixture(autouse=True)
-async def clean_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
-        await conn.run_sync(Base.metadata.create_all)
-    async with AsyncSession(engine) as session:
-        user = User(username="jean", password="jean")
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
-        infra = Infrastructure(name="default", user_id=user.id)
-        session.add(infra)
-        await session.commit()
-    yield
-
-@pytest.fixture
-def valid_metrics_data():
-    return {
-        "timestamp": "2023-10-01T12:00:00Z",
-        "cpu_usage": 85,
-        "memory_usage": 75,
-        "latency_ms": 150,
-        "disk_usage": 60,
-        "network_in_kbps": 1000,
-        "network_out_kbps": 800,
-        "io_wait": 5,
-        "thread_count": 50,
-        "active_connections": 100,
-        "error_rate": 0.02,
-        "uptime_seconds": 3600,
-        "temperature_celsius": 45,
-        "power_consumption_watts": 300,
-        "service_status": {
-            "database": "online",
-            "api_gateway": "online",
-            "cache": "online"
-        }
-    }
 
 @pytest.fixture
 def invalid_metrics_data():
@@ -72,7 +32,6 @@ def invalid_metrics_data():
         }
     }
 
-import pytest_asyncio
 
 @pytest.mark.asyncio
 async def test_single_metrics_ingestion_success(valid_metrics_data):
@@ -171,4 +130,24 @@ async def test_batch_persistence_in_database(valid_metrics_data):
             timestamps = [m.timestamp for m in metrics]
             assert "2023-10-01T12:00:00Z" in timestamps
             assert "2023-10-01T12:01:00Z" in timestamps
-            assert "2023-10-01T12:02:00Z" in timestamps 
\ No newline at end of file
+            assert "2023-10-01T12:02:00Z" in timestamps 
+
+
+@pytest.mark.asyncio
+async def test_large_batch_bulk_persistence(valid_metrics_data, invalid_metrics_data):
+    batch_data = []
+    for i in range(1200):
+        metrics = valid_metrics_data.copy()
+        metrics["timestamp"] = f"2023-10-01T12:{i // 60 % 60:02d}:{i % 60:02d}Z"
+        batch_data.append(metrics)
+    batch_data[10] = invalid_metrics_data
+    batch_data[700] = invalid_metrics_data
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post("/api/ingest", json=batch_data)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["batch_result"]["stored"] == 1198
+        assert data["batch_result"]["failed"] == 2
+        async with AsyncSession(engine) as session:
+            result = await session.execute(select(sqlalchemy.func.count(Metrics.id)))
+            assert result.scalar() == 1198
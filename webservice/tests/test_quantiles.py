@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from services import quantile_sketch
+from services.aggregation import cover_range
+from services.rollups import RESOLUTIONS
+
+
+def assert_relative(actual, expected, accuracy=quantile_sketch.RELATIVE_ACCURACY):
+    np.testing.assert_allclose(actual, expected, rtol=accuracy + 1e-9)
+
+
+def test_merged_sketches_are_within_relative_accuracy():
+    rng = np.random.default_rng(11)
+    values = np.concatenate([rng.lognormal(3, 2, 5000), -rng.lognormal(1, 1, 500), np.zeros(100)])
+    groups = rng.integers(0, 7, len(values))
+
+    blobs = quantile_sketch.group_sketches(quantile_sketch.sketch_keys(values), groups, 9)
+    assert blobs[7] is None and blobs[8] is None
+    # merging pairwise like the rollup upserts do, or all at once, gives the same sketch
+    pairwise = blobs[0]
+    for blob in blobs[1:]:
+        pairwise = quantile_sketch._merge_blobs(pairwise, blob)
+    keys, counts = quantile_sketch.merge(blobs)
+    assert quantile_sketch.decode(pairwise)[1].tolist() == counts.tolist()
+    assert counts.sum() == len(values)
+
+    qs = [0.0, 0.01, 0.05, 0.5, 0.9, 0.99, 0.999, 1.0]
+    estimated = quantile_sketch.quantiles((keys, counts), qs, values.min(), values.max())
+    assert_relative(estimated, np.quantile(values, qs, method="lower"))
+    assert quantile_sketch.quantiles(quantile_sketch.merge([None]), [0.5], 0, 0) == [None]
+
+
+def test_cover_range_uses_coarse_buckets_inside():
+    minute, hour, day = RESOLUTIONS["1m"], RESOLUTIONS["1h"], RESOLUTIONS["1d"]
+    start, stop = day - 2 * hour - 3 * minute, 3 * day + hour
+    segments = cover_range(start, stop, RESOLUTIONS)
+    assert segments == [
+        ("1m", start, day - 2 * hour),
+        ("1h", day - 2 * hour, day),
+        ("1d", day, 3 * day),
+        ("1h", 3 * day, stop)
+    ]
+    assert cover_range(minute, 3 * minute, RESOLUTIONS) == [("1m", minute, 3 * minute)]
+
+
+@pytest.mark.asyncio
+async def test_quantiles_endpoint_merges_sketches_across_infrastructures(valid_metrics_data):
+    rng = np.random.default_rng(5)
+    latencies = {"web-1": rng.integers(1, 2000, 200), "web-2": rng.integers(100, 5000, 200)}
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        for name, values in latencies.items():
+            points = [
+                dict(valid_metrics_data, timestamp=f"2023-10-01T{10 + i // 60:02d}:{i % 60:02d}:00Z", latency_ms=int(value))
+                for i, value in enumerate(values)
+            ]
+            # two batches landing in the same buckets
+            await client.post("/api/ingest", params={"infra": name}, json=points[::2])
+            await client.post("/api/ingest", params={"infra": name}, json=points[1::2])
+
+        params = {
+            "start_time": "2023-10-01T10:30:00Z",
+            "end_time": "2023-10-01T13:09:59Z",
+            "metrics": "latency_ms,cpu_usage",
+            "percentiles": "p50,p95,p99,p100"
+        }
+        fleet = await client.get("/api/metrics/quantiles", params=dict(params, infra="web-1,web-2"))
+        single = await client.get("/api/metrics/quantiles", params=dict(params, infra="web-1"))
+        invalid = await client.get("/api/metrics/quantiles", params=dict(params, infra="web-1", percentiles="median"))
+        unknown = await client.get("/api/metrics/quantiles", params=dict(params, infra="web-1,nope"))
+
+    assert fleet.status_code == 200
+    data = fleet.json()["data"]
+    assert data["source"] == "sketches"
+    assert (data["start_time"], data["end_time"]) == ("2023-10-01T10:30:00Z", "2023-10-01T13:09:59.999000Z")
+    # 10:30-11:00 and 13:00-13:10 in minutes, 11:00-13:00 in hours, for both metrics and infrastructures
+    assert data["sketches"] == 2 * 2 * (30 + 2 + 10)
+    pooled = np.concatenate([values[30:190] for values in latencies.values()])
+    latency = data["quantiles"]["latency_ms"]
+    assert latency["count"] == len(pooled) == 320
+    assert_relative([latency[p] for p in ("p50", "p95", "p99")], np.quantile(pooled, [0.5, 0.95, 0.99], method="lower"))
+    assert latency["p100"] == pooled.max()
+    assert data["quantiles"]["cpu_usage"]["p50"] == 85
+
+    web = single.json()["data"]["quantiles"]["latency_ms"]
+    assert web["count"] == 160
+    assert_relative(web["p95"], np.quantile(latencies["web-1"][30:190], 0.95, method="lower"))
+
+    assert invalid.status_code == 400
+    assert unknown.status_code == 404
@@ -0,0 +1,101 @@
+import time
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event
+from main import app
+from db import read_engine
+from services.response_cache import ResponseCache, response_cache
+
+
+@pytest.fixture
+def read_statements():
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(read_engine.sync_engine, "before_cursor_execute", record)
+    yield executed
+    event.remove(read_engine.sync_engine, "before_cursor_execute", record)
+
+
+@pytest.mark.asyncio
+async def test_cached_reads_until_ingestion_commits(valid_metrics_data, read_statements):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=valid_metrics_data)
+        await client.post("/api/ingest", params={"infra": "web-1"}, json=valid_metrics_data)
+        stats = (await client.get("/api/metrics/cache")).json()["data"]
+
+        params = {"start_time": "2023-10-01T11:00:00Z", "end_time": "2023-10-01T13:00:00Z", "resolution": "raw"}
+        first = (await client.get("/api/history", params=params)).json()
+        await client.get("/api/metrics/info")
+        await client.get("/api/metrics/info", params={"infra": "web-1"})
+        read_statements.clear()
+        # same query, parameters in another order and another format: served from the cache
+        second = (await client.get("/api/history", params=dict(reversed(params.items())))).json()
+        columnar = (await client.get("/api/history", params=dict(params, format="columnar"))).json()
+        info = (await client.get("/api/metrics/info")).json()
+        cached_statements = [statement for statement in read_statements if "infrastructures" not in statement]
+
+        await client.post("/api/ingest", json=dict(valid_metrics_data, timestamp="2023-10-01T12:30:00Z"))
+        third = (await client.get("/api/history", params=params)).json()
+        fresh_info = (await client.get("/api/metrics/info")).json()
+        after = (await client.get("/api/metrics/cache")).json()["data"]
+
+    assert second == first
+    assert columnar["columns"]["timestamp"] == ["2023-10-01T12:00:00Z"]
+    assert info == {"total_count": 1, "latest_timestamp": "2023-10-01T12:00:00Z"}
+    assert cached_statements == []
+    # ingesting into default invalidates its entries only
+    assert third["total_retrieved"] == 2
+    assert fresh_info["total_count"] == 2
+    assert after["hits"] - stats["hits"] == 3
+    assert after["misses"] - stats["misses"] == 5
+    assert after["entries"] == 3
+
+
+@pytest.mark.asyncio
+async def test_polling_anomalies_does_not_grow_the_history(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", params={"infra": "cached"}, json=valid_metrics_data)
+        first = (await client.get("/api/anomalies", params={"infra": "cached"})).json()
+        await client.get("/api/anomalies", params={"infra": "cached"})
+        history = (await client.get("/api/anomalies/history", params={"infra": "cached"})).json()["data"]
+
+        await client.post("/api/ingest", params={"infra": "cached"}, json=dict(valid_metrics_data, timestamp="2023-10-01T12:01:00Z", thread_count=60))
+        second = (await client.get("/api/anomalies", params={"infra": "cached"})).json()
+        updated = (await client.get("/api/anomalies/history", params={"infra": "cached"})).json()["data"]
+
+    assert second["summary"] == first["summary"]
+    assert history["thread_count"]["values"] == [50]
+    assert updated["thread_count"]["values"] == [50, 60]
+
+
+@pytest.mark.asyncio
+async def test_entries_expire_and_least_recently_used_are_evicted(monkeypatch):
+    cache = ResponseCache(max_entries=2, ttl=30)
+    calls = []
+
+    def compute(value):
+        async def run():
+            calls.append(value)
+            return value
+        return run
+
+    assert await cache.get_or_compute("a", 1, {"x": 1, "y": None}, compute("a")) == "a"
+    assert await cache.get_or_compute("a", 1, {"x": 1}, compute("stale")) == "a"
+    await cache.get_or_compute("b", 1, {}, compute("b"))
+    await cache.get_or_compute("a", 1, {"x": 1}, compute("stale"))
+    # b is the least recently used
+    await cache.get_or_compute("c", 2, {}, compute("c"))
+    assert await cache.get_or_compute("b", 1, {}, compute("b2")) == "b2"
+    assert cache.evictions == 2
+
+    cache.bump(2)
+    assert await cache.get_or_compute("c", 2, {}, compute("c2")) == "c2"
+
+    now = time.monotonic()
+    monkeypatch.setattr("services.response_cache.time.monotonic", lambda: now + 31)
+    assert await cache.get_or_compute("c", 2, {}, compute("c3")) == "c3"
+    assert calls == ["a", "b", "c", "b2", "c2", "c3"]
+    assert cache.get_stats()["hits"] == 2
@@ -0,0 +1,113 @@
+import sqlite3
+import pytest
+from datetime import datetime, timedelta, timezone
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from main import app, lifespan
+import db_init
+from db import engine
+from models.sql import Metrics, MetricsRollup
+from api.retention import retention_service
+from services.retention import RetentionService
+
+
+def days_ago(days, minutes=0):
+    return (datetime.now(timezone.utc) - timedelta(days=days, minutes=minutes)).isoformat()
+
+
+async def count(model, *conditions):
+    async with AsyncSession(engine) as session:
+        return (await session.execute(select(func.count()).select_from(model).where(*conditions))).scalar()
+
+
+@pytest.mark.asyncio
+async def test_retention_purges_expired_raw_rows_in_batches(valid_metrics_data):
+    old = [dict(valid_metrics_data, timestamp=days_ago(20, minutes=i)) for i in range(7)]
+    recent = [dict(valid_metrics_data, timestamp=days_ago(1, minutes=i)) for i in range(3)]
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=old + recent)
+        await client.post("/api/ingest", params={"infra": "web-1"}, json=old)
+
+    retention = RetentionService(raw_days=14, rollup_days=365, batch_size=2)
+    result = await retention.run_once()
+
+    assert result["purged_raw"] == 14
+    assert result["purged_rollups"] == 0
+    assert await count(Metrics) == 3
+    assert retention.get_stats()["purged_raw"] == 14
+    assert retention.get_stats()["runs"] == 1
+
+
+@pytest.mark.asyncio
+async def test_per_infrastructure_policies(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=[dict(valid_metrics_data, timestamp=days_ago(5, minutes=i)) for i in range(3)])
+        await client.post("/api/ingest", params={"infra": "web-1"}, json=dict(valid_metrics_data, timestamp=days_ago(5)))
+
+        response = await client.put("/api/retention/policies", params={"infra": "web-1"}, json={"raw_days": 0, "rollup_days": 2})
+        assert response.status_code == 200
+        response = await client.put("/api/retention/policies", params={"infra": "nope"}, json={"raw_days": 1})
+        assert response.status_code == 404
+        response = await client.put("/api/retention/policies", json={"raw_days": -1})
+        assert response.status_code == 422
+
+        policies = (await client.get("/api/retention/policies")).json()["data"]
+
+    assert {p["infra"]: (p["raw_days"], p["rollup_days"]) for p in policies} == {"default": (0, 0), "web-1": (0, 2)}
+
+    retention = RetentionService(raw_days=3, rollup_days=365, batch_size=5)
+    result = await retention.run_once()
+
+    assert result["purged_raw"] == 3
+    assert await count(Metrics) == 1
+    assert await count(MetricsRollup, MetricsRollup.infra_id == 2) == 0
+    assert await count(MetricsRollup, MetricsRollup.infra_id == 1) > 0
+    assert result["purged_rollups"] > 0
+
+
+@pytest.mark.asyncio
+async def test_retention_metrics_endpoint():
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/retention/run")
+        response = await client.get("/api/retention/metrics")
+
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["runs"] == 1
+    assert "last_run_seconds" in data
+
+
+@pytest.mark.asyncio
+async def test_app_start_keeps_old_data_without_policy(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=[dict(valid_metrics_data, timestamp=days_ago(400, minutes=i)) for i in range(3)])
+    rollups = await count(MetricsRollup)
+
+    async with lifespan(app):
+        # waits for the pass the background task starts with
+        result = await retention_service.run_once()
+
+    assert result["purged_raw"] == result["purged_rollups"] == 0
+    assert await count(Metrics) == 3
+    assert await count(MetricsRollup) == rollups > 0
+
+
+@pytest.mark.asyncio
+async def test_vacuum_on_init_converts_existing_database(tmp_path, monkeypatch):
+    path = tmp_path / "existing.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE points (value INTEGER)")
+        conn.executemany("INSERT INTO points VALUES (?)", [(i,) for i in range(100)])
+    existing = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    monkeypatch.setattr(db_init, "engine", existing)
+    monkeypatch.setattr(db_init, "SQLITE_VACUUM_ON_INIT", True)
+    try:
+        await db_init._enable_incremental_vacuum()
+        async with existing.connect() as conn:
+            assert (await conn.execute(text("PRAGMA auto_vacuum"))).scalar() == 2
+            assert (await conn.execute(text("SELECT count(*) FROM points"))).scalar() == 100
+    finally:
+        await existing.dispose()
@@ -0,0 +1,109 @@
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from main import app
+from db import engine
+from models.sql import MetricsRollup, ServiceStatusRollup
+from services.retention import RetentionService
+from services.time_utils import parse_timestamp_ms
+
+
+def point(base, minute, second, cpu, database="online"):
+    return dict(
+        base,
+        timestamp=f"2023-10-01T12:{minute:02d}:{second:02d}Z",
+        cpu_usage=cpu,
+        service_status=dict(base["service_status"], database=database)
+    )
+
+
+async def rollup_snapshot():
+    async with AsyncSession(engine) as session:
+        metrics = (await session.execute(select(MetricsRollup))).scalars().all()
+        statuses = (await session.execute(select(ServiceStatusRollup))).scalars().all()
+    return (
+        {(r.resolution, r.bucket_start, r.metric): (r.count, round(r.sum_value, 9), r.min_value, r.max_value, r.last_value) for r in metrics},
+        {(r.resolution, r.bucket_start, r.service, r.status): r.count for r in statuses}
+    )
+
+
+@pytest.mark.asyncio
+async def test_rollups_are_updated_incrementally(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=[
+            point(valid_metrics_data, 0, 10, 20),
+            point(valid_metrics_data, 0, 50, 60, database="degraded"),
+            point(valid_metrics_data, 1, 0, 40),
+        ])
+        await client.post("/api/ingest", json=point(valid_metrics_data, 0, 30, 80))
+
+    metrics, statuses = await rollup_snapshot()
+
+    minute = 1696161600000
+    assert metrics[("1m", minute, "cpu_usage")] == (3, 160.0, 20.0, 80.0, 60.0)
+    assert metrics[("1m", minute + 60000, "cpu_usage")] == (1, 40.0, 40.0, 40.0, 40.0)
+    assert metrics[("1h", minute, "cpu_usage")] == (4, 200.0, 20.0, 80.0, 40.0)
+    assert statuses[("1h", minute, "database", "online")] == 3
+    assert statuses[("1h", minute, "database", "degraded")] == 1
+
+
+@pytest.mark.asyncio
+async def test_rebuild_matches_incremental_rollups(valid_metrics_data):
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        for minute in range(3):
+            await client.post("/api/ingest", json=[point(valid_metrics_data, minute, s, s + minute) for s in range(0, 60, 7)])
+        incremental = await rollup_snapshot()
+
+        response = await client.post("/api/metrics/rollups/rebuild")
+
+    assert response.status_code == 200
+    assert response.json()["data"]["rows"] == 27
+    assert await rollup_snapshot() == incremental
+
+
+@pytest.mark.asyncio
+async def test_rebuild_keeps_rollups_of_purged_raw_points(valid_metrics_data):
+    points = [
+        dict(valid_metrics_data, timestamp=f"2023-10-01T{10 + i // 6:02d}:{i % 6 * 10:02d}:30Z", cpu_usage=i)
+        for i in range(30)
+    ]
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=points)
+        incremental = await rollup_snapshot()
+
+        # raw points before 12:35 are purged, 12:00-13:00 and the day keep counting them
+        cutoff = parse_timestamp_ms("2023-10-01T12:35:00Z")
+        result = await RetentionService(raw_days=1, rollup_days=0).run_once(now_ms=cutoff + 86_400_000)
+        response = await client.post("/api/metrics/rollups/rebuild")
+
+    assert result["purged_raw"] == 16
+    assert response.json()["data"]["rows"] == 14
+    assert await rollup_snapshot() == incremental
+    metrics, _ = await rollup_snapshot()
+    assert metrics[("1d", parse_timestamp_ms("2023-10-01T00:00:00Z"), "cpu_usage")][0] == 30
+
+
+@pytest.mark.asyncio
+async def test_history_picks_resolution_from_point_budget(valid_metrics_data):
+    batch = [point(valid_metrics_data, minute, second, minute) for minute in range(30) for second in (0, 30)]
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        await client.post("/api/ingest", json=batch)
+
+        params = {"start_time": "2023-10-01T12:00:00Z", "end_time": "2023-10-01T12:29:59Z"}
+        raw = (await client.get("/api/history", params=dict(params, limit=100))).json()
+        minutes = (await client.get("/api/history", params=dict(params, limit=40))).json()
+        hours = (await client.get("/api/history", params=dict(params, limit=10))).json()
+        explicit = (await client.get("/api/history", params={"resolution": "1h"})).json()
+
+    assert raw["resolution"] == "raw"
+    assert raw["total_retrieved"] == 60
+    assert minutes["resolution"] == "1m"
+    assert minutes["total_retrieved"] == 30
+    latest = minutes["data"][0]
+    assert latest["timestamp"] == "2023-10-01T12:29:00Z"
+    assert latest["count"] == 2
+    assert latest["cpu_usage"] == {"min": 29.0, "max": 29.0, "avg": 29.0, "last": 29.0}
+    assert latest["service_status"]["database"] == {"online": 2}
+    assert hours["resolution"] == "1h"
+    assert explicit["data"][0]["count"] == 60
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from httpx import AsyncClient, ASGITransport
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from main import app
+from db import engine, read_engine, WAL_ENABLED
+from services.wal_checkpoint import WalCheckpointer
+
+pytestmark = pytest.mark.skipif(not WAL_ENABLED, reason="SQLITE_PROFILE is not wal")
+
+
+@pytest.mark.asyncio
+async def test_writer_uses_wal_and_tuned_pragmas():
+    async with engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+        assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1
+        assert (await conn.execute(text("PRAGMA cache_size"))).scalar() < 0
+
+
+@pytest.mark.asyncio
+async def test_read_pool_is_read_only():
+    async with read_engine.connect() as conn:
+        assert (await conn.execute(text("PRAGMA query_only"))).scalar() == 1
+        with pytest.raises(OperationalError):
+            await conn.execute(text("DELETE FROM users"))
+
+
+@pytest.mark.asyncio
+async def test_reads_are_not_blocked_by_open_write_transaction():
+    async with engine.connect() as writer:
+        await writer.execute(text("UPDATE users SET password = 'changed'"))
+
+        async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+            response = await asyncio.wait_for(client.get("/api/history"), timeout=2)
+
+        assert response.status_code == 200
+        await writer.rollback()
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_and_storage_health():
+    async with engine.begin() as conn:
+        await conn.execute(text("UPDATE users SET password = 'changed'"))
+
+    checkpointer = WalCheckpointer(engine, interval=60, truncate_pages=1)
+    result = await checkpointer.checkpoint("TRUNCATE")
+    assert result["busy"] is False
+    assert checkpointer.get_stats()["truncates"] == 1
+
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.get("/api/health/storage")
+
+    assert response.status_code == 200
+    assert response.json()["data"]["wal"] is True
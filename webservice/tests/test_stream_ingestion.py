@@ -0,0 +1,71 @@
+import json
+import pytest
+from httpx import AsyncClient, ASGITransport
+from main import app
+from db import engine
+from models.sql import Metrics
+from services.stream_ingestion import iter_ndjson_lines, LineTooLong
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import func
+import api.metrics
+
+
+async def byte_chunks(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+@pytest.mark.asyncio
+async def test_iter_ndjson_lines_across_chunk_boundaries():
+    body = b'{"a": 1}\n\n{"b": 2}\n{"c": 3}'
+    lines = [item async for item in iter_ndjson_lines(byte_chunks(body, 3))]
+    assert lines == [(1, b'{"a": 1}'), (3, b'{"b": 2}'), (4, b'{"c": 3}')]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [4, 64])
+async def test_iter_ndjson_lines_limits_every_line(chunk_size):
+    body = b'{"a": 1}\n{"long": "' + b"x" * 20 + b'"}\n{"b": 2}\n'
+    lines = []
+    with pytest.raises(LineTooLong, match="Line 2"):
+        async for item in iter_ndjson_lines(byte_chunks(body, chunk_size), max_line_bytes=16):
+            lines.append(item)
+    assert lines == [(1, b'{"a": 1}')]
+
+
+@pytest.mark.asyncio
+async def test_ndjson_ingestion_streams_chunk_results(valid_metrics_data, monkeypatch):
+    monkeypatch.setattr(api.metrics.stream_ingestion_service, "chunk_size", 10)
+
+    invalid_metrics_data = valid_metrics_data.copy()
+    invalid_metrics_data["cpu_usage"] = "bad"
+    lines = [json.dumps(valid_metrics_data) for _ in range(25)]
+    lines[3] = json.dumps(invalid_metrics_data)
+    lines[17] = "{not json"
+    body = ("\n".join(lines) + "\n").encode()
+
+    async with AsyncClient(base_url="http://test", transport=ASGITransport(app)) as client:
+        response = await client.post(
+            "/api/ingest",
+            content=body,
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    results = [json.loads(line) for line in response.text.splitlines()]
+    chunks, summary = results[:-1], results[-1]
+
+    assert [chunk["stored"] for chunk in chunks] == [9, 9, 5]
+    assert chunks[0]["errors"][0]["line"] == 4
+    assert chunks[0]["errors"][0]["errors"][0]["field"] == "cpu_usage"
+    assert chunks[1]["errors"][0]["line"] == 18
+    assert summary["status"] == "success"
+    assert summary["stored"] == 23
+    assert summary["failed"] == 2
+    assert summary["chunks"] == 3
+
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(func.count(Metrics.id)))
+        assert result.scalar() == 23
@@ -137,4 +137,123 @@ def test_validate_metrics_error_rate_out_of_range(validation_service, valid_metr
     
     assert result.is_valid is False
     assert len(result.errors) == 1
-    assert result.errors[0].field == "error_rate" 
\ No newline at end of file
+    assert result.errors[0].field == "error_rate" 
+
+def test_validate_metrics_json_valid(validation_service, valid_metrics_data):
+    import json
+    result = validation_service.validate_metrics_json(json.dumps(valid_metrics_data).encode())
+    
+    assert result.is_valid is True
+    assert result.data["service_status"]["api_gateway"] == "degraded"
+    assert result.data == validation_service.validate_metrics(valid_metrics_data).data
+
+
+def test_validate_metrics_json_invalid_json(validation_service):
+    result = validation_service.validate_metrics_json(b'{"cpu_usage": 85')
+    
+    assert result.is_valid is False
+    assert len(result.errors) == 1
+    assert result.errors[0].field == "root"
+
+
+def test_validate_metrics_strictly_positive_field(validation_service, valid_metrics_data):
+    valid_metrics_data["network_in_kbps"] = 0
+    
+    result = validation_service.validate_metrics(valid_metrics_data)
+    
+    assert result.is_valid is False
+    assert len(result.errors) == 1
+    assert result.errors[0].field == "network_in_kbps"
+    assert result.errors[0].value == 0
+
+
+def test_validate_metrics_rejects_bool_and_float_for_int(validation_service, valid_metrics_data):
+    valid_metrics_data["cpu_usage"] = True
+    valid_metrics_data["memory_usage"] = 70.5
+    
+    result = validation_service.validate_metrics(valid_metrics_data)
+    
+    assert result.is_valid is False
+    assert {error.field for error in result.errors} == {"cpu_usage", "memory_usage"}
+    assert all("type int" in error.message for error in result.errors)
+
+
+
+def test_validate_metrics_batch_matches_row_validation(validation_service, valid_metrics_data):
+    invalid_cases = [
+        {"cpu_usage": 101},
+        {"cpu_usage": True},
+        {"latency_ms": 1.5},
+        {"error_rate": float("nan")},
+        {"timestamp": 12},
+        {"service_status": {"database": "online", "api_gateway": "online"}},
+        {"service_status": ["online"]},
+    ]
+    batch = [dict(valid_metrics_data, error_rate=1, extra="ignored")]
+    for case in invalid_cases:
+        batch.append({**valid_metrics_data, **case})
+        batch.append(valid_metrics_data)
+    batch.append("not a dict")
+
+    valid_metrics, failed_count = validation_service.validate_metrics_batch(batch)
+
+    expected = [validation_service.validate_metrics(row) for row in batch]
+    assert failed_count == sum(1 for result in expected if not result.is_valid) == len(invalid_cases) + 1
+    assert valid_metrics == [result.data for result in expected if result.is_valid]
+    assert "extra" not in valid_metrics[0]
+    assert type(valid_metrics[0]["error_rate"]) is float
+
+
+def test_columnar_batch_matches_row_validation(validation_service, valid_metrics_data):
+    invalid_cases = [
+        {"cpu_usage": 101},
+        {"cpu_usage": True},
+        {"cpu_usage": "85"},
+        {"latency_ms": 1.5},
+        {"error_rate": float("nan")},
+        {"error_rate": 10 ** 400},
+        {"thread_count": [1, 2]},
+        {"timestamp": 12},
+        {"timestamp": "yesterday"},
+        {"service_status": {"database": "online", "api_gateway": "online"}},
+        {"service_status": {"database": "online", "api_gateway": "broken", "cache": "online"}},
+        {"service_status": {"database": ["online"], "api_gateway": "online", "cache": "online"}},
+        {"service_status": ["online"]},
+    ]
+    batch = [dict(valid_metrics_data, error_rate=1, uptime_seconds=10 ** 400, extra="ignored")]
+    for case in invalid_cases:
+        batch.append({**valid_metrics_data, **case})
+        batch.append(dict(valid_metrics_data))
+    batch.append("not a dict")
+    del batch[2]["cpu_usage"]
+
+    mask, errors, valid_rows = validation_service.columnar_validator.validate(batch)
+
+    expected = [validation_service.validate_metrics(row) for row in batch]
+    assert mask.tolist() == [result.is_valid for result in expected]
+    assert errors == {i: result.errors for i, result in enumerate(expected) if not result.is_valid}
+    assert valid_rows == [result.data for result in expected if result.is_valid]
+    assert len(valid_rows) == len(invalid_cases)
+    assert [type(row["error_rate"]) for row in valid_rows] == [float] * len(valid_rows)
+
+
+def test_validate_metrics_batch_uses_columnar_path(validation_service, valid_metrics_data):
+    batch = [dict(valid_metrics_data, cpu_usage=i % 120, error_rate=i % 2, extra="ignored") for i in range(1000)]
+
+    valid_metrics, failed_count = validation_service.validate_metrics_batch(batch)
+
+    assert failed_count == sum(1 for i in range(1000) if i % 120 > 100)
+    assert len(valid_metrics) == 1000 - failed_count
+    assert valid_metrics[:3] == [validation_service.validate_metrics(row).data for row in batch[:3]]
+    assert type(valid_metrics[0]["error_rate"]) is float and "extra" not in valid_metrics[0]
+
+
+def test_validate_metrics_rejects_non_iso_timestamp(validation_service, valid_metrics_data):
+    valid_metrics_data["timestamp"] = "yesterday"
+
+    result = validation_service.validate_metrics(valid_metrics_data)
+
+    assert result.is_valid is False
+    assert result.errors[0].field == "timestamp"
+    assert "ISO 8601" in result.errors[0].message
+    assert validation_service.validate_metrics_batch([valid_metrics_data] * 300) == ([], 300)